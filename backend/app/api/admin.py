@@ -7,7 +7,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.models.user import User
 from app.utils.auth import get_admin_user, hash_password
 
@@ -42,7 +42,7 @@ class UserItem(BaseModel):
 @router.get("/users", response_model=List[UserItem])
 def get_users(
     admin_user: User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """取得所有用戶"""
     users = db.query(User).all()
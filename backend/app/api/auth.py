@@ -6,7 +6,7 @@ from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.models.user import User
 from app.utils.auth import (
     create_access_token,
@@ -74,7 +74,7 @@ class UserResponse(BaseModel):
 
 
 @router.get("/check-init")
-def check_init(db: Session = Depends(get_db)):
+def check_init(db: Session = Depends(get_read_db)):
     """檢查是否已初始化 (是否有 admin 帳戶)"""
     admin = db.query(User).filter(User.role == "admin").first()
     return {"initialized": admin is not None}
@@ -147,7 +147,7 @@ def register(request: RegisterRequest, db: Session = Depends(get_db)):
 @router.post("/login", response_model=TokenResponse)
 def login(
     login_request: LoginRequest,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     _: None = Depends(RateLimitDep(max_requests=10, window_seconds=60)),
 ):
     """登入"""
@@ -196,8 +196,9 @@ def change_password(
             status_code=status.HTTP_400_BAD_REQUEST, detail="新密碼與確認密碼不符"
         )
 
-    # 更新密碼
-    current_user.password_hash = hash_password(request.new_password)
+    # 更新密碼（current_user 來自唯讀 session，改由寫入 session 取得後修改）
+    user = db.get(User, current_user.id)
+    user.password_hash = hash_password(request.new_password)
     db.commit()
 
     return {"message": "密碼已更新"}
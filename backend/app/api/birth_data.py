@@ -7,7 +7,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.models.birth_data import UserBirthData
 from app.models.user import User
 from app.utils.auth import get_current_user
@@ -53,7 +53,7 @@ def create_birth_data(
 
 @router.get("", response_model=List[BirthDataResponse])
 def list_birth_data(
-    db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user)
 ):
     return (
         db.query(UserBirthData)
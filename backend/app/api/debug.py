@@ -9,7 +9,7 @@ from pydantic import BaseModel
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.models.user import User
 from app.utils.auth import get_admin_user
 from app.utils.performance import request_logger
@@ -63,7 +63,7 @@ def get_performance_stats(
 
 @router.get("/database", response_model=DatabaseStats)
 def get_database_stats(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     _: User = Depends(get_admin_user)
 ):
     """取得資料庫統計（僅管理員）"""
@@ -159,6 +159,29 @@ def analyze_database(
         }
 
 
+@router.get("/database/sqlite")
+def get_sqlite_settings(
+    db: Session = Depends(get_db),
+    _: User = Depends(get_admin_user)
+):
+    """取得目前的 SQLite 設定檔與實際生效的 PRAGMA（僅管理員）"""
+    from app.core.config import get_settings
+    from app.core.database import sqlite_profile
+
+    profile = sqlite_profile()
+    names = ["journal_mode", "foreign_keys", *profile["pragmas"]]
+    return {
+        "profile": get_settings().SQLITE_PROFILE,
+        "pool_size": profile["pool_size"],
+        "max_overflow": profile["max_overflow"],
+        "single_writer": profile["single_writer"],
+        "pragmas": {
+            name: db.execute(text(f"PRAGMA {name}")).scalar()
+            for name in dict.fromkeys(names)
+        },
+    }
+
+
 @router.get("/slow-queries")
 def get_slow_queries(
     path: str = None,
@@ -205,3 +228,59 @@ def get_slow_queries(
         "unique_paths": len(path_stats),
         "stats": sorted_stats[:20]  # 前 20 個最慢的路徑
     }
+
+
+@router.get("/ai")
+def get_ai_service_stats(_: User = Depends(get_admin_user)):
+    """取得 AI 服務呼叫狀態：並行限制、排隊等待時間、重試、斷路器、請求合併、對沖、模型路由、prompt 版本、執行中任務（僅管理員）"""
+    from app.services.ai_circuit import ai_circuits
+    from app.services.ai_hedging import hedge_metrics, ttft_tracker
+    from app.services.ai_jobs import job_registry
+    from app.services.ai_limiter import ai_limiters
+    from app.services.ai_retry import retry_metrics
+    from app.services.ai_router import model_router
+    from app.services.ai_singleflight import ai_singleflight
+    from app.services.prompt_registry import prompt_registry
+
+    return {
+        "limiters": ai_limiters.stats(),
+        "retries": retry_metrics.stats(),
+        "circuits": ai_circuits.stats(),
+        "singleflight": ai_singleflight.stats(),
+        "hedging": {**hedge_metrics.stats(), "ttft": ttft_tracker.stats()},
+        "router": model_router.stats(),
+        "prompts": {
+            "versions": prompt_registry.versions(),
+            "reloads": prompt_registry.reloads,
+        },
+        "jobs": job_registry.stats(),
+    }
+
+
+@router.get("/ai/calls")
+def get_ai_call_stats(
+    hours: int = 24,
+    db: Session = Depends(get_read_db),
+    _: User = Depends(get_admin_user)
+):
+    """取得 AI 呼叫紀錄統計：各模型 TTFT / 耗時 p50、p95，各占卜類型 token 用量（僅管理員）"""
+    from app.services.ai_call_log import call_log_stats
+
+    return call_log_stats(db, hours=hours)
+
+
+@router.get("/jobs")
+def get_job_queue_stats(
+    db: Session = Depends(get_read_db),
+    _: User = Depends(get_admin_user)
+):
+    """取得任務佇列狀態：各狀態任務數、最久排隊時間、死信任務、各 worker 行程心跳、准入控制、卡住任務清理（僅管理員）"""
+    from app.services.admission import admission_controller
+    from app.services.job_queue import queue_stats
+    from app.services.job_sweeper import stale_job_sweeper
+
+    return {
+        **queue_stats(db),
+        "admission": admission_controller.stats(),
+        "sweeper": stale_job_sweeper.stats(),
+    }
@@ -6,21 +6,19 @@ import json
 from datetime import datetime, timedelta
 from typing import List, Optional
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from app.core.config import get_settings
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.models.history import History
 from app.models.share_token import ShareToken
 from app.models.user import User
-from app.services.ai_tasks import (
-    process_liuyao_task,
-    process_tarot_task,
-    process_ziwei_task,
-)
+from app.services.admission import check_admission
+from app.services.ai_deadline import new_deadline_at
+from app.services.job_queue import enqueue_job, queue_info, running_job
 from app.utils.auth import get_admin_user, get_current_user, get_current_user_or_guest
 
 router = APIRouter(prefix="/api/history", tags=["歷史紀錄"])
@@ -43,6 +41,11 @@ class HistoryItem(BaseModel):
     ai_provider: Optional[str]
     ai_model: Optional[str]
     status: str
+    mode: Optional[str] = None  # 解盤模式
+    summary: Optional[str] = None  # 漸進式解盤的快速摘要
+    summary_status: Optional[str] = None
+    phase_timings: Optional[dict] = None  # 各階段開始 / 完成時間
+    queue: Optional[dict] = None  # 排隊中：{position, estimated_start_at}
     created_at: datetime
     username: Optional[str] = None  # Admin 查看時顯示
 
@@ -96,6 +99,21 @@ class SharedHistoryItem(BaseModel):
     ai_model: Optional[str]
 
 
+# ========== Helpers ==========
+
+
+def get_phase_timings(history: History) -> Optional[dict]:
+    """漸進式解盤各階段的開始 / 完成時間"""
+    if history.summary_started_at is None and history.interpretation_started_at is None:
+        return None
+    return {
+        "summary_started_at": history.summary_started_at,
+        "summary_completed_at": history.summary_completed_at,
+        "interpretation_started_at": history.interpretation_started_at,
+        "interpretation_completed_at": history.interpretation_completed_at,
+    }
+
+
 # ========== Endpoints ==========
 
 
@@ -106,7 +124,7 @@ def get_history(
     divination_type: Optional[str] = None,
     search: Optional[str] = Query(None, description="搜尋問題內容"),
     current_user: User = Depends(get_current_user_or_guest),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """取得當前用戶的歷史紀錄"""
     if current_user.role == "guest":
@@ -140,6 +158,10 @@ def get_history(
                 ai_provider=item.ai_provider,
                 ai_model=item.ai_model,
                 status=item.status,
+                mode=item.mode,
+                summary=item.summary,
+                summary_status=item.summary_status,
+                phase_timings=get_phase_timings(item),
                 created_at=item.created_at,
             )
             for item in items
@@ -154,7 +176,7 @@ def get_history(
 def get_statistics(
     user_id: Optional[int] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """取得統計資訊
     - 普通用戶：只能查看自己的統計
@@ -256,7 +278,7 @@ def get_all_history(
     divination_type: Optional[str] = None,
     search: Optional[str] = Query(None, description="搜尋問題內容"),
     admin_user: User = Depends(get_admin_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """Admin 取得所有用戶的歷史紀錄"""
     query = db.query(History, User).join(User, History.user_id == User.id)
@@ -289,6 +311,10 @@ def get_all_history(
                 ai_provider=history.ai_provider,
                 ai_model=history.ai_model,
                 status=history.status,
+                mode=history.mode,
+                summary=history.summary,
+                summary_status=history.summary_status,
+                phase_timings=get_phase_timings(history),
                 created_at=history.created_at,
                 username=user.username,
             )
@@ -304,7 +330,7 @@ def get_all_history(
 def get_history_item(
     history_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """取得單筆歷史紀錄"""
     history = (
@@ -327,6 +353,11 @@ def get_history_item(
         ai_provider=history.ai_provider,
         ai_model=history.ai_model,
         status=history.status,
+        mode=history.mode,
+        summary=history.summary,
+        summary_status=history.summary_status,
+        phase_timings=get_phase_timings(history),
+        queue=queue_info(db, history.id) if history.status == "pending" else None,
         created_at=history.created_at,
     )
 
@@ -360,9 +391,9 @@ def delete_history_item(
 @router.post("/{history_id}/retry")
 def retry_ai_interpretation(
     history_id: int,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
+    _: None = Depends(check_admission),
 ):
     """
     重試 AI 解盤
@@ -384,22 +415,26 @@ def retry_ai_interpretation(
             status_code=status.HTTP_400_BAD_REQUEST, detail="目前正在解盤中，請稍候"
         )
 
+    # 取消或逾時後立即重試時，上一個任務可能仍在 worker 上執行（尚未察覺）；
+    # 沿用它會讓重試隨舊任務一起結束，History 停在 pending，因此等它結束後再重試
+    if running_job(db, history.id) is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="上一次解盤仍在結束中，請稍後再試",
+        )
+
     # 重置狀態
     history.status = "pending"
     history.interpretation = None  # 清空舊的錯誤訊息或解盤
-    db.commit()
-
-    # 根據類型分派任務
-    db_url = settings.DATABASE_URL
-    if db_url.startswith("sqlite") and "///" not in db_url:
-        db_url = db_url.replace("sqlite://", "sqlite:///")
-
-    if history.divination_type == "liuyao":
-        background_tasks.add_task(process_liuyao_task, history.id, db_url)
-    elif history.divination_type == "tarot":
-        background_tasks.add_task(process_tarot_task, history.id, db_url)
-    elif history.divination_type == "ziwei":
-        background_tasks.add_task(process_ziwei_task, history.id, db_url)
+    history.deadline_at = new_deadline_at()  # 重新計算任務期限
+    if history.summary_status is not None:
+        history.summary_status = "pending"
+        history.summary = None
+
+    # 根據類型加入任務佇列
+    if history.divination_type in ("liuyao", "tarot", "ziwei"):
+        enqueue_job(db, history)
+        db.commit()
     else:
         # 未知類型，恢復為 error
         history.status = "error"
@@ -528,7 +563,7 @@ def create_share_token(
 
 
 @share_router.get("/{token}", response_model=SharedHistoryItem)
-def get_shared_history(token: str, db: Session = Depends(get_db)):
+def get_shared_history(token: str, db: Session = Depends(get_read_db)):
     """取得分享的歷史紀錄（公開存取，不需登入）"""
     # 查詢 token
     share_token = db.query(ShareToken).filter(ShareToken.token == token).first()
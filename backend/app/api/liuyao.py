@@ -5,15 +5,20 @@
 import json
 from typing import Optional
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.core.config import get_settings
-from app.core.database import get_db
+from app.core.database import get_async_db, get_db
 from app.models.history import History
 from app.models.user import User
-from app.services.ai_tasks import process_liuyao_task
+from app.services.admission import check_admission
+from app.services.ai_deadline import new_deadline_at
+from app.services.ai_jobs import job_registry
+from app.services.idempotency import IdempotentRequest, idempotency
+from app.services.job_queue import enqueue_job
 from app.services.liuyao import perform_divination
 from app.utils.auth import get_current_user, get_current_user_or_guest
 
@@ -35,6 +40,14 @@ class LiuYaoRequest(BaseModel):
     use_default_ai: bool = Field(
         default=False, description="使用者明確選擇使用預設 AI 服務"
     )
+    mode: Optional[str] = Field(
+        default=None,
+        pattern="^(fast|standard|deep)$",
+        description="解盤模式 'fast'（快速）| 'standard' | 'deep'（深度）；未指定時使用各服務原本的參數",
+    )
+    progressive: bool = Field(
+        default=False, description="先產生快速摘要，再產生完整解讀"
+    )
 
 
 class DivinationResponse(BaseModel):
@@ -55,16 +68,22 @@ class DivinationResponse(BaseModel):
 async def create_liuyao_divination(
     liuyao_request: LiuYaoRequest,
     request: Request,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user_or_guest),
-    db: Session = Depends(get_db),
+    idem: IdempotentRequest = Depends(idempotency("liuyao")),
+    _: None = Depends(check_admission),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """六爻占卜"""
+    """六爻占卜（可帶 Idempotency-Key 標頭，重送時回傳第一次的結果）"""
+    if idem.replay is not None:
+        return idem.replay
+
     try:
         if current_user.role == "guest":
             from app.utils.security import check_guest_daily_limit
 
-            allowed, today_count = check_guest_daily_limit(request, db)
+            allowed, today_count = await db.run_sync(
+                lambda session: check_guest_daily_limit(request, session)
+            )
             if not allowed:
                 raise HTTPException(
                     status_code=status.HTTP_429_TOO_MANY_REQUESTS,
@@ -82,22 +101,24 @@ async def create_liuyao_divination(
             chart_data=json.dumps(result, ensure_ascii=False),
             status="pending",
             ai_provider="default" if liuyao_request.use_default_ai else None,
+            mode=liuyao_request.mode,
+            summary_status="pending" if liuyao_request.progressive else None,
+            deadline_at=new_deadline_at(),
         )
         db.add(history)
-        db.commit()
-        db.refresh(history)
+        await db.run_sync(enqueue_job, history)
 
-        background_tasks.add_task(
-            process_liuyao_task, history.id, settings.DATABASE_URL
-        )
-
-        return DivinationResponse(
+        response = DivinationResponse(
             id=history.id,
             status="pending",
             coins=result["yaogua"],
             chart_data=result,
             message="占卜已開始，AI 正在解盤中...",
         )
+        idem.save(db, response, history.id)
+        await db.commit()
+
+        return response
     except HTTPException:
         raise
     except Exception as e:
@@ -133,5 +154,7 @@ def cancel_divination(
 
     history.status = "cancelled"
     db.commit()
+    # 停止進行中的 AI 呼叫
+    job_registry.cancel(history_id)
 
     return {"message": "已取消"}
@@ -8,7 +8,7 @@ from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.models.settings import AIConfig
 from app.models.user import User
 from app.services.ai import CustomAIService
@@ -51,6 +51,39 @@ class AIConfigResponse(BaseModel):
     is_active: bool
 
 
+class FailoverPolicyRequest(BaseModel):
+    """AI 容錯策略請求"""
+
+    policy: str = Field(
+        "fallback",
+        pattern="^(fallback|fail_fast)$",
+        description="'fallback'（切換備援）| 'fail_fast'（直接失敗）",
+    )
+    fallback_config_id: Optional[int] = Field(
+        None, description="備援 AI 設定 ID（未指定則使用預設 AI 服務）"
+    )
+
+
+class FailoverPolicyResponse(BaseModel):
+    """AI 容錯策略回應"""
+
+    policy: str
+    fallback_config_id: Optional[int]
+
+
+class HedgingRequest(BaseModel):
+    """AI 對沖請求設定"""
+
+    enabled: bool
+
+
+class HedgingResponse(BaseModel):
+    """AI 對沖請求設定回應"""
+
+    enabled: bool
+    fallback_config_id: Optional[int]
+
+
 class TestConnectionRequest(BaseModel):
     """測試連線請求"""
 
@@ -71,7 +104,7 @@ class TestConnectionResponse(BaseModel):
 @router.get("/ai", response_model=List[AIConfigResponse])
 def get_ai_configs(
     current_user: User = Depends(get_current_user_or_guest),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """取得用戶的 AI 設定"""
     if current_user.role == "guest":
@@ -293,6 +326,74 @@ def delete_ai_config(
     return {"message": "已刪除"}
 
 
+@router.get("/failover", response_model=FailoverPolicyResponse)
+def get_failover_policy(current_user: User = Depends(get_current_user)):
+    """取得 AI 服務斷路時的容錯策略"""
+    return FailoverPolicyResponse(
+        policy=current_user.ai_failover_policy or "fallback",
+        fallback_config_id=current_user.ai_fallback_config_id,
+    )
+
+
+@router.put("/failover", response_model=FailoverPolicyResponse)
+def update_failover_policy(
+    request: FailoverPolicyRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """更新 AI 服務斷路時的容錯策略"""
+    if request.fallback_config_id is not None:
+        config = (
+            db.query(AIConfig)
+            .filter(
+                AIConfig.id == request.fallback_config_id,
+                AIConfig.user_id == current_user.id,
+            )
+            .first()
+        )
+        if not config:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="備援設定不存在"
+            )
+
+    # current_user 來自唯讀 session，改由寫入 session 取得後修改
+    user = db.get(User, current_user.id)
+    user.ai_failover_policy = request.policy
+    user.ai_fallback_config_id = request.fallback_config_id
+    db.commit()
+
+    return FailoverPolicyResponse(
+        policy=user.ai_failover_policy,
+        fallback_config_id=user.ai_fallback_config_id,
+    )
+
+
+@router.get("/hedging", response_model=HedgingResponse)
+def get_hedging(current_user: User = Depends(get_current_user)):
+    """取得 AI 對沖請求設定（備援服務與容錯策略共用）"""
+    return HedgingResponse(
+        enabled=bool(current_user.ai_hedging_enabled),
+        fallback_config_id=current_user.ai_fallback_config_id,
+    )
+
+
+@router.put("/hedging", response_model=HedgingResponse)
+def update_hedging(
+    request: HedgingRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """啟用或停用 AI 對沖請求"""
+    user = db.get(User, current_user.id)
+    user.ai_hedging_enabled = request.enabled
+    db.commit()
+
+    return HedgingResponse(
+        enabled=bool(user.ai_hedging_enabled),
+        fallback_config_id=user.ai_fallback_config_id,
+    )
+
+
 @router.post("/ai/test", response_model=TestConnectionResponse)
 async def test_ai_connection(
     request: Request,
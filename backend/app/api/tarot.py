@@ -3,16 +3,21 @@
 """
 
 import json
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import get_settings
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.models.history import History
-from app.services.ai_tasks import process_tarot_task
+from app.services.admission import check_admission
+from app.services.ai_deadline import new_deadline_at
+from app.services.ai_jobs import job_registry
+from app.services.idempotency import IdempotentRequest, idempotency
+from app.services.job_queue import enqueue_job
 from app.utils.auth import get_current_user, get_current_user_or_guest
 
 router = APIRouter(prefix="/api/tarot", tags=["塔羅"])
@@ -42,6 +47,14 @@ class TarotRequest(BaseModel):
     use_default_ai: bool = Field(
         default=False, description="使用者明確選擇使用預設 AI 服務"
     )
+    mode: Optional[str] = Field(
+        default=None,
+        pattern="^(fast|standard|deep)$",
+        description="解盤模式 'fast'（快速）| 'standard' | 'deep'（深度）；未指定時使用各服務原本的參數",
+    )
+    progressive: bool = Field(
+        default=False, description="先產生快速摘要，再產生完整解讀"
+    )
 
 
 class TarotResponse(BaseModel):
@@ -59,16 +72,21 @@ class TarotResponse(BaseModel):
 async def create_tarot_divination(
     tarot_request: TarotRequest,
     http_request: Request,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user_or_guest),
+    idem: IdempotentRequest = Depends(idempotency("tarot")),
+    _: None = Depends(check_admission),
 ):
-    """建立塔羅占卜"""
+    """建立塔羅占卜（可帶 Idempotency-Key 標頭，重送時回傳第一次的結果）"""
+    if idem.replay is not None:
+        return idem.replay
 
     if current_user.role == "guest":
         from app.utils.security import check_guest_daily_limit
 
-        allowed, today_count = check_guest_daily_limit(http_request, db)
+        allowed, today_count = await db.run_sync(
+            lambda session: check_guest_daily_limit(http_request, session)
+        )
         if not allowed:
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
@@ -94,35 +112,34 @@ async def create_tarot_divination(
         chart_data=json.dumps(chart_data, ensure_ascii=False),
         status="pending",
         ai_provider="default" if tarot_request.use_default_ai else None,
+        mode=tarot_request.mode,
+        summary_status="pending" if tarot_request.progressive else None,
+        deadline_at=new_deadline_at(),
     )
 
     db.add(history)
-    db.commit()
-    db.refresh(history)
-
-    db_url = settings.DATABASE_URL
-    if db_url.startswith("sqlite"):
-        if "///" not in db_url:
-            db_url = db_url.replace("sqlite://", "sqlite:///")
+    await db.run_sync(enqueue_job, history)
 
-    background_tasks.add_task(process_tarot_task, history.id, db_url)
-
-    return TarotResponse(
+    response = TarotResponse(
         id=history.id, status="pending", message="塔羅占卜已建立，正在進行 AI 解盤..."
     )
+    idem.save(db, response, history.id)
+    await db.commit()
+
+    return response
 
 
 @router.post("/{history_id}/cancel")
 async def cancel_tarot_divination(
     history_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user),
 ):
     """取消塔羅占卜"""
-    history = (
-        db.query(History)
-        .filter(History.id == history_id, History.user_id == current_user.id)
-        .first()
+    history = await db.scalar(
+        select(History).where(
+            History.id == history_id, History.user_id == current_user.id
+        )
     )
 
     if not history:
@@ -134,6 +151,8 @@ async def cancel_tarot_divination(
         )
 
     history.status = "cancelled"
-    db.commit()
+    await db.commit()
+    # 停止進行中的 AI 呼叫
+    job_registry.cancel(history_id)
 
     return {"message": "已取消"}
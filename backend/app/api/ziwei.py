@@ -4,15 +4,20 @@ import json
 from datetime import datetime
 from typing import Optional
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.core.config import get_settings
-from app.core.database import get_db
+from app.core.database import get_async_db, get_db
 from app.models.history import History
 from app.models.user import User
-from app.services.ai_tasks import process_ziwei_task
+from app.services.admission import check_admission
+from app.services.ai_deadline import new_deadline_at
+from app.services.ai_jobs import job_registry
+from app.services.idempotency import IdempotentRequest, idempotency
+from app.services.job_queue import enqueue_job
 from app.utils.auth import get_current_user, get_current_user_or_guest
 
 router = APIRouter(prefix="/api/ziwei", tags=["紫微斗數"], redirect_slashes=False)
@@ -37,6 +42,14 @@ class ZiweiDivinationRequest(BaseModel):
     use_default_ai: bool = Field(
         default=False, description="使用者明確選擇使用預設 AI 服務"
     )
+    mode: Optional[str] = Field(
+        default=None,
+        pattern="^(fast|standard|deep)$",
+        description="解盤模式 'fast'（快速）| 'standard' | 'deep'（深度）；未指定時使用各服務原本的參數",
+    )
+    progressive: bool = Field(
+        default=False, description="先產生快速摘要，再產生完整解讀"
+    )
 
 
 class DivinationResponse(BaseModel):
@@ -49,14 +62,21 @@ class DivinationResponse(BaseModel):
 async def create_divination(
     data: ZiweiDivinationRequest,
     http_request: Request,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user_or_guest),
+    idem: IdempotentRequest = Depends(idempotency("ziwei")),
+    _: None = Depends(check_admission),
 ):
+    """建立紫微斗數占卜（可帶 Idempotency-Key 標頭，重送時回傳第一次的結果）"""
+    if idem.replay is not None:
+        return idem.replay
+
     if current_user.role == "guest":
         from app.utils.security import check_guest_daily_limit
 
-        allowed, today_count = check_guest_daily_limit(http_request, db)
+        allowed, today_count = await db.run_sync(
+            lambda session: check_guest_daily_limit(http_request, session)
+        )
         if not allowed:
             raise HTTPException(
                 status_code=429,
@@ -83,20 +103,22 @@ async def create_divination(
             chart_data=json.dumps(final_chart_data, ensure_ascii=False),
             status="pending",
             ai_provider="default" if data.use_default_ai else None,
+            mode=data.mode,
+            summary_status="pending" if data.progressive else None,
+            deadline_at=new_deadline_at(),
         )
         db.add(history)
-        db.commit()
-        db.refresh(history)
-
-        background_tasks.add_task(
-            process_ziwei_task, history.id, str(settings.DATABASE_URL)
-        )
+        await db.run_sync(enqueue_job, history)
 
-        return {
+        response = {
             "id": history.id,
             "status": "pending",
             "message": "占卜建立成功，AI 解讀中...",
         }
+        idem.save(db, response, history.id)
+        await db.commit()
+
+        return response
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"占卜建立失敗：{str(e)}")
@@ -123,5 +145,7 @@ def cancel_divination(
     history.status = "cancelled"
     history.interpretation = "用戶取消"
     db.commit()
+    # 停止進行中的 AI 呼叫
+    job_registry.cancel(history_id)
 
     return {"status": "success", "message": "已取消占卜"}
@@ -21,6 +21,10 @@ class Settings(BaseSettings):
 
     # 資料庫
     DATABASE_URL: str = f"sqlite:///{BASE_DIR}/divination.db"
+    # SQLite 設定檔：'balanced'（WAL，預設）| 'durable'（每次提交都 fsync）| 'legacy'（改版前的預設值）
+    SQLITE_PROFILE: str = "balanced"
+    # 覆寫設定檔中的個別 PRAGMA，例如 {"cache_size": -65536}
+    SQLITE_PRAGMAS: dict[str, str | int] = {}
 
     # JWT 設定
     SECRET_KEY: str = ""
@@ -33,6 +37,101 @@ class Settings(BaseSettings):
     # 訪客模式 AI 服務
     OPENCODE_API_KEY: str = ""
 
+    # AI 服務並行限制（每個 provider + base_url 各自計算）
+    AI_LIMITER_MAX_CONCURRENCY: int = 4
+    AI_LIMITER_RATE_PER_SECOND: float = 1.0
+    AI_LIMITER_BURST: int = 4
+    # 個別 provider 覆寫，例如 {"opencode": {"max_concurrency": 8}}
+    AI_LIMITER_OVERRIDES: dict[str, dict] = {}
+
+    # AI 解盤任務期限（建立紀錄起算，含排隊、重試與串流讀取）
+    AI_JOB_TIMEOUT_SECONDS: float = 300.0
+    # 單次 AI 呼叫的逾時上限（仍受任務剩餘時間限制）
+    AI_REQUEST_TIMEOUT_SECONDS: float = 300.0
+
+    # AI 解盤任務佇列（jobs 表；worker 以租約領取，租約逾期未續即由其他 worker 重新執行）
+    JOB_WORKER_CONCURRENCY: int = 4
+    JOB_POLL_INTERVAL: float = 1.0  # 沒有任務時的輪詢間隔（秒）
+    JOB_LEASE_SECONDS: float = 60.0  # 租約長度，執行期間每 1/3 租約續約一次
+    # 超過即移入 dead（死信）。重試會疊加：每次任務嘗試內的 AI 呼叫另有 AI_RETRY_MAX_ATTEMPTS 次，
+    # 同一次解讀最多約 JOB_MAX_ATTEMPTS × AI_RETRY_MAX_ATTEMPTS 次 provider 呼叫（預設 12）；
+    # 所有嘗試共用建立時的任務期限 (History.deadline_at)，總時間仍以 AI_JOB_TIMEOUT_SECONDS 為上限
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_DELAY_SECONDS: float = 10.0  # 任務失敗後延後重試（乘以已嘗試次數）
+    # 依使用者加權公平排隊（權重越高越快輪到），並限制每位使用者同時執行的任務數
+    JOB_PRIORITY_WEIGHTS: dict[str, float] = {"admin": 4.0, "user": 2.0, "guest": 1.0}
+    JOB_MAX_RUNNING_PER_USER: int = 2
+    JOB_ESTIMATED_DURATION_SECONDS: float = 30.0  # 尚無完成紀錄時估計排隊時間用
+    # False：API 只負責加入佇列，AI 任務由獨立的 `python -m app.worker` 行程執行
+    JOB_EMBEDDED_WORKERS: bool = True
+    JOB_HEARTBEAT_INTERVAL: float = 10.0  # worker 心跳回報間隔（秒）
+    JOB_CANCEL_CHECK_INTERVAL: float = 2.0  # 執行中檢查紀錄是否已取消的間隔（秒）
+    # 停機時等待執行中任務完成的秒數（應小於 JOB_LEASE_SECONDS）。只是盡力而為：AI 呼叫
+    # 可能長達 AI_JOB_TIMEOUT_SECONDS，逾時未完成的任務中止後交還佇列，由下一個 worker
+    # 從頭重新執行完整解讀（已完成的快速摘要保留）；需要完整排空時調高至 AI_JOB_TIMEOUT_SECONDS
+    JOB_SHUTDOWN_DRAIN_SECONDS: float = 20.0
+    # 卡住任務的清理（啟動時與每隔 SWEEPER_INTERVAL_SECONDS 秒執行一次）
+    SWEEPER_INTERVAL_SECONDS: float = 60.0
+    SWEEPER_STALE_SECONDS: float = (
+        120.0  # 超過此秒數未更新、也沒有 worker 執行中即視為卡住
+    )
+    SWEEPER_BATCH_SIZE: int = 100
+
+    # 建立占卜前的准入控制：佇列過長、預估等待過久或 AI 限制器排隊過多時回 503 + Retry-After
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_QUEUE_DEPTH: int = 200  # 排隊中的任務數上限
+    ADMISSION_MAX_LIMITER_PRESSURE: float = 4.0  # AI 限制器等待數 / 同時進行上限
+    # 各等級可使用的負載比例（預估等待上限為 AI_JOB_TIMEOUT_SECONDS × 比例）；比例越低越早被拒絕
+    ADMISSION_CLASS_SHARE: dict[str, float] = {"guest": 0.25, "user": 0.6, "admin": 1.0}
+    ADMISSION_CACHE_SECONDS: float = 1.0  # 負載快照的快取秒數
+
+    # 建立占卜的 Idempotency-Key（重送相同請求時回傳第一次的結果）
+    IDEMPOTENCY_TTL_SECONDS: int = 3600
+    IDEMPOTENCY_LOCK_SECONDS: float = (
+        60.0  # 處理中的鍵超過此秒數視為請求已中斷，可重新處理
+    )
+
+    # AI 呼叫重試策略（所有 provider 共用；在一次任務嘗試之內，與 JOB_MAX_ATTEMPTS 相乘）
+    AI_RETRY_MAX_ATTEMPTS: int = 4
+    AI_RETRY_BASE_DELAY: float = 1.0
+    AI_RETRY_MAX_DELAY: float = 30.0
+    AI_RETRY_BUDGET_SECONDS: float = 120.0
+
+    # AI 服務斷路器（時間窗內失敗率過高即快速失敗）
+    AI_CIRCUIT_FAILURE_RATE: float = 0.5
+    AI_CIRCUIT_WINDOW_SECONDS: float = 60.0
+    AI_CIRCUIT_MIN_CALLS: int = 4
+    AI_CIRCUIT_OPEN_SECONDS: float = 30.0
+
+    # AI 對沖請求（使用者啟用後，首個 token 延遲超過 p95 即同時呼叫備援服務）
+    AI_HEDGE_DEFAULT_DELAY: float = 8.0  # TTFT 樣本不足時使用
+    AI_HEDGE_MIN_DELAY: float = 2.0
+    AI_HEDGE_MAX_DELAY: float = 30.0
+
+    # Prompt 快取：Gemini 明確建立 context cache、OpenAI 帶 prompt_cache_key
+    # （OpenAI / DeepSeek 的自動前綴快取不需開啟，只要 system prompt 保持固定）
+    AI_PROMPT_CACHE_ENABLED: bool = False
+    AI_PROMPT_CACHE_TTL_SECONDS: int = 3600
+
+    # AI 模型路由（依 TTFT / 總延遲 / tokens/sec / 錯誤率在可用配置間選擇）
+    AI_ROUTER_ENABLED: bool = False
+    AI_ROUTER_SLO_SECONDS: float = 20.0  # 首個 token 延遲 p95 目標（串流呼叫）
+    AI_ROUTER_LATENCY_SLO_SECONDS: float = 120.0  # 總延遲 p95 目標（一般非串流呼叫）
+    AI_ROUTER_MAX_ERROR_RATE: float = 0.5
+    AI_ROUTER_WINDOW_SECONDS: float = 600.0
+    # 預設 AI 服務 (opencode) 的模型池，例如 [{"model": "deepseek-v4-flash", "cost": 1.0}]
+    AI_ROUTER_DEFAULT_POOL: list[dict] = []
+
+    # AI 呼叫紀錄（ai_call_log 表，批次非同步寫入）
+    AI_CALL_LOG_ENABLED: bool = True
+    AI_CALL_LOG_BATCH_SIZE: int = 50
+    AI_CALL_LOG_FLUSH_INTERVAL: float = 2.0  # 未滿一批時最久等待秒數
+    AI_CALL_LOG_MAX_PENDING: int = 5000  # 寫入跟不上時的緩衝上限，超過即丟棄
+
+    # 覆寫各 provider 的 API 位址（負載測試時指向 scripts/fake_ai_server.py），
+    # 例如 {"opencode": "http://127.0.0.1:8900/v1", "custom": "http://127.0.0.1:8900"}
+    AI_BASE_URL_OVERRIDES: dict[str, str] = {}
+
     # CORS 設定
     ALLOWED_ORIGINS: list[str] = ["http://localhost:3000", "http://127.0.0.1:3000"]
 
@@ -1,31 +1,260 @@
 """
 資料庫配置與初始化
+
+同步 Session（get_db）供一般路由（FastAPI 在 thread pool 執行）與佇列操作使用；
+async 路由與背景 AI 任務使用 AsyncSession（get_async_db，aiosqlite），查詢不阻塞 event loop。
+純讀取的路由與身分驗證使用唯讀 Session（get_read_db，mode=ro 連線），不佔用寫入連線。
+
+WAL 設定檔的寫入連線池各只有一條連線：同步引擎（get_db、任務佇列、卡住任務清理、AI 呼叫紀錄）
+與 async 引擎（建立占卜、背景 AI 任務）各一條，因此同時最多兩個寫入者。兩者之間的寫入鎖
+由 busy_timeout 等待；在連線池排隊等待寫入連線的上限也等於 busy_timeout，寫入交易須保持簡短
+（不在交易中呼叫 AI 或外部服務），一筆慢交易最多讓其他寫入等待這段時間後回報錯誤。
+
+每個連線建立時套用 SQLITE_PROFILE 設定檔的 PRAGMA（預設 WAL，讀取不被寫入阻擋，
+等待寫入鎖而不是立即回報 database is locked）。
+WAL 在累積約 wal_autocheckpoint 頁後自動 checkpoint，關閉時再以 TRUNCATE 清空 WAL 檔。
 """
 
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
+
 from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 
 from .config import get_settings
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
-# 建立引擎
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False},  # SQLite 需要
-)
+# SQLite 設定檔：連線建立時依序套用的 PRAGMA 與連線池大小
+# single_writer：寫入引擎只保留一條連線（寫入依序排隊），讀取改走唯讀引擎（pool_size 為唯讀連線池大小）
+SQLITE_PROFILES: dict[str, dict] = {
+    # 改版前的行為：rollback journal（寫入期間阻擋讀取）、預設快取、讀寫共用連線池
+    "legacy": {
+        "pragmas": {},
+        "pool_size": 5,
+        "max_overflow": 10,
+        "single_writer": False,
+    },
+    # WAL + synchronous=NORMAL：不會損毀資料庫，斷電時可能遺失最後幾筆已提交的交易
+    "balanced": {
+        "pragmas": {
+            "busy_timeout": 5000,  # 毫秒；須在切換 journal_mode 之前設定
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": -16000,  # 負數單位為 KiB，約 16 MB
+            "mmap_size": 128 * 1024 * 1024,
+            "temp_store": "MEMORY",
+            "wal_autocheckpoint": 1000,  # 頁，約 4 MB
+            "journal_size_limit": 64 * 1024 * 1024,  # checkpoint 後 WAL 檔保留的上限
+        },
+        "pool_size": 10,
+        "max_overflow": 20,
+        "single_writer": True,
+    },
+    # WAL + synchronous=FULL：每次提交都 fsync，寫入較慢
+    "durable": {
+        "pragmas": {
+            "busy_timeout": 5000,
+            "journal_mode": "WAL",
+            "synchronous": "FULL",
+            "cache_size": -16000,
+            "temp_store": "MEMORY",
+            "wal_autocheckpoint": 1000,
+            "journal_size_limit": 64 * 1024 * 1024,
+        },
+        "pool_size": 10,
+        "max_overflow": 20,
+        "single_writer": True,
+    },
+}
+
+# 唯讀連線不套用的 PRAGMA（需要寫入資料庫檔或 WAL 檔）
+_WRITER_ONLY_PRAGMAS = {"journal_mode", "wal_autocheckpoint", "journal_size_limit"}
 
 
-# 啟用外鍵約束 (SQLite)
-@event.listens_for(engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
+def sqlite_profile(name: Optional[str] = None) -> dict:
+    """取得設定檔（PRAGMA 已合併 SQLITE_PRAGMAS 的覆寫）"""
+    name = name or settings.SQLITE_PROFILE
+    if name not in SQLITE_PROFILES:
+        raise ValueError(
+            f"未知的 SQLITE_PROFILE: {name}（可用：{', '.join(SQLITE_PROFILES)}）"
+        )
+    profile = SQLITE_PROFILES[name]
+    return {**profile, "pragmas": {**profile["pragmas"], **settings.SQLITE_PRAGMAS}}
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas: dict):
+    """啟用外鍵約束並套用設定檔的 PRAGMA"""
     cursor = dbapi_connection.cursor()
     cursor.execute("PRAGMA foreign_keys=ON")
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
     cursor.close()
 
 
+def _is_memory_database(db_url: str) -> bool:
+    return ":memory:" in db_url or db_url.rstrip("/").endswith(":")
+
+
+def _pool_options(
+    db_url: str, profile: dict, is_async: bool = False, writer: bool = True
+) -> dict:
+    """記憶體資料庫共用單一連線；檔案資料庫使用依設定檔大小的連線池
+
+    single_writer 設定檔的寫入引擎只有一條連線：同一引擎的寫入在連線池排隊，
+    等待上限與 busy_timeout 相同（與多條連線等待寫入鎖時的行為一致）
+    """
+    if not db_url.startswith("sqlite"):
+        return {}
+    if _is_memory_database(db_url):
+        return {"poolclass": StaticPool}
+    options = {
+        "poolclass": AsyncAdaptedQueuePool if is_async else QueuePool,
+        "pool_size": profile["pool_size"],
+        "max_overflow": profile["max_overflow"],
+    }
+    if writer and profile["single_writer"]:
+        options.update(
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=profile["pragmas"].get("busy_timeout", 30000) / 1000,
+        )
+    return options
+
+
+def _listen_pragmas(bind: Engine, pragmas: dict):
+    @event.listens_for(bind, "connect")
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+
+def create_db_engine(db_url: str, profile_name: Optional[str] = None) -> Engine:
+    """建立同步引擎（套用 SQLite 設定檔）"""
+    profile = sqlite_profile(profile_name)
+    bind = create_engine(
+        db_url,
+        connect_args={"check_same_thread": False},  # SQLite 需要
+        **_pool_options(db_url, profile),
+    )
+    _listen_pragmas(bind, profile["pragmas"])
+    return bind
+
+
+def read_only_url(db_url: str) -> Optional[str]:
+    """檔案資料庫的唯讀 URI（file:...?mode=ro）；記憶體資料庫或非 SQLite 回傳 None"""
+    prefix = "sqlite:///"
+    if not db_url.startswith(prefix) or _is_memory_database(db_url):
+        return None
+    path = quote(db_url[len(prefix) :], safe="/:\\")
+    return f"sqlite:///file:{path}?mode=ro&uri=true"
+
+
+def create_read_engine(
+    db_url: str, profile_name: Optional[str] = None
+) -> Optional[Engine]:
+    """
+    建立唯讀引擎（以 mode=ro 開啟檔案並設定 query_only，WAL 模式下讀取不等待寫入）
+
+    legacy 設定檔或記憶體資料庫回傳 None，讀取沿用寫入引擎
+    """
+    profile = sqlite_profile(profile_name)
+    url = read_only_url(db_url)
+    if url is None or not profile["single_writer"]:
+        return None
+
+    bind = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        **_pool_options(db_url, profile, writer=False),
+    )
+    pragmas = {
+        name: value
+        for name, value in profile["pragmas"].items()
+        if name not in _WRITER_ONLY_PRAGMAS
+    }
+    _listen_pragmas(bind, {**pragmas, "query_only": "ON"})
+    return bind
+
+
+# 建立引擎
+engine = create_db_engine(settings.DATABASE_URL)
+read_engine = create_read_engine(settings.DATABASE_URL) or engine
+
 # Session 工廠
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+def checkpoint_wal(bind: Optional[Engine] = None, mode: str = "TRUNCATE") -> tuple:
+    """將 WAL 內容寫回資料庫檔（TRUNCATE 同時清空 WAL 檔）
+
+    Returns:
+        (是否因忙碌未完成, WAL 頁數, 已寫回頁數)；非 WAL 模式時後兩者為 -1
+    """
+    with (bind or engine).connect() as connection:
+        return tuple(connection.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})").one())
+
+
+def async_database_url(db_url: str) -> str:
+    """同步資料庫 URL 轉為 async driver（sqlite:// → sqlite+aiosqlite://）"""
+    if db_url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + db_url[len("sqlite:") :]
+    return db_url
+
+
+def create_async_db_engine(
+    db_url: str, profile_name: Optional[str] = None
+) -> AsyncEngine:
+    """建立 async 引擎（套用與同步引擎相同的 SQLite 設定檔）"""
+    profile = sqlite_profile(profile_name)
+    bind = create_async_engine(
+        async_database_url(db_url), **_pool_options(db_url, profile, is_async=True)
+    )
+    _listen_pragmas(bind.sync_engine, profile["pragmas"])
+    return bind
+
+
+def _async_sessionmaker(bind: AsyncEngine) -> async_sessionmaker:
+    # 提交後物件仍可讀取：交易在每次寫入後結束並歸還連線，
+    # 等待 AI 回應的期間不會為了讀取屬性重新取得連線（async session 也不允許隱式載入）
+    return async_sessionmaker(bind, autoflush=False, expire_on_commit=False)
+
+
+# Async 引擎與 Session 工廠
+async_engine = create_async_db_engine(settings.DATABASE_URL)
+AsyncSessionLocal = _async_sessionmaker(async_engine)
+
+# 背景 AI 任務的 session 工廠（依資料庫 URL 快取）
+_job_session_factories: dict[str, async_sessionmaker] = {
+    settings.DATABASE_URL: AsyncSessionLocal
+}
+
+
+def get_job_session_factory(db_url: Optional[str] = None) -> async_sessionmaker:
+    """
+    取得背景 AI 任務的 AsyncSession 工廠
+
+    與 async 路由共用引擎（連線池與 PRAGMA 設定），不再每個任務建立新的引擎；
+    指定其他資料庫時（例如測試）為該 URL 建立一個引擎並重複使用。
+    """
+    db_url = db_url or settings.DATABASE_URL
+    factory = _job_session_factories.get(db_url)
+    if factory is None:
+        factory = _async_sessionmaker(create_async_db_engine(db_url))
+        _job_session_factories[db_url] = factory
+    return factory
+
 
 # 基礎模型類
 Base = declarative_base()
@@ -40,6 +269,21 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    """取得唯讀資料庫 session（純讀取路由與身分驗證的依賴注入用，不佔用寫入連線）"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """取得 async 資料庫 session（async 路由的依賴注入用）"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     """初始化資料庫 (建立所有表)"""
     # 導入所有模型以註冊
@@ -67,12 +311,110 @@ def run_migrations():
             "column": "name",
             "sql": "ALTER TABLE ai_configs ADD COLUMN name VARCHAR(50)",
         },
+        {
+            "table": "users",
+            "column": "ai_failover_policy",
+            "sql": "ALTER TABLE users ADD COLUMN ai_failover_policy VARCHAR(20) DEFAULT 'fallback'",
+        },
+        {
+            "table": "users",
+            "column": "ai_fallback_config_id",
+            "sql": "ALTER TABLE users ADD COLUMN ai_fallback_config_id INTEGER",
+        },
+        {
+            "table": "users",
+            "column": "ai_hedging_enabled",
+            "sql": "ALTER TABLE users ADD COLUMN ai_hedging_enabled BOOLEAN DEFAULT 0",
+        },
+        {
+            "table": "history",
+            "column": "mode",
+            "sql": "ALTER TABLE history ADD COLUMN mode VARCHAR(20)",
+        },
+        {
+            "table": "history",
+            "column": "summary",
+            "sql": "ALTER TABLE history ADD COLUMN summary TEXT",
+        },
+        {
+            "table": "history",
+            "column": "summary_status",
+            "sql": "ALTER TABLE history ADD COLUMN summary_status VARCHAR(20)",
+        },
+        {
+            "table": "history",
+            "column": "summary_started_at",
+            "sql": "ALTER TABLE history ADD COLUMN summary_started_at DATETIME",
+        },
+        {
+            "table": "history",
+            "column": "summary_completed_at",
+            "sql": "ALTER TABLE history ADD COLUMN summary_completed_at DATETIME",
+        },
+        {
+            "table": "history",
+            "column": "interpretation_started_at",
+            "sql": "ALTER TABLE history ADD COLUMN interpretation_started_at DATETIME",
+        },
+        {
+            "table": "history",
+            "column": "interpretation_completed_at",
+            "sql": "ALTER TABLE history ADD COLUMN interpretation_completed_at DATETIME",
+        },
+        {
+            "table": "history",
+            "column": "prompt_tokens",
+            "sql": "ALTER TABLE history ADD COLUMN prompt_tokens INTEGER",
+        },
+        {
+            "table": "history",
+            "column": "cached_tokens",
+            "sql": "ALTER TABLE history ADD COLUMN cached_tokens INTEGER",
+        },
+        {
+            "table": "history",
+            "column": "prompt_version",
+            "sql": "ALTER TABLE history ADD COLUMN prompt_version VARCHAR(255)",
+        },
+        {
+            "table": "history",
+            "column": "deadline_at",
+            "sql": "ALTER TABLE history ADD COLUMN deadline_at DATETIME",
+        },
+        {
+            "table": "jobs",
+            "column": "user_id",
+            "sql": "ALTER TABLE jobs ADD COLUMN user_id INTEGER REFERENCES users(id) ON DELETE SET NULL",
+        },
+        {
+            "table": "jobs",
+            "column": "priority",
+            "sql": "ALTER TABLE jobs ADD COLUMN priority VARCHAR(20)",
+        },
+        {
+            "table": "jobs",
+            "column": "fair_tag",
+            "sql": "ALTER TABLE jobs ADD COLUMN fair_tag FLOAT",
+        },
+        {
+            "table": "jobs",
+            "column": "queue_position",
+            "sql": "ALTER TABLE jobs ADD COLUMN queue_position INTEGER",
+        },
+        {
+            "table": "jobs",
+            "column": "estimated_start_at",
+            "sql": "ALTER TABLE jobs ADD COLUMN estimated_start_at DATETIME",
+        },
     ]
 
     try:
         for migration in migrations:
             cursor.execute(f"PRAGMA table_info({migration['table']})")
             columns = [col[1] for col in cursor.fetchall()]
+            if not columns:
+                # 資料表尚未建立（下方以完整欄位建立）
+                continue
 
             if migration["column"] not in columns:
                 cursor.execute(migration["sql"])
@@ -84,3 +426,33 @@ def run_migrations():
         conn.rollback()
     finally:
         conn.close()
+
+    # 新增的資料表（已存在則略過）
+    from app.models.ai_call_log import AICallLog
+    from app.models.idempotency_key import IdempotencyKey
+    from app.models.job import Job, JobWorker
+
+    AICallLog.__table__.create(bind=engine, checkfirst=True)
+    Job.__table__.create(bind=engine, checkfirst=True)
+    JobWorker.__table__.create(bind=engine, checkfirst=True)
+    IdempotencyKey.__table__.create(bind=engine, checkfirst=True)
+
+    # 新增的索引（已存在則略過）
+    from app.models.history import History
+
+    for index in History.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
+async def close_engines():
+    """關閉時歸還所有連線，並將 WAL 寫回資料庫檔"""
+    await async_engine.dispose()
+    try:
+        busy, _, _ = await asyncio.to_thread(checkpoint_wal)
+        if busy:
+            logger.warning("WAL checkpoint 未完成（仍有其他連線使用中）")
+    except Exception as e:
+        logger.warning(f"WAL checkpoint 失敗：{e}")
+    if read_engine is not engine:
+        read_engine.dispose()
+    engine.dispose()
@@ -4,6 +4,7 @@ FastAPI 主應用程式
 
 import logging
 import traceback
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -23,9 +24,13 @@ from app.api.debug import router as debug_router
 from app.api.websocket import router as websocket_router
 from app.api.ziwei import router as ziwei_router
 from app.core.config import get_settings
-from app.core.database import run_migrations
+from app.core.database import close_engines, run_migrations
 from app.middleware.performance import PerformanceMiddleware
 from app.middleware.security import APISecurityMiddleware
+from app.services.ai_call_log import call_log_writer
+from app.services.job_queue import job_workers
+from app.services.job_sweeper import stale_job_sweeper
+from app.services.prompt_registry import prompt_registry
 
 # 設定日誌
 logging.basicConfig(
@@ -35,6 +40,24 @@ logging.basicConfig(
 settings = get_settings()
 
 run_migrations()
+prompt_registry.load_all()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """啟動時清理卡住的任務並開始領取任務佇列（改用獨立 worker 行程時不啟動 worker）
+
+    關閉時停止領取，等待執行中的任務完成或交還佇列，寫入緩衝中的 AI 呼叫紀錄並 checkpoint WAL
+    """
+    stale_job_sweeper.start()
+    if settings.JOB_EMBEDDED_WORKERS:
+        job_workers.start()
+    yield
+    await job_workers.stop()
+    await stale_job_sweeper.stop()
+    await call_log_writer.flush_async()
+    await close_engines()
+
 
 # 建立應用程式
 # 生產環境隱藏 API 文件
@@ -45,6 +68,7 @@ app = FastAPI(
     docs_url="/docs" if settings.DEBUG else None,
     redoc_url="/redoc" if settings.DEBUG else None,
     openapi_url="/openapi.json" if settings.DEBUG else None,
+    lifespan=lifespan,
 )
 
 # 全局異常處理
@@ -1,10 +1,13 @@
 """
 模型模組
 """
+from .ai_call_log import AICallLog
 from .history import History
+from .idempotency_key import IdempotencyKey
+from .job import Job, JobWorker
 from .settings import AIConfig
 from .share_token import ShareToken
 from .user import User
 
-__all__ = ['User', 'AIConfig', 'History', 'ShareToken']
+__all__ = ['User', 'AIConfig', 'History', 'ShareToken', 'AICallLog', 'Job', 'JobWorker', 'IdempotencyKey']
 
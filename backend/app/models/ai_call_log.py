@@ -0,0 +1,37 @@
+"""
+AI 呼叫紀錄模型
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, String
+
+from app.core.database import Base
+
+
+class AICallLog(Base):
+    """AI 呼叫紀錄表 - 每次 generate / 串流呼叫一筆（重試的每次嘗試各一筆）"""
+
+    __tablename__ = "ai_call_log"
+
+    id = Column(Integer, primary_key=True, index=True)
+    history_id = Column(
+        Integer,
+        ForeignKey("history.id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
+    )
+    stage = Column(String(20), nullable=True)  # 'summary' | 'interpretation'
+    provider = Column(String(20), nullable=False)
+    model = Column(String(100), nullable=True)
+    mode = Column(String(20), nullable=True)  # 解盤模式
+    streamed = Column(Boolean, default=False)
+    status = Column(String(20), nullable=False)  # 'success' | 'error' | 'cancelled'
+    error_kind = Column(String(30), nullable=True)  # ai_retry.classify_error 的分類
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    reasoning_tokens = Column(Integer, default=0)
+    cached_tokens = Column(Integer, default=0)
+    ttft = Column(Float, nullable=True)  # 首個 token 延遲（秒），非串流呼叫等於總耗時
+    duration = Column(Float, nullable=False)  # 總耗時（秒）
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -3,7 +3,7 @@
 """
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text
 
 from app.core.database import Base
 
@@ -11,6 +11,8 @@ from app.core.database import Base
 class History(Base):
     """歷史紀錄表"""
     __tablename__ = "history"
+    # 清理卡住的任務時以 (status, updated_at) 查詢
+    __table_args__ = (Index("ix_history_status_updated", "status", "updated_at"),)
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -22,6 +24,21 @@ class History(Base):
     interpretation = Column(Text, nullable=True)  # AI 解盤結果
     ai_provider = Column(String(20), nullable=True)  # 'gemini' | 'local'
     ai_model = Column(String(100), nullable=True)
-    status = Column(String(20), default="pending")  # 'pending' | 'processing' | 'completed' | 'cancelled' | 'error'
+    status = Column(String(20), default="pending")  # 'pending' | 'processing' | 'completed' | 'cancelled' | 'error' | 'timeout'
+    mode = Column(String(20), nullable=True)  # 解盤模式 'fast' | 'standard' | 'deep'；NULL 為各服務原本的參數
+    # 漸進式解盤：先產生快速摘要，再產生完整解讀（summary_status 為 None 代表未啟用）
+    summary = Column(Text, nullable=True)
+    summary_status = Column(String(20), nullable=True)  # 'pending' | 'processing' | 'completed' | 'error'
+    summary_started_at = Column(DateTime, nullable=True)
+    summary_completed_at = Column(DateTime, nullable=True)
+    interpretation_started_at = Column(DateTime, nullable=True)
+    interpretation_completed_at = Column(DateTime, nullable=True)
+    # 本任務所有 AI 呼叫累計的 prompt token 數與命中 provider 快取的 token 數
+    prompt_tokens = Column(Integer, nullable=True)
+    cached_tokens = Column(Integer, nullable=True)
+    # 本次使用的 prompt 模板版本，例如 "liuyao_system@1a2b3c4d5e6f+user/liuyao@..."
+    prompt_version = Column(String(255), nullable=True)
+    # 任務期限（建立 / 重試時設定，超過即停止生成並設為 timeout）
+    deadline_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,45 @@
+"""
+冪等鍵模型
+"""
+
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+)
+
+from app.core.database import Base
+
+
+class IdempotencyKey(Base):
+    """冪等鍵表 - 建立占卜時的 Idempotency-Key 與第一次請求的回應，逾期即刪除"""
+
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_user_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    key = Column(String(255), nullable=False)
+    endpoint = Column(String(50), nullable=False)  # 'liuyao' | 'tarot' | 'ziwei'
+    request_hash = Column(
+        String(64), nullable=False
+    )  # 請求內容的 SHA-256，同一個鍵不可用於不同請求
+    status = Column(
+        String(20), nullable=False, default="processing"
+    )  # 'processing' | 'completed'
+    history_id = Column(
+        Integer, ForeignKey("history.id", ondelete="CASCADE"), nullable=True
+    )
+    response_body = Column(Text, nullable=True)  # 第一次請求的回應 (JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,71 @@
+"""
+AI 解盤任務佇列模型
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, String, Text
+
+from app.core.database import Base
+
+
+class Job(Base):
+    """任務佇列表 - 每次需要 AI 解盤（建立占卜、重試）一筆，由 worker 以租約方式領取"""
+
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_status_available", "status", "available_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    history_id = Column(
+        Integer,
+        ForeignKey("history.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    kind = Column(String(20), nullable=False)  # 'liuyao' | 'tarot' | 'ziwei'
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True
+    )
+    priority = Column(
+        String(20), nullable=True
+    )  # 優先等級（建立者的 User.role）：'admin' | 'user' | 'guest'
+    fair_tag = Column(
+        Float, nullable=True, index=True
+    )  # 加權公平排隊的虛擬完成時間，越小越先執行
+    queue_position = Column(Integer, nullable=True)  # 排隊位置（1 起算，定期更新）
+    estimated_start_at = Column(DateTime, nullable=True)  # 預估開始執行時間
+    status = Column(
+        String(20), nullable=False, default="queued"
+    )  # 'queued' | 'running' | 'done' | 'dead'
+    attempts = Column(Integer, nullable=False, default=0)  # 已領取次數
+    max_attempts = Column(Integer, nullable=False, default=3)
+    available_at = Column(
+        DateTime, nullable=False, default=datetime.utcnow
+    )  # 可被領取的時間（失敗後延後重試）
+    lease_owner = Column(String(100), nullable=True)  # 持有租約的 worker
+    lease_expires_at = Column(
+        DateTime, nullable=True
+    )  # 租約到期即視為 worker 已失聯，可被重新領取
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class JobWorker(Base):
+    """任務 worker 心跳表 - 每個 worker 行程一筆，定期更新 last_seen_at"""
+
+    __tablename__ = "job_workers"
+
+    id = Column(String(100), primary_key=True)  # 主機名稱:pid
+    hostname = Column(String(100), nullable=False)
+    pid = Column(Integer, nullable=False)
+    mode = Column(
+        String(20), nullable=False
+    )  # 'embedded'（API 行程內）| 'standalone'（python -m app.worker）
+    concurrency = Column(Integer, nullable=False)
+    running = Column(Integer, nullable=False, default=0)  # 執行中的任務數
+    completed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    last_seen_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -22,5 +22,13 @@ class User(Base):
     guest_identifier = Column(
         String(64), nullable=True, index=True
     )  # IP+UA hash for guest users
+    # AI 服務斷路器開啟時的處理：'fallback'（改用備援）| 'fail_fast'（直接失敗）
+    ai_failover_policy = Column(String(20), default="fallback")
+    ai_fallback_config_id = Column(
+        Integer, nullable=True
+    )  # 備援 AI 設定 ID（未設定或已刪除則使用預設 opencode）
+    # 是否啟用對沖請求（主要服務回應過慢時同時呼叫備援服務）
+    ai_hedging_enabled = Column(Boolean, default=False)
+
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,177 @@
+"""
+占卜建立的准入控制模組
+
+建立占卜前（排盤與寫入資料庫之前）依目前負載決定是否接受：
+- 佇列深度：排隊中的任務數
+- 預估等待：依排隊 / 執行中任務數、worker 總並行數與近期任務平均執行時間估計
+- AI 限制器：等待中的呼叫數相對於同時進行上限（worker 在 API 行程內執行時才有資料）
+
+每個等級 (User.role) 只能使用 ADMISSION_CLASS_SHARE 比例的容量，
+負載升高時訪客最先被拒絕、其次一般使用者；被拒絕時回 503 並附 Retry-After，
+避免接受註定逾時的任務，讓過載時的服務品質逐步下降而不是全部逾時。
+"""
+
+import logging
+import math
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.core.database import get_read_db
+from app.models.job import Job
+from app.models.user import User
+from app.services.ai_limiter import ai_limiters
+from app.services.job_queue import StartEstimator
+from app.utils.auth import get_current_user_or_guest
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LoadSnapshot:
+    """目前負載"""
+
+    queued: int
+    running: int
+    capacity: int
+    average_job_seconds: float
+    estimated_wait: float  # 新任務的預估等待秒數
+    limiter_pressure: float  # 各 AI 限制器「等待數 / 同時進行上限」的最大值
+    taken_at: float
+
+
+@dataclass
+class AdmissionDecision:
+    admitted: bool
+    reason: Optional[str] = None  # 'queue_depth' | 'wait' | 'limiter'
+    retry_after: int = 0
+
+
+def limiter_pressure() -> float:
+    return max(
+        (limiter.waiting / max(limiter.limit, 1.0) for limiter in ai_limiters.all()),
+        default=0.0,
+    )
+
+
+def take_snapshot(db: Session) -> LoadSnapshot:
+    estimator = StartEstimator(db)
+    queued = db.query(func.count(Job.id)).filter(Job.status == "queued").scalar()
+    start_at = estimator.estimate(queued + 1)
+    return LoadSnapshot(
+        queued=queued,
+        running=estimator.running,
+        capacity=estimator.capacity,
+        average_job_seconds=estimator.average,
+        estimated_wait=(start_at - estimator.now).total_seconds(),
+        limiter_pressure=limiter_pressure(),
+        taken_at=time.monotonic(),
+    )
+
+
+def evaluate(load: LoadSnapshot, share: float) -> AdmissionDecision:
+    """依負載與等級可使用的比例決定是否接受"""
+    settings = get_settings()
+
+    def reject(reason: str, seconds: float) -> AdmissionDecision:
+        retry_after = min(max(seconds, 1.0), settings.AI_JOB_TIMEOUT_SECONDS)
+        return AdmissionDecision(False, reason, math.ceil(retry_after))
+
+    max_depth = settings.ADMISSION_MAX_QUEUE_DEPTH * share
+    if load.queued >= max_depth:
+        excess = load.queued - max_depth + 1
+        return reject("queue_depth", excess / load.capacity * load.average_job_seconds)
+
+    max_wait = settings.AI_JOB_TIMEOUT_SECONDS * share
+    if load.estimated_wait > max_wait:
+        return reject("wait", load.estimated_wait - max_wait)
+
+    if load.limiter_pressure > settings.ADMISSION_MAX_LIMITER_PRESSURE * share:
+        return reject("limiter", load.average_job_seconds)
+
+    return AdmissionDecision(True)
+
+
+class AdmissionController:
+    """准入控制（負載快照快取 ADMISSION_CACHE_SECONDS 秒，尖峰時不會每個請求都查詢佇列）"""
+
+    def __init__(self):
+        self._snapshot: Optional[LoadSnapshot] = None
+        self.admitted: dict[str, int] = defaultdict(int)
+        self.rejected: dict[str, int] = defaultdict(int)
+
+    def snapshot(self, db: Session) -> LoadSnapshot:
+        cached = self._snapshot
+        max_age = get_settings().ADMISSION_CACHE_SECONDS
+        if cached is None or time.monotonic() - cached.taken_at > max_age:
+            cached = self._snapshot = take_snapshot(db)
+        return cached
+
+    def decide(self, db: Session, priority: Optional[str]) -> AdmissionDecision:
+        settings = get_settings()
+        priority = priority or "user"
+        if not settings.ADMISSION_ENABLED:
+            return AdmissionDecision(True)
+
+        share = settings.ADMISSION_CLASS_SHARE.get(priority, 1.0)
+        decision = evaluate(self.snapshot(db), share)
+        if decision.admitted:
+            self.admitted[priority] += 1
+        else:
+            self.rejected[f"{priority}:{decision.reason}"] += 1
+            logger.warning(
+                f"拒絕建立占卜（{priority}，{decision.reason}），"
+                f"{decision.retry_after} 秒後再試"
+            )
+        return decision
+
+    def stats(self) -> dict:
+        load = self._snapshot
+        return {
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+            "load": {
+                "queued": load.queued,
+                "running": load.running,
+                "capacity": load.capacity,
+                "estimated_wait": round(load.estimated_wait, 1),
+                "limiter_pressure": round(load.limiter_pressure, 2),
+            }
+            if load
+            else None,
+        }
+
+
+# 全局准入控制
+admission_controller = AdmissionController()
+
+
+def check_admission(
+    request: Request,
+    current_user: User = Depends(get_current_user_or_guest),
+    db: Session = Depends(get_read_db),
+):
+    """
+    准入控制的依賴注入函數（在排盤與寫入資料庫之前執行）
+
+    使用方式：
+    @router.post("")
+    async def create_divination(..., _: None = Depends(check_admission)):
+        ...
+    """
+    if getattr(request.state, "idempotent_replay", False):
+        # 冪等鍵重送只回傳既有結果，不增加負載
+        return
+    decision = admission_controller.decide(db, current_user.role)
+    if not decision.admitted:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"目前占卜人數眾多，請於 {decision.retry_after} 秒後再試",
+            headers={"Retry-After": str(decision.retry_after)},
+        )
@@ -2,11 +2,12 @@
 AI 服務模組
 """
 
-import asyncio
+import hashlib
 import json
 import logging
-import random
-from typing import Any, AsyncGenerator, Callable, Optional
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Optional
 
 import httpx
 from google import genai
@@ -14,172 +15,510 @@ from google.genai import types
 from openai import AsyncOpenAI
 
 from app.core.config import get_settings
+from app.services.ai_call_log import AICallUsage, call_log_writer, current_labels
+from app.services.ai_circuit import (
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+    ai_circuits,
+)
+from app.services.ai_deadline import capped_timeout
+from app.services.ai_limiter import ai_limiters, is_overload_error
+from app.services.ai_retry import RETRYABLE_KINDS, RetryPolicy, classify_error
+from app.services.ai_router import CallRecord, model_router
+from app.services.ai_singleflight import ai_singleflight
+from app.services.ai_usage import (
+    TokenUsage,
+    call_usage,
+    report_usage,
+    usage_from_gemini,
+    usage_from_openai,
+)
+from app.services.prompt_layout import prefix_hash
 
 logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
+# 解盤模式：fast（數秒內給結論）/ standard / deep（完整推演）；未指定時與 deep 相同
+INTERPRETATION_MODES = ("fast", "standard", "deep")
+
+
+def credential_fingerprint(api_key: Optional[str]) -> str:
+    """API Key 指紋（區分不同金鑰，但不保留金鑰本身）"""
+    return hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+
+
+def service_identity(provider: str, base_url: Optional[str] = None) -> tuple[str, str]:
+    """將 AI 設定的 provider / URL 轉為服務實際使用的 (provider, endpoint)"""
+    if provider in ("local", "custom"):
+        return "custom", (base_url or "").rstrip("/")
+    if provider == "opencode":
+        return "opencode", OpenCodeService.BASE_URL
+    return provider, ""
+
+
+def base_url_override(provider: str) -> Optional[str]:
+    """設定中覆寫的 provider API 位址（未設定回傳 None）"""
+    return settings.AI_BASE_URL_OVERRIDES.get(provider) or None
+
+
+def request_timeout() -> float:
+    """單次 AI 呼叫的逾時秒數（不超過目前任務的剩餘時間）"""
+    return capped_timeout(settings.AI_REQUEST_TIMEOUT_SECONDS)
+
+
+def _openai_chunk_usage(chunk):
+    """OpenAI 相容串流的最後一個片段帶有 usage（需 include_usage）"""
+    if isinstance(chunk, dict):
+        return chunk.get("usage")
+    return getattr(chunk, "usage", None)
+
+
+def _openai_delta_text(chunk) -> str:
+    """取出 OpenAI 相容串流片段的文字（僅有思考內容時回傳空字串作為心跳）"""
+    if isinstance(chunk, dict):
+        choices = chunk.get("choices") or []
+        delta = choices[0].get("delta", {}) if choices else {}
+        return delta.get("content") or ""
+    if not chunk.choices:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
 
 class AIService:
-    """AI 服務基類"""
+    """AI 服務基類
+
+    子類別實作 `_generate`；`generate` 負責共用的呼叫流程：
+    請求合併 → 重試策略 → 斷路器 → provider 並行限制 → `_generate`
+    """
+
+    provider: str = ""
+    model: str = ""
+    api_key: Optional[str] = None
+    # 解盤模式（None 時與 deep 相同，維持各服務原本的參數）
+    mode: Optional[str] = None
+    MODE_PROFILES: dict[str, dict] = {}
+
+    def _mode_options(self) -> dict:
+        """目前解盤模式對應的 provider 參數（思考等級、輸出上限）"""
+        return dict(self.MODE_PROFILES.get(self.mode or "deep", {}))
+
+    @property
+    def endpoint(self) -> str:
+        """服務端點識別（用於區分同一 provider 的不同伺服器）"""
+        return ""
+
+    def request_key(self, prompt: str, system_prompt: str) -> str:
+        """計算請求識別 key（相同 key 代表完全相同的 AI 請求）"""
+        credential = credential_fingerprint(self.api_key)
+        raw = json.dumps(
+            [
+                self.provider,
+                self.endpoint,
+                self.model,
+                self.mode,
+                credential,
+                system_prompt,
+                prompt,
+            ],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @property
+    def circuit(self) -> CircuitBreaker:
+        """此服務端點的斷路器"""
+        return ai_circuits.get(
+            self.provider, self.endpoint, credential_fingerprint(self.api_key)
+        )
 
     async def generate(self, prompt: str, system_prompt: str) -> str:
-        """生成回應"""
+        """生成回應（並行中的相同請求會共用同一次呼叫）"""
+        return await ai_singleflight.do(
+            self.request_key(prompt, system_prompt),
+            lambda: self._generate_with_retry(prompt, system_prompt),
+        )
+
+    async def _generate_with_retry(self, prompt: str, system_prompt: str) -> str:
+        """依共用重試策略呼叫 AI 服務（每次嘗試各自取得並行名額）"""
+        return await RetryPolicy.from_settings().run(
+            lambda: self._limited_generate(prompt, system_prompt),
+            provider=self.provider,
+        )
+
+    @asynccontextmanager
+    async def _guarded_call(self, streamed: bool = False):
+        """在斷路器與 provider 並行限制內執行一次 AI 呼叫，並回報結果
+
+        呼叫端透過 yield 出的 CallRecord 回報輸出，供模型路由統計 TTFT 與 tokens/sec；
+        結束時（含失敗與取消）寫入一筆 AI 呼叫紀錄。
+        """
+        circuit = self.circuit
+        if not circuit.allow_request():
+            raise CircuitOpenError(circuit)
+        # half_open 時此呼叫佔用探測名額；沒有成功或服務端失敗的結論時須歸還
+        probing = circuit.state == CircuitState.HALF_OPEN
+        verdict = False
+
+        limiter = ai_limiters.get(self.provider, self.endpoint)
+        try:
+            await limiter.acquire()
+        except BaseException:
+            # 排隊等待並行名額時被取消
+            if probing:
+                circuit.release_probe()
+            raise
+
+        call = CallRecord()
+        latency = None
+        overloaded = False
+        status, error_kind = "cancelled", None
+        with call_usage() as usage:
+            try:
+                yield call
+                latency = time.monotonic() - call.start
+                status = "success"
+                circuit.record_success()
+                verdict = True
+                model_router.record_success(
+                    self.provider, self.model, call, streamed=streamed
+                )
+            except Exception as e:
+                overloaded = is_overload_error(e)
+                info = classify_error(e)
+                status, error_kind = "error", info.kind
+                if info.kind in RETRYABLE_KINDS:
+                    circuit.record_failure(info.kind)
+                    verdict = True
+                model_router.record_failure(self.provider, self.model)
+                raise
+            finally:
+                if probing and not verdict:
+                    circuit.release_probe()
+                await limiter.release(latency=latency, overloaded=overloaded)
+                self._log_call(call, usage, status, error_kind, streamed)
+
+    def _log_call(
+        self,
+        call: CallRecord,
+        usage: TokenUsage,
+        status: str,
+        error_kind: Optional[str],
+        streamed: bool,
+    ):
+        history_id, stage = current_labels()
+        ttft = None
+        if call.first_token_at is not None:
+            ttft = call.first_token_at - call.start
+        call_log_writer.record(
+            AICallUsage(
+                provider=self.provider,
+                model=self.model,
+                mode=self.mode,
+                status=status,
+                error_kind=error_kind,
+                streamed=streamed,
+                duration=time.monotonic() - call.start,
+                ttft=ttft,
+                prompt_tokens=usage.prompt_tokens,
+                # provider 未回報用量時以輸出文字估算
+                completion_tokens=usage.completion_tokens or call.output_tokens,
+                reasoning_tokens=usage.reasoning_tokens,
+                cached_tokens=usage.cached_tokens,
+                history_id=history_id,
+                stage=stage,
+            )
+        )
+
+    async def _limited_generate(self, prompt: str, system_prompt: str) -> str:
+        """在斷路器與 provider 並行限制內呼叫 AI 服務"""
+        async with self._guarded_call() as call:
+            result = await self._generate(prompt, system_prompt)
+            call.add_output(result or "")
+            return result
+
+    async def _generate(self, prompt: str, system_prompt: str) -> str:
+        """實際呼叫 AI 服務生成回應"""
         raise NotImplementedError
 
     async def generate_stream(
         self, prompt: str, system_prompt: str
     ) -> AsyncGenerator[str, None]:
-        """串流生成回應"""
-        raise NotImplementedError
+        """串流生成回應（不重試；空字串代表模型仍在思考的心跳）"""
+        async with self._guarded_call(streamed=True) as call:
+            async for chunk in self._generate_stream(prompt, system_prompt):
+                call.add_output(chunk)
+                yield chunk
+
+    async def _generate_stream(
+        self, prompt: str, system_prompt: str
+    ) -> AsyncGenerator[str, None]:
+        """實際串流呼叫（未支援串流的服務一次回傳完整結果）"""
+        yield await self._generate(prompt, system_prompt)
 
 
 class GeminiService(AIService):
     """Google Gemini AI 服務"""
 
+    provider = "gemini"
+    MODE_PROFILES = {
+        "fast": {"thinking_level": "low", "max_output_tokens": 4096},
+        "standard": {"thinking_level": "high", "max_output_tokens": 8192},
+        "deep": {"thinking_level": "high", "max_output_tokens": 16384},
+    }
+
+    # 明確建立的 context cache：(金鑰指紋, 模型, system prompt 雜湊) → (cache 名稱, 到期時間)
+    # 建立失敗（例如 prompt 太短不符快取門檻）時記錄 None，到期前不再嘗試
+    _context_caches: dict[tuple[str, str, str], tuple[Optional[str], float]] = {}
+
     def __init__(self, api_key: str, model: str = "gemini-3-flash-preview"):
         self.api_key = api_key
         self.model = model or "gemini-3-flash-preview"
-        self.client = genai.Client(
-            api_key=api_key, http_options={"api_version": "v1alpha"}
+        http_options = {"api_version": "v1alpha"}
+        self.base_url = base_url_override(self.provider)
+        if self.base_url:
+            http_options["base_url"] = self.base_url
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+
+    @property
+    def endpoint(self) -> str:
+        return self.base_url or ""
+
+    async def _cached_content(self, system_prompt: str) -> Optional[str]:
+        """取得 system prompt 對應的 context cache 名稱（未啟用或無法建立時回傳 None）"""
+        if not settings.AI_PROMPT_CACHE_ENABLED:
+            return None
+
+        key = (
+            credential_fingerprint(self.api_key),
+            self.model,
+            prefix_hash(system_prompt),
         )
+        entry = self._context_caches.get(key)
+        # 保留 60 秒餘裕，避免使用即將過期的快取
+        if entry and entry[1] > time.time() + 60:
+            return entry[0]
 
-    async def _retry_async(
-        self,
-        func: Callable,
-        *args,
-        max_retries: int = 3,
-        base_delay: float = 2.0,
-        **kwargs,
-    ) -> Any:
-        """非同步重試邏輯"""
-        for attempt in range(max_retries):
-            try:
-                return await func(*args, **kwargs)
-            except Exception as e:
-                error_str = str(e)
-                is_429 = "429" in error_str or "RESOURCE_EXHAUSTED" in error_str
-                is_503 = "503" in error_str or "Service Unavailable" in error_str
-
-                # 🔴 429 錯誤（配額用完）立即終止，不重試
-                if is_429:
-                    logger.error("Gemini API 配額已用完 (429 RESOURCE_EXHAUSTED)")
-                    raise Exception(
-                        "⚠️ Gemini API 配額已用完，請稍後再試或檢查 API 配額限制"
-                    ) from e
-
-                # 如果是最後一次嘗試，拋出友善錯誤訊息
-                if attempt == max_retries - 1:
-                    if is_503:
-                        logger.error(
-                            f"Gemini API 服務不可用 (503 Service Unavailable) - 已重試 {max_retries} 次"
-                        )
-                        raise Exception(
-                            "⚠️ Gemini API 服務暫時不可用，已重試多次仍失敗，請稍後再試"
-                        ) from e
-                    else:
-                        logger.error(
-                            f"Gemini API Error (Attempt {attempt + 1}/{max_retries}): {error_str}"
-                        )
-                        raise e
-
-                # 進行重試（包含 503 錯誤）
-                sleep_time = base_delay * (2**attempt) + random.uniform(0, 1)
-                error_type = "503 Service Unavailable" if is_503 else "API Error"
-                logger.warning(
-                    f"Gemini {error_type}. Retrying in {sleep_time:.2f}s... (Attempt {attempt + 1}/{max_retries})"
-                )
-                await asyncio.sleep(sleep_time)
-
-    async def generate(self, prompt: str, system_prompt: str) -> str:
-        """生成回應 (使用 Thinking Config)"""
-        config = types.GenerateContentConfig(
-            system_instruction=system_prompt,
-            thinking_config=types.ThinkingConfig(thinking_level="high"),
+        ttl = settings.AI_PROMPT_CACHE_TTL_SECONDS
+        try:
+            cache = await self.client.aio.caches.create(
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_prompt,
+                    display_name=f"divination-{key[2]}",
+                    ttl=f"{ttl}s",
+                ),
+            )
+            name = cache.name
+        except Exception as e:
+            logger.warning(f"Gemini context cache 建立失敗，改用一般請求: {e}")
+            name = None
+        self._context_caches[key] = (name, time.time() + ttl)
+        return name
+
+    async def _build_config(self, system_prompt: str) -> types.GenerateContentConfig:
+        """生成設定 (使用 Thinking Config，思考等級與輸出上限依解盤模式)"""
+        options = self._mode_options()
+        cached_content = await self._cached_content(system_prompt)
+        return types.GenerateContentConfig(
+            system_instruction=None if cached_content else system_prompt,
+            cached_content=cached_content,
+            thinking_config=types.ThinkingConfig(
+                thinking_level=options["thinking_level"]
+            ),
             temperature=1.0,
-            max_output_tokens=16384,
+            max_output_tokens=options["max_output_tokens"],
+            http_options=types.HttpOptions(timeout=int(request_timeout() * 1000)),
         )
 
+    async def _generate(self, prompt: str, system_prompt: str) -> str:
+        """生成回應 (使用 Thinking Config)"""
         try:
-            response = await self._retry_async(
-                self.client.aio.models.generate_content,
+            response = await self.client.aio.models.generate_content(
                 model=self.model,
                 contents=prompt,
-                config=config,
+                config=await self._build_config(system_prompt),
             )
+            report_usage(usage_from_gemini(response.usage_metadata))
             return response.text
         except Exception as e:
             logger.error(f"Error in Gemini generate: {e}")
             raise e
 
+    async def _generate_stream(
+        self, prompt: str, system_prompt: str
+    ) -> AsyncGenerator[str, None]:
+        """串流生成回應"""
+        stream = await self.client.aio.models.generate_content_stream(
+            model=self.model,
+            contents=prompt,
+            config=await self._build_config(system_prompt),
+        )
+        usage_metadata = None
+        async for chunk in stream:
+            usage_metadata = chunk.usage_metadata or usage_metadata
+            yield chunk.text or ""
+        report_usage(usage_from_gemini(usage_metadata))
+
 
 class OpenAIService(AIService):
     """OpenAI 官方服務 (使用 SDK)"""
 
+    provider = "openai"
+    # 使用者可自訂模型，不一定支援 reasoning_effort，只調整輸出上限
+    MODE_PROFILES = {
+        "fast": {"max_completion_tokens": 4096},
+        "standard": {"max_completion_tokens": 16384},
+        "deep": {},
+    }
+
     def __init__(self, api_key: str, model: str = "gpt-5.1"):
-        self.client = AsyncOpenAI(api_key=api_key)
+        self.api_key = api_key
+        # 重試由 RetryPolicy 統一處理，關閉 SDK 內建重試
+        self.base_url = base_url_override(self.provider)
+        self.client = AsyncOpenAI(
+            api_key=api_key, base_url=self.base_url, max_retries=0
+        )
         self.model = model or "gpt-5.1"  # 預設 gpt-5.1, 但允許用戶自定義
 
-    async def generate(self, prompt: str, system_prompt: str) -> str:
+    @property
+    def endpoint(self) -> str:
+        return self.base_url or ""
+
+    def _request_kwargs(self, prompt: str, system_prompt: str) -> dict:
+        kwargs = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
+            "temperature": 1.0,
+            "timeout": request_timeout(),
+            **self._mode_options(),
+        }
+        if settings.AI_PROMPT_CACHE_ENABLED:
+            # 相同 system prompt 的請求導向同一組快取
+            kwargs["prompt_cache_key"] = prefix_hash(system_prompt)
+        return kwargs
+
+    async def _generate(self, prompt: str, system_prompt: str) -> str:
         """生成回應"""
         try:
             response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=1.0,
+                **self._request_kwargs(prompt, system_prompt)
             )
+            report_usage(usage_from_openai(getattr(response, "usage", None)))
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"Error in OpenAI generate: {e}")
             raise e
 
+    async def _generate_stream(
+        self, prompt: str, system_prompt: str
+    ) -> AsyncGenerator[str, None]:
+        """串流生成回應"""
+        stream = await self.client.chat.completions.create(
+            **self._request_kwargs(prompt, system_prompt),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            report_usage(usage_from_openai(_openai_chunk_usage(chunk)))
+            yield _openai_delta_text(chunk)
+
 
 class OpenCodeService(AIService):
     """opencode 預設 AI 服務（訪客 / 未設定自訂模型的用戶）"""
 
+    provider = "opencode"
     BASE_URL = "https://opencode.ai/zen/go/v1"
     DEFAULT_MODEL = "deepseek-v4-flash"
+    MODE_PROFILES = {
+        "fast": {"reasoning_effort": "low", "max_tokens": 4096},
+        "standard": {"reasoning_effort": "high", "max_tokens": 16384},
+        "deep": {"reasoning_effort": "max", "max_tokens": 46800},
+    }
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, model: Optional[str] = None):
         self.api_key = api_key
-        self.model = self.DEFAULT_MODEL
-        self.client = AsyncOpenAI(base_url=self.BASE_URL, api_key=api_key)
+        self.model = model or self.DEFAULT_MODEL
+        self.base_url = base_url_override(self.provider) or self.BASE_URL
+        self.client = AsyncOpenAI(
+            base_url=self.base_url, api_key=api_key, max_retries=0
+        )
 
-    async def generate(self, prompt: str, system_prompt: str) -> str:
-        """生成回應（思考開到 max，temperature 0.9，輸出上限 46800 tokens）"""
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=[
+    @property
+    def endpoint(self) -> str:
+        return self.base_url
+
+    def _request_kwargs(self, prompt: str, system_prompt: str) -> dict:
+        """請求參數（temperature 0.9；deep 模式思考開到 max，輸出上限 46800 tokens）"""
+        return {
+            "model": self.model,
+            "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt},
             ],
-            temperature=0.9,
-            max_tokens=46800,
-            reasoning_effort="max",
+            "temperature": 0.9,
+            "timeout": request_timeout(),
+            **self._mode_options(),
+        }
+
+    async def _generate(self, prompt: str, system_prompt: str) -> str:
+        """生成回應"""
+        response = await self.client.chat.completions.create(
+            **self._request_kwargs(prompt, system_prompt)
         )
+        # DeepSeek 以 prompt_cache_hit_tokens 回報自動前綴快取的命中數
+        report_usage(usage_from_openai(getattr(response, "usage", None)))
         return response.choices[0].message.content or ""
 
+    async def _generate_stream(
+        self, prompt: str, system_prompt: str
+    ) -> AsyncGenerator[str, None]:
+        """串流生成回應"""
+        stream = await self.client.chat.completions.create(
+            **self._request_kwargs(prompt, system_prompt),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            report_usage(usage_from_openai(_openai_chunk_usage(chunk)))
+            yield _openai_delta_text(chunk)
+
 
 class CustomAIService(AIService):
     """其他 AI 服務 (OpenAI Compatible)"""
 
+    provider = "custom"
+    MODE_PROFILES = {
+        "fast": {"max_tokens": 4096},
+        "standard": {"max_tokens": 8192},
+        "deep": {"max_tokens": 16384},
+    }
+
     def __init__(self, base_url: str, model: str, api_key: Optional[str] = None):
-        self.base_url = base_url.rstrip("/")
+        self.base_url = (base_url_override(self.provider) or base_url).rstrip("/")
         self.model = model
         self.api_key = api_key
 
-    async def generate(self, prompt: str, system_prompt: str) -> str:
-        """生成回應"""
-        url = f"{self.base_url}/v1/chat/completions"
+    @property
+    def endpoint(self) -> str:
+        return self.base_url
 
+    @property
+    def _url(self) -> str:
+        return f"{self.base_url}/v1/chat/completions"
+
+    def _headers(self) -> dict:
         headers = {}
         if self.api_key:
             headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
 
-        payload = {
+    def _payload(self, prompt: str, system_prompt: str) -> dict:
+        return {
             "model": self.model,
             "messages": [
                 {"role": "system", "content": system_prompt},
@@ -187,13 +526,44 @@ class CustomAIService(AIService):
             ],
             "temperature": 1.0,
             "top_p": 0.7,
-            "max_tokens": 16384,
+            **self._mode_options(),
         }
 
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            response = await client.post(url, json=payload, headers=headers)
+    async def _generate_stream(
+        self, prompt: str, system_prompt: str
+    ) -> AsyncGenerator[str, None]:
+        """串流生成回應 (SSE)"""
+        payload = {**self._payload(prompt, system_prompt), "stream": True}
+
+        async with httpx.AsyncClient(timeout=request_timeout()) as client:
+            async with client.stream(
+                "POST", self._url, json=payload, headers=self._headers()
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                    except json.JSONDecodeError:
+                        continue
+                    report_usage(usage_from_openai(_openai_chunk_usage(chunk)))
+                    yield _openai_delta_text(chunk)
+
+    async def _generate(self, prompt: str, system_prompt: str) -> str:
+        """生成回應"""
+        payload = self._payload(prompt, system_prompt)
+
+        async with httpx.AsyncClient(timeout=request_timeout()) as client:
+            response = await client.post(
+                self._url, json=payload, headers=self._headers()
+            )
             response.raise_for_status()
             data = response.json()
+            report_usage(usage_from_openai(data.get("usage")))
 
             if "choices" in data and len(data["choices"]) > 0:
                 return data["choices"][0]["message"]["content"]
@@ -282,8 +652,19 @@ class CustomAIService(AIService):
             return {"success": False, "error": str(e2)}
 
 
-def get_ai_service(provider: str, **kwargs) -> AIService:
-    """取得 AI 服務實例"""
+def get_ai_service(provider: str, mode: Optional[str] = None, **kwargs) -> AIService:
+    """取得 AI 服務實例
+
+    Args:
+        mode: 解盤模式 'fast' | 'standard' | 'deep'（None 時使用各服務原本的參數）
+    """
+    service = _create_ai_service(provider, **kwargs)
+    service.mode = mode
+    return service
+
+
+def _create_ai_service(provider: str, **kwargs) -> AIService:
+    """依 provider 建立 AI 服務實例"""
     if provider == "gemini":
         api_key = kwargs.get("api_key")
         model = kwargs.get("model")
@@ -302,7 +683,7 @@ def get_ai_service(provider: str, **kwargs) -> AIService:
         api_key = kwargs.get("api_key")
         if not api_key:
             raise ValueError("opencode API Key 未提供")
-        return OpenCodeService(api_key)
+        return OpenCodeService(api_key, model=kwargs.get("model"))
 
     elif provider == "local" or provider == "custom":
         base_url = kwargs.get("base_url") or kwargs.get("local_url")
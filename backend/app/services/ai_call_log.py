@@ -0,0 +1,272 @@
+"""
+AI 呼叫紀錄模組
+
+每次 generate / 串流呼叫結束時產生一筆 `AICallUsage`：token 用量（prompt / completion /
+reasoning / cached）、首個 token 延遲、總耗時與結果。紀錄先放進記憶體緩衝，
+滿一批或等待 AI_CALL_LOG_FLUSH_INTERVAL 秒後，在 thread pool 中一次寫入 ai_call_log 表，
+不阻塞 event loop，也不佔用背景任務的資料庫 session。
+"""
+
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.core.database import SessionLocal
+from app.models.ai_call_log import AICallLog
+from app.models.history import History
+from app.utils.stats import percentile
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AICallUsage:
+    """單次 AI 呼叫的用量紀錄"""
+
+    provider: str
+    model: Optional[str]
+    status: str  # 'success' | 'error' | 'cancelled'
+    duration: float
+    ttft: Optional[float] = None
+    mode: Optional[str] = None
+    streamed: bool = False
+    error_kind: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    reasoning_tokens: int = 0
+    cached_tokens: int = 0
+    history_id: Optional[int] = None
+    stage: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+
+
+# 目前呼叫所屬的 (history_id, 階段)
+_call_labels: ContextVar[tuple[Optional[int], Optional[str]]] = ContextVar(
+    "ai_call_labels", default=(None, None)
+)
+
+
+@contextmanager
+def log_calls(history_id: Optional[int], stage: str) -> Iterator[None]:
+    """區塊內的 AI 呼叫紀錄都關聯到指定的歷史紀錄與階段"""
+    token = _call_labels.set((history_id, stage))
+    try:
+        yield
+    finally:
+        _call_labels.reset(token)
+
+
+def current_labels() -> tuple[Optional[int], Optional[str]]:
+    return _call_labels.get()
+
+
+class CallLogWriter:
+    """批次寫入 ai_call_log 的非同步寫入器"""
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self.session_factory = session_factory
+        self._pending: list[AICallUsage] = []
+        self._lock = threading.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.written = 0
+        self.dropped = 0
+        self.failed_batches = 0
+
+    def record(self, entry: AICallUsage):
+        """加入一筆紀錄（不會等待寫入）"""
+        settings = get_settings()
+        if not settings.AI_CALL_LOG_ENABLED:
+            return
+        with self._lock:
+            if len(self._pending) >= settings.AI_CALL_LOG_MAX_PENDING:
+                self.dropped += 1
+                return
+            self._pending.append(entry)
+            full = len(self._pending) >= settings.AI_CALL_LOG_BATCH_SIZE
+        self._schedule(0 if full else settings.AI_CALL_LOG_FLUSH_INTERVAL)
+
+    def _schedule(self, delay: float):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 沒有 event loop（同步呼叫端），等下一次 flush
+            return
+        if (
+            self._timer is not None
+            and self._timer_loop is loop
+            and not loop.is_closed()
+        ):
+            if delay > 0:
+                return
+            self._timer.cancel()
+        self._timer_loop = loop
+        self._timer = loop.call_later(delay, self._on_timer, loop)
+
+    def _on_timer(self, loop: asyncio.AbstractEventLoop):
+        self._timer = None
+        loop.run_in_executor(None, self.flush)
+
+    def flush(self) -> int:
+        """立即寫入所有緩衝中的紀錄，回傳寫入筆數"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+
+        db = self.session_factory()
+        try:
+            db.add_all([AICallLog(**asdict(entry)) for entry in batch])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            with self._lock:
+                self.failed_batches += 1
+                self.dropped += len(batch)
+            logger.warning(f"AI 呼叫紀錄寫入失敗（{len(batch)} 筆）：{e}")
+            return 0
+        finally:
+            db.close()
+
+        with self._lock:
+            self.written += len(batch)
+        return len(batch)
+
+    async def flush_async(self) -> int:
+        return await asyncio.to_thread(self.flush)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed_batches": self.failed_batches,
+            }
+
+
+# 全局 AI 呼叫紀錄寫入器
+call_log_writer = CallLogWriter()
+
+
+# ========== 統計查詢 ==========
+
+
+def _latency(values: list[float]) -> dict:
+    if not values:
+        return {"p50": None, "p95": None}
+    return {
+        "p50": round(percentile(values, 0.5), 3),
+        "p95": round(percentile(values, 0.95), 3),
+    }
+
+
+def model_latency_stats(db: Session, since: datetime) -> dict:
+    """各 (provider, model) 的呼叫數、錯誤數、TTFT 與總耗時 p50 / p95、token 合計"""
+    rows = (
+        db.query(
+            AICallLog.provider,
+            AICallLog.model,
+            AICallLog.status,
+            AICallLog.streamed,
+            AICallLog.ttft,
+            AICallLog.duration,
+            AICallLog.prompt_tokens,
+            AICallLog.completion_tokens,
+            AICallLog.reasoning_tokens,
+            AICallLog.cached_tokens,
+        )
+        .filter(AICallLog.created_at >= since)
+        .all()
+    )
+
+    groups: dict[str, dict] = {}
+    for row in rows:
+        group = groups.setdefault(
+            f"{row.provider}/{row.model or '-'}",
+            {
+                "calls": 0,
+                "errors": 0,
+                "ttft": [],
+                "duration": [],
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "reasoning_tokens": 0,
+                "cached_tokens": 0,
+            },
+        )
+        group["calls"] += 1
+        if row.status != "success":
+            group["errors"] += 1
+            continue
+        # 非串流呼叫的 TTFT 等於總耗時，不列入 TTFT 分佈
+        if row.streamed and row.ttft is not None:
+            group["ttft"].append(row.ttft)
+        group["duration"].append(row.duration)
+        for key in (
+            "prompt_tokens",
+            "completion_tokens",
+            "reasoning_tokens",
+            "cached_tokens",
+        ):
+            group[key] += getattr(row, key) or 0
+
+    return {
+        name: {
+            **group,
+            "ttft": _latency(group["ttft"]),
+            "duration": _latency(group["duration"]),
+        }
+        for name, group in sorted(groups.items())
+    }
+
+
+def divination_token_stats(db: Session, since: datetime) -> dict:
+    """各占卜類型的 token 用量（依 history_id 關聯）"""
+    rows = (
+        db.query(
+            History.divination_type,
+            func.count(func.distinct(AICallLog.history_id)),
+            func.count(AICallLog.id),
+            func.coalesce(func.sum(AICallLog.prompt_tokens), 0),
+            func.coalesce(func.sum(AICallLog.completion_tokens), 0),
+            func.coalesce(func.sum(AICallLog.reasoning_tokens), 0),
+            func.coalesce(func.sum(AICallLog.cached_tokens), 0),
+        )
+        .join(History, History.id == AICallLog.history_id)
+        .filter(AICallLog.created_at >= since)
+        .group_by(History.divination_type)
+        .all()
+    )
+
+    result = {}
+    for divination_type, jobs, calls, prompt, completion, reasoning, cached in rows:
+        result[divination_type] = {
+            "jobs": jobs,
+            "calls": calls,
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "reasoning_tokens": reasoning,
+            "cached_tokens": cached,
+            "avg_tokens_per_job": round((prompt + completion) / jobs, 1) if jobs else 0,
+        }
+    return result
+
+
+def call_log_stats(db: Session, hours: int = 24) -> dict:
+    since = datetime.utcnow() - timedelta(hours=hours)
+    return {
+        "hours": hours,
+        "writer": call_log_writer.stats(),
+        "models": model_latency_stats(db, since),
+        "divination_types": divination_token_stats(db, since),
+    }
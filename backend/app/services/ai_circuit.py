@@ -0,0 +1,236 @@
+"""
+AI 服務斷路器模組
+
+每個 AI 服務端點（provider + base_url + API Key 指紋）一個斷路器：
+- closed：正常呼叫，統計時間窗內的失敗率
+- open：失敗率過高，直接拒絕呼叫（不再等到逾時）
+- half_open：冷卻時間過後放行少量探測請求，成功即恢復
+"""
+
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from app.core.config import get_settings
+from app.services.ai_retry import AIErrorKind, AIServiceError
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(AIServiceError):
+    """斷路器開啟，快速失敗"""
+
+    def __init__(self, breaker: "CircuitBreaker"):
+        super().__init__(
+            f"⚠️ AI 服務暫時無法使用（連續失敗，約 {int(breaker.retry_in()) + 1} 秒後重新嘗試），請稍後再試",
+            AIErrorKind.CIRCUIT_OPEN,
+        )
+        self.breaker_name = breaker.name
+
+
+class CircuitBreaker:
+    """以失敗率時間窗判斷的斷路器"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        window_seconds: float = 60.0,
+        min_calls: int = 4,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        """
+        Args:
+            name: 斷路器名稱
+            failure_rate_threshold: 時間窗內失敗率超過此值即跳脫
+            window_seconds: 失敗率統計時間窗（秒）
+            min_calls: 時間窗內至少幾次呼叫才判斷失敗率
+            open_seconds: 跳脫後多久進入 half_open 探測
+            half_open_max_calls: half_open 時同時放行的探測數
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CircuitState.CLOSED
+        self.opened_at: Optional[float] = None
+        self._half_open_calls = 0
+        self._results: deque[tuple[float, bool]] = deque()
+
+        self.trips = 0
+        self.recoveries = 0
+        self.rejected = 0
+        self.failovers = 0
+        self.events: deque[dict] = deque(maxlen=20)
+
+    # ----- 狀態 -----
+
+    def current_state(self) -> str:
+        """取得目前狀態（冷卻時間到時自動轉為 half_open）"""
+        if (
+            self.state == CircuitState.OPEN
+            and self.opened_at is not None
+            and time.monotonic() - self.opened_at >= self.open_seconds
+        ):
+            self._transition(CircuitState.HALF_OPEN, "冷卻結束，開始探測")
+            self._half_open_calls = 0
+        return self.state
+
+    def is_open(self) -> bool:
+        """是否處於拒絕呼叫的狀態"""
+        return self.current_state() == CircuitState.OPEN
+
+    def allow_request(self) -> bool:
+        """是否允許發出呼叫（half_open 時會佔用探測名額）"""
+        state = self.current_state()
+        if state == CircuitState.CLOSED:
+            return True
+        if (
+            state == CircuitState.HALF_OPEN
+            and self._half_open_calls < self.half_open_max_calls
+        ):
+            self._half_open_calls += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def retry_in(self) -> float:
+        """距離下次探測還有幾秒"""
+        if self.state != CircuitState.OPEN or self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    # ----- 記錄結果 -----
+
+    def record_success(self):
+        if self.state == CircuitState.HALF_OPEN:
+            self.recoveries += 1
+            self._results.clear()
+            self._transition(CircuitState.CLOSED, "探測成功，恢復服務")
+            return
+        self._record(True)
+
+    def record_failure(self, reason: str = ""):
+        if self.state == CircuitState.HALF_OPEN:
+            self._open(f"探測失敗 {reason}".strip())
+            return
+        self._record(False)
+
+        total = len(self._results)
+        failures = sum(1 for _, ok in self._results if not ok)
+        if (
+            self.state == CircuitState.CLOSED
+            and total >= self.min_calls
+            and failures / total >= self.failure_rate_threshold
+        ):
+            self._open(f"失敗率 {failures}/{total} {reason}".strip())
+
+    def release_probe(self):
+        """探測沒有結論（取消、金鑰無效等非服務端錯誤）：歸還探測名額，讓下一個請求重新探測"""
+        if self.state == CircuitState.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record_failover(self, target: str):
+        """記錄因斷路器開啟而切換到備援服務"""
+        self.failovers += 1
+        self.events.append(
+            {
+                "timestamp": datetime.now().isoformat(),
+                "from": self.state,
+                "to": self.state,
+                "reason": f"容錯切換至 {target}",
+            }
+        )
+
+    def _record(self, success: bool):
+        now = time.monotonic()
+        self._results.append((now, success))
+        cutoff = now - self.window_seconds
+        while self._results and self._results[0][0] < cutoff:
+            self._results.popleft()
+
+    def _open(self, reason: str):
+        self.trips += 1
+        self.opened_at = time.monotonic()
+        self._half_open_calls = 0
+        self._transition(CircuitState.OPEN, reason)
+
+    def _transition(self, state: str, reason: str):
+        previous = self.state
+        self.state = state
+        self.events.append(
+            {
+                "timestamp": datetime.now().isoformat(),
+                "from": previous,
+                "to": state,
+                "reason": reason,
+            }
+        )
+        log = logger.warning if state == CircuitState.OPEN else logger.info
+        log(f"AI 斷路器 [{self.name}] {previous} → {state}：{reason}")
+
+    def stats(self) -> dict:
+        total = len(self._results)
+        failures = sum(1 for _, ok in self._results if not ok)
+        return {
+            "name": self.name,
+            "state": self.current_state(),
+            "window_calls": total,
+            "window_failures": failures,
+            "retry_in": round(self.retry_in(), 1),
+            "trips": self.trips,
+            "recoveries": self.recoveries,
+            "rejected": self.rejected,
+            "failovers": self.failovers,
+            "events": list(self.events),
+        }
+
+
+class CircuitRegistry:
+    """依服務端點管理斷路器"""
+
+    def __init__(self):
+        self._breakers: dict[tuple[str, str, str], CircuitBreaker] = {}
+
+    def get(
+        self, provider: str, endpoint: str = "", credential: str = ""
+    ) -> CircuitBreaker:
+        key = (provider, endpoint, credential)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            settings = get_settings()
+            name = provider + (f"@{endpoint}" if endpoint else "")
+            if credential:
+                name += f"#{credential[:8]}"
+            breaker = CircuitBreaker(
+                name,
+                failure_rate_threshold=settings.AI_CIRCUIT_FAILURE_RATE,
+                window_seconds=settings.AI_CIRCUIT_WINDOW_SECONDS,
+                min_calls=settings.AI_CIRCUIT_MIN_CALLS,
+                open_seconds=settings.AI_CIRCUIT_OPEN_SECONDS,
+            )
+            self._breakers[key] = breaker
+        return breaker
+
+    def any_open(self) -> bool:
+        """是否有任何斷路器不處於 closed（快速路徑：全部正常時免查詢）"""
+        return any(b.state != CircuitState.CLOSED for b in self._breakers.values())
+
+    def stats(self) -> list[dict]:
+        return [breaker.stats() for breaker in self._breakers.values()]
+
+
+# 全局 AI 斷路器
+ai_circuits = CircuitRegistry()
@@ -0,0 +1,103 @@
+"""
+AI 任務期限模組
+
+建立 History 時即決定任務期限 (History.deadline_at = 建立時間 + AI_JOB_TIMEOUT_SECONDS)。
+背景任務依此建立 `Deadline`，之後每個步驟都只能使用剩餘的時間：
+- resolve_ai_config：已過期直接放棄；模型路由的延遲目標不超過剩餘時間
+- 重試策略：重試預算不超過剩餘時間
+- 單次 HTTP / SDK 呼叫：逾時設定不超過剩餘時間
+- 整段解盤以 asyncio.wait_for 包住，到期即取消，任務狀態設為 'timeout'
+"""
+
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Iterator, Optional
+
+from app.core.config import get_settings
+
+
+class DeadlineExceeded(Exception):
+    """任務超過期限"""
+
+    def __init__(self, message: str = "AI 解盤超過時間限制，已停止生成"):
+        super().__init__(message)
+
+
+def new_deadline_at() -> datetime:
+    """新任務的期限（建立 History 時寫入 deadline_at）"""
+    return datetime.utcnow() + timedelta(seconds=get_settings().AI_JOB_TIMEOUT_SECONDS)
+
+
+class Deadline:
+    """任務期限（以 UTC 時間表示，可跨程序保存於資料庫）"""
+
+    def __init__(self, expires_at: datetime):
+        self.expires_at = expires_at
+
+    @classmethod
+    def for_history(cls, history) -> "Deadline":
+        """依 History 建立期限（舊資料沒有 deadline_at 時從現在起算）"""
+        expires_at = getattr(history, "deadline_at", None) or new_deadline_at()
+        return cls(expires_at)
+
+    def remaining(self) -> float:
+        """剩餘秒數（已過期為 0）"""
+        return max(0.0, (self.expires_at - datetime.utcnow()).total_seconds())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self):
+        """已過期時拋出 DeadlineExceeded"""
+        if self.expired:
+            raise DeadlineExceeded()
+
+    def cap(self, seconds: float) -> float:
+        """將單一步驟的逾時限制在剩餘時間內"""
+        return min(seconds, self.remaining())
+
+    async def run(self, awaitable: Awaitable[Any]) -> Any:
+        """在剩餘時間內執行，到期即取消並拋出 DeadlineExceeded"""
+        self.check()
+        try:
+            return await asyncio.wait_for(awaitable, self.remaining())
+        except asyncio.TimeoutError as e:
+            raise DeadlineExceeded() from e
+        except Exception as e:
+            # 單次呼叫的逾時（已被限制在剩餘時間內）與期限同時到達
+            if self.expired:
+                raise DeadlineExceeded() from e
+            raise
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar(
+    "ai_job_deadline", default=None
+)
+
+
+@contextmanager
+def use_deadline(deadline: Optional[Deadline]) -> Iterator[None]:
+    """區塊內的 AI 呼叫（含對沖建立的子 task）都受此期限限制
+
+    請求合併的共用呼叫不套用任何一位呼叫者的期限，各呼叫者以自己的期限等待結果
+    """
+    token = _current_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def capped_timeout(seconds: float) -> float:
+    """目前任務期限內的單一步驟逾時（沒有期限時回傳原值）"""
+    deadline = current_deadline()
+    if deadline is None:
+        return seconds
+    return deadline.cap(seconds)
@@ -0,0 +1,238 @@
+"""
+AI 對沖請求 (hedged request) 模組
+
+主要服務在「首個 token 延遲」(TTFT) 的 p95 之內沒有回應時，
+同時向備援服務發出相同請求，先吐出第一個 token 的一方勝出。
+勝出者完成前另一方繼續執行：勝出者串流中途失敗時改用另一方的結果，勝出者完成後才取消另一方。
+TTFT 以 (provider, model) 分開統計，延遲時間會限制在設定的上下限之間。
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Optional
+
+from app.core.config import get_settings
+from app.services.ai import AIService
+from app.utils.stats import percentile
+
+logger = logging.getLogger(__name__)
+
+
+def service_key(service: AIService) -> str:
+    return f"{service.provider}/{service.model or '-'}"
+
+
+class TTFTTracker:
+    """記錄各 (provider, model) 最近的首個 token 延遲"""
+
+    def __init__(self, window: int = 200, min_samples: int = 10):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: dict[str, deque[float]] = defaultdict(
+            lambda: deque(maxlen=self.window)
+        )
+
+    def record(self, key: str, ttft: float):
+        self._samples[key].append(ttft)
+
+    def p95(self, key: str) -> Optional[float]:
+        """樣本不足時回傳 None"""
+        samples = self._samples.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        return percentile(list(samples), 0.95)
+
+    def hedge_delay(self, key: str) -> float:
+        """對沖延遲：TTFT p95，限制在設定上下限之間（樣本不足用預設值）"""
+        settings = get_settings()
+        p95 = self.p95(key)
+        if p95 is None:
+            return settings.AI_HEDGE_DEFAULT_DELAY
+        return min(settings.AI_HEDGE_MAX_DELAY, max(settings.AI_HEDGE_MIN_DELAY, p95))
+
+    def stats(self) -> dict:
+        result = {}
+        for key, samples in self._samples.items():
+            values = list(samples)
+            result[key] = {
+                "samples": len(values),
+                "p50": round(percentile(values, 0.5), 3) if values else None,
+                "p95": round(percentile(values, 0.95), 3) if values else None,
+                "hedge_delay": round(self.hedge_delay(key), 3),
+            }
+        return result
+
+
+class HedgeMetrics:
+    """對沖請求統計"""
+
+    def __init__(self):
+        self.calls = 0
+        self.hedged = 0  # 實際發出備援請求的次數
+        self.secondary_wins = 0
+        self.cancelled = 0  # 被取消的落敗請求
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "secondary_wins": self.secondary_wins,
+            "cancelled": self.cancelled,
+            "hedge_rate": round(self.hedged / self.calls, 3) if self.calls else 0,
+        }
+
+
+# 全局 TTFT 統計與對沖統計
+ttft_tracker = TTFTTracker()
+hedge_metrics = HedgeMetrics()
+
+
+@dataclass
+class HedgeResult:
+    """對沖請求結果"""
+
+    text: str
+    winner: str  # "primary" 或 "secondary"
+    hedged: bool  # 是否有發出備援請求
+
+
+class _Contender:
+    """一個參與競速的串流請求"""
+
+    def __init__(
+        self,
+        label: str,
+        service: AIService,
+        prompt: str,
+        system_prompt: str,
+        signals: asyncio.Queue,
+    ):
+        self.label = label
+        self.service = service
+        self.error: Optional[BaseException] = None
+        self._started = False
+        self._signals = signals
+        self.task = asyncio.create_task(self._run(prompt, system_prompt))
+
+    @property
+    def usable(self) -> bool:
+        """尚在執行或已成功完成（可作為勝出者中途失敗時的備援）"""
+        if self.error is not None:
+            return False
+        if not self.task.done():
+            return True
+        return not self.task.cancelled() and self.task.exception() is None
+
+    def _signal(self):
+        self._started = True
+        self._signals.put_nowait(self)
+
+    async def _run(self, prompt: str, system_prompt: str) -> str:
+        start = time.monotonic()
+        parts: list[str] = []
+        try:
+            async for chunk in self.service.generate_stream(prompt, system_prompt):
+                if not self._started:
+                    ttft_tracker.record(
+                        service_key(self.service), time.monotonic() - start
+                    )
+                    self._signal()
+                parts.append(chunk)
+        except Exception as e:
+            if not self._started:
+                self.error = e
+                self._signal()
+            raise
+        if not self._started:
+            self._signal()
+        return "".join(parts)
+
+
+async def hedged_generate(
+    primary: AIService,
+    secondary: Optional[AIService],
+    prompt: str,
+    system_prompt: str,
+    delay: Optional[float] = None,
+) -> HedgeResult:
+    """以對沖方式生成回應
+
+    Args:
+        primary: 主要服務
+        secondary: 備援服務（None 時只呼叫主要服務）
+        delay: 發出備援請求前等待首個 token 的秒數（None 時依 TTFT p95 計算）
+    """
+    if delay is None:
+        delay = ttft_tracker.hedge_delay(service_key(primary))
+
+    hedge_metrics.calls += 1
+    signals: asyncio.Queue = asyncio.Queue()
+    contenders = [_Contender("primary", primary, prompt, system_prompt, signals)]
+    hedge_at = time.monotonic() + delay
+    hedged = False
+
+    def start_secondary(reason: str):
+        nonlocal hedged
+        hedged = True
+        hedge_metrics.hedged += 1
+        logger.info(
+            f"AI 對沖：{service_key(primary)} {reason}，同時呼叫 {service_key(secondary)}"
+        )
+        contenders.append(
+            _Contender("secondary", secondary, prompt, system_prompt, signals)
+        )
+
+    try:
+        while True:
+            timeout = None
+            if secondary is not None and not hedged:
+                timeout = max(0.0, hedge_at - time.monotonic())
+            try:
+                contender = await asyncio.wait_for(signals.get(), timeout)
+            except asyncio.TimeoutError:
+                start_secondary(f"{delay:.1f}s 內未回應首個 token")
+                continue
+
+            if contender.error is None:
+                winner = contender
+                break
+            if secondary is not None and not hedged:
+                start_secondary("呼叫失敗")
+                continue
+            if all(c.error is not None for c in contenders):
+                raise contender.error
+
+        # 勝出者完成前保留其他請求，中途失敗時改用仍可用的一方（尚未對沖時立即發出備援）
+        while True:
+            try:
+                text = await winner.task
+                break
+            except Exception:
+                fallbacks = [c for c in contenders if c is not winner and c.usable]
+                if not fallbacks and secondary is not None and not hedged:
+                    start_secondary("串流中途失敗")
+                    fallbacks = [contenders[-1]]
+                if not fallbacks:
+                    raise
+                logger.info(
+                    f"AI 對沖：{service_key(winner.service)} 串流中途失敗，"
+                    f"改用 {service_key(fallbacks[0].service)}"
+                )
+                winner = fallbacks[0]
+
+        for contender in contenders:
+            if contender is not winner and not contender.task.done():
+                contender.task.cancel()
+                hedge_metrics.cancelled += 1
+    finally:
+        for contender in contenders:
+            if not contender.task.done():
+                contender.task.cancel()
+        await asyncio.gather(*(c.task for c in contenders), return_exceptions=True)
+
+    if winner.label == "secondary":
+        hedge_metrics.secondary_wins += 1
+    return HedgeResult(text=text, winner=winner.label, hedged=hedged)
@@ -0,0 +1,110 @@
+"""
+AI 任務登記模組
+
+每個背景解盤任務在獨立的 asyncio.Task 中執行，並以 history_id 登記。
+取消占卜時對該 Task 送出 cancel，CancelledError 會一路傳進 provider 呼叫
+（請求合併、對沖、串流讀取都會隨之關閉連線），不再為沒人看的結果付費。
+"""
+
+import asyncio
+import functools
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.history import History
+
+logger = logging.getLogger(__name__)
+
+
+def _cancelling(task: Optional[asyncio.Task]) -> bool:
+    """呼叫端本身是否正被取消（Task.cancelling 需 Python 3.11+）"""
+    cancelling = getattr(task, "cancelling", None)
+    return bool(cancelling and cancelling())
+
+
+class JobRegistry:
+    """history_id → 執行中的任務"""
+
+    def __init__(self):
+        self._tasks: dict[int, asyncio.Task] = {}
+        self.cancelled = 0
+
+    def get(self, history_id: int) -> Optional[asyncio.Task]:
+        return self._tasks.get(history_id)
+
+    async def run(self, history_id: int, job: Awaitable[Any]) -> Any:
+        """在獨立 Task 中執行任務，任務被取消時正常結束（不影響呼叫端）"""
+        task = asyncio.ensure_future(job)
+        previous = self._tasks.get(history_id)
+        if previous is not None and not previous.done():
+            logger.warning(f"History {history_id} 已有執行中的任務，改為追蹤新任務")
+        self._tasks[history_id] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task.cancelled() and not _cancelling(asyncio.current_task()):
+                logger.info(f"History {history_id} 的 AI 任務已取消")
+                return None
+            raise
+        finally:
+            if self._tasks.get(history_id) is task:
+                del self._tasks[history_id]
+
+    def cancel(self, history_id: int) -> bool:
+        """取消執行中的任務，回傳是否有任務被取消"""
+        task = self._tasks.get(history_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        self.cancelled += 1
+        return True
+
+    def stats(self) -> dict:
+        return {"running": sorted(self._tasks), "cancelled": self.cancelled}
+
+
+# 全局 AI 任務登記
+job_registry = JobRegistry()
+
+
+def cancellable_job(func: Callable[..., Awaitable[Any]]):
+    """背景任務裝飾器：第一個參數為 history_id，執行期間登記於 job_registry"""
+
+    @functools.wraps(func)
+    async def wrapper(history_id: int, *args, **kwargs):
+        return await job_registry.run(history_id, func(history_id, *args, **kwargs))
+
+    return wrapper
+
+
+def commit_result(db: Session, history: History) -> bool:
+    """寫入任務狀態與結果；期間已被取消時捨棄變更，保留 cancelled
+
+    先以條件式 UPDATE 寫入狀態（SQLite 同時取得寫入鎖），
+    確認紀錄未被取消後才提交其餘欄位，避免晚到的結果覆蓋取消狀態。
+
+    Returns:
+        是否寫入（False 代表已取消）
+    """
+    with db.no_autoflush:
+        result = db.execute(
+            update(History)
+            .where(History.id == history.id, History.status != "cancelled")
+            .values(status=history.status)
+            .execution_options(synchronize_session=False)
+        )
+    if result.rowcount == 0:
+        db.rollback()
+        logger.info(f"History {history.id} 已取消，捨棄任務結果")
+        return False
+    db.commit()
+    return True
+
+
+async def commit_result_async(db: AsyncSession, history: History) -> bool:
+    """commit_result 的 async 版本（背景任務使用 AsyncSession）"""
+    return await db.run_sync(commit_result, history)
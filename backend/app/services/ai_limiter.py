@@ -0,0 +1,228 @@
+"""
+AI 服務並行限制模組
+
+每個 (provider, base_url) 一個限制器：
+1. 最大同時進行數（AIMD 自適應：成功時加法遞增，429/503 或延遲暴增時乘法遞減）
+2. Token bucket 請求速率限制
+超出限制的請求會排隊等待，而不是直接打到 AI 服務被拒絕。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from app.core.config import get_settings
+from app.services.ai_retry import AIErrorKind, classify_error
+
+logger = logging.getLogger(__name__)
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """判斷錯誤是否代表 AI 服務過載 (429 / 503)"""
+    info = classify_error(error)
+    return info.kind == AIErrorKind.RATE_LIMITED or info.status_code == 503
+
+
+class AdaptiveLimiter:
+    """AIMD 自適應並行限制器 + Token bucket 速率限制"""
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 4,
+        min_concurrency: int = 1,
+        rate_per_second: float = 1.0,
+        burst: int = 4,
+        decrease_factor: float = 0.5,
+        latency_spike_factor: float = 3.0,
+    ):
+        """
+        Args:
+            name: 限制器名稱（provider@base_url）
+            max_concurrency: 最大同時進行數上限
+            min_concurrency: 過載時最少保留的同時進行數
+            rate_per_second: 每秒可發出的請求數（token 補充速率）
+            burst: token bucket 容量
+            decrease_factor: 過載時的乘法遞減係數
+            latency_spike_factor: 延遲超過平均值幾倍視為延遲暴增
+        """
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.rate_per_second = rate_per_second
+        self.burst = max(1, burst)
+        self.decrease_factor = decrease_factor
+        self.latency_spike_factor = latency_spike_factor
+
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._condition = asyncio.Condition()
+
+        self._latency_avg: Optional[float] = None
+        self._latency_samples = 0
+
+        self.total_requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+        self.decreases = 0
+
+    # ----- Token bucket -----
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.rate_per_second > 0:
+            self._tokens = min(
+                float(self.burst), self._tokens + elapsed * self.rate_per_second
+            )
+        else:
+            self._tokens = float(self.burst)
+
+    def _token_wait(self) -> float:
+        """取得下一個 token 需要等待的秒數"""
+        self._refill()
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate_per_second
+
+    # ----- 取得 / 釋放 -----
+
+    async def acquire(self) -> float:
+        """取得執行名額，回傳等待秒數"""
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._condition:
+                await self._condition.wait_for(
+                    lambda: self.in_flight < max(1, int(self.limit))
+                )
+                self.in_flight += 1
+
+            try:
+                while (wait := self._token_wait()) > 0:
+                    await asyncio.sleep(wait)
+                self._tokens -= 1
+            except BaseException:
+                await self._release_slot()
+                raise
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - start
+        self.total_requests += 1
+        self.total_wait += waited
+        self.last_wait = waited
+        self.max_wait = max(self.max_wait, waited)
+        if waited >= 1.0:
+            logger.info(f"AI 限制器 [{self.name}] 排隊等待 {waited:.2f}s")
+        return waited
+
+    async def release(self, latency: Optional[float] = None, overloaded: bool = False):
+        """釋放名額並依結果調整限制
+
+        Args:
+            latency: 本次呼叫耗時（秒），None 代表未完成（取消等）
+            overloaded: 是否收到過載錯誤 (429/503)
+        """
+        if overloaded:
+            self._decrease("過載回應")
+        elif latency is not None:
+            if self._is_latency_spike(latency):
+                self._decrease(f"延遲暴增 {latency:.1f}s")
+            else:
+                self.limit = min(
+                    float(self.max_concurrency), self.limit + 1.0 / self.limit
+                )
+            self._record_latency(latency)
+
+        await self._release_slot()
+
+    async def _release_slot(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def _decrease(self, reason: str):
+        new_limit = max(float(self.min_concurrency), self.limit * self.decrease_factor)
+        if new_limit < self.limit:
+            self.decreases += 1
+            logger.warning(
+                f"AI 限制器 [{self.name}] {reason}，同時進行數 {self.limit:.1f} → {new_limit:.1f}"
+            )
+        self.limit = new_limit
+
+    # ----- 延遲追蹤 -----
+
+    def _is_latency_spike(self, latency: float) -> bool:
+        if self._latency_avg is None or self._latency_samples < 5:
+            return False
+        return latency > self._latency_avg * self.latency_spike_factor
+
+    def _record_latency(self, latency: float):
+        """以指數移動平均記錄延遲"""
+        self._latency_samples += 1
+        if self._latency_avg is None:
+            self._latency_avg = latency
+        else:
+            self._latency_avg = self._latency_avg * 0.8 + latency * 0.2
+
+    def stats(self) -> dict:
+        """統計資訊"""
+        return {
+            "name": self.name,
+            "limit": round(self.limit, 2),
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rate_per_second": self.rate_per_second,
+            "total_requests": self.total_requests,
+            "average_wait": round(self.total_wait / self.total_requests, 3)
+            if self.total_requests
+            else 0,
+            "max_wait": round(self.max_wait, 3),
+            "last_wait": round(self.last_wait, 3),
+            "average_latency": round(self._latency_avg, 3)
+            if self._latency_avg is not None
+            else None,
+            "decreases": self.decreases,
+        }
+
+
+class LimiterRegistry:
+    """依 (provider, base_url) 管理限制器"""
+
+    def __init__(self):
+        self._limiters: dict[tuple[str, str], AdaptiveLimiter] = {}
+
+    def get(self, provider: str, base_url: str = "") -> AdaptiveLimiter:
+        key = (provider, base_url)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            settings = get_settings()
+            options = {
+                "max_concurrency": settings.AI_LIMITER_MAX_CONCURRENCY,
+                "rate_per_second": settings.AI_LIMITER_RATE_PER_SECOND,
+                "burst": settings.AI_LIMITER_BURST,
+            }
+            options.update(settings.AI_LIMITER_OVERRIDES.get(provider, {}))
+            name = f"{provider}@{base_url}" if base_url else provider
+            limiter = AdaptiveLimiter(name, **options)
+            self._limiters[key] = limiter
+        return limiter
+
+    def all(self) -> list[AdaptiveLimiter]:
+        return list(self._limiters.values())
+
+    def stats(self) -> list[dict]:
+        return [limiter.stats() for limiter in self._limiters.values()]
+
+
+# 全局 AI 限制器
+ai_limiters = LimiterRegistry()
@@ -0,0 +1,322 @@
+"""
+AI 服務重試策略模組
+
+所有 AI provider 共用的重試邏輯：
+1. 錯誤分類（429、5xx、逾時、連線中斷、不可重試的 4xx）
+2. 指數退避 + decorrelated jitter
+3. 遵守 Retry-After（或 Gemini 的 retryDelay）
+4. 每個任務的重試時間預算
+5. 依 provider 記錄重試統計
+"""
+
+import asyncio
+import logging
+import random
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+
+from app.core.config import get_settings
+from app.services.ai_deadline import capped_timeout
+
+logger = logging.getLogger(__name__)
+
+
+class AIErrorKind:
+    """AI 呼叫錯誤類型"""
+
+    RATE_LIMITED = "rate_limited"  # 429
+    SERVER_ERROR = "server_error"  # 5xx
+    TIMEOUT = "timeout"
+    CONNECTION = "connection"  # 連線被拒 / 重置
+    CLIENT_ERROR = "client_error"  # 其他 4xx（參數錯誤、金鑰無效）
+    CIRCUIT_OPEN = "circuit_open"  # 斷路器開啟，未實際呼叫
+    UNKNOWN = "unknown"
+
+
+RETRYABLE_KINDS = {
+    AIErrorKind.RATE_LIMITED,
+    AIErrorKind.SERVER_ERROR,
+    AIErrorKind.TIMEOUT,
+    AIErrorKind.CONNECTION,
+}
+
+# 重試用盡後回給使用者的訊息
+FRIENDLY_MESSAGES = {
+    AIErrorKind.RATE_LIMITED: "⚠️ {provider} API 請求過於頻繁或配額已用完，請稍後再試或檢查 API 配額限制",
+    AIErrorKind.SERVER_ERROR: "⚠️ {provider} API 服務暫時不可用，已重試多次仍失敗，請稍後再試",
+    AIErrorKind.TIMEOUT: "⚠️ {provider} API 回應逾時，已重試多次仍失敗，請稍後再試",
+    AIErrorKind.CONNECTION: "⚠️ 無法連線到 {provider} API 服務，請確認服務是否正常運作",
+}
+
+
+@dataclass
+class ErrorClassification:
+    """錯誤分類結果"""
+
+    kind: str
+    status_code: Optional[int] = None
+    retry_after: Optional[float] = None  # 伺服器要求的等待秒數
+
+    @property
+    def retryable(self) -> bool:
+        return self.kind in RETRYABLE_KINDS
+
+
+class AIServiceError(Exception):
+    """AI 服務呼叫失敗（已分類，訊息可直接顯示給使用者）"""
+
+    def __init__(
+        self,
+        message: str,
+        kind: str,
+        status_code: Optional[int] = None,
+        attempts: int = 1,
+    ):
+        super().__init__(message)
+        self.kind = kind
+        self.status_code = status_code
+        self.attempts = attempts
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 標頭（秒數或 HTTP 日期）"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _status_code_of(error: BaseException) -> Optional[int]:
+    """從各 SDK 的例外取出 HTTP 狀態碼"""
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    if isinstance(value, int):
+        return value
+    return None
+
+
+def _retry_after_of(error: BaseException) -> Optional[float]:
+    """從例外取出伺服器指定的等待時間"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            retry_after = parse_retry_after(headers.get("retry-after"))
+        except AttributeError:
+            retry_after = None
+        if retry_after is not None:
+            return retry_after
+
+    # Gemini：錯誤內容帶有 RetryInfo，例如 "retryDelay": "12s"
+    match = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(error))
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def classify_error(error: BaseException) -> ErrorClassification:
+    """將 AI 呼叫例外分類"""
+    if isinstance(error, AIServiceError):
+        return ErrorClassification(error.kind, error.status_code)
+
+    retry_after = _retry_after_of(error)
+    status_code = _status_code_of(error)
+
+    if status_code is not None:
+        if status_code == 429:
+            return ErrorClassification(AIErrorKind.RATE_LIMITED, 429, retry_after)
+        if status_code == 408:
+            return ErrorClassification(AIErrorKind.TIMEOUT, 408, retry_after)
+        if status_code >= 500:
+            return ErrorClassification(
+                AIErrorKind.SERVER_ERROR, status_code, retry_after
+            )
+        if status_code >= 400:
+            return ErrorClassification(AIErrorKind.CLIENT_ERROR, status_code)
+
+    if isinstance(error, (httpx.TimeoutException, asyncio.TimeoutError, TimeoutError)):
+        return ErrorClassification(AIErrorKind.TIMEOUT)
+    if isinstance(
+        error,
+        (
+            httpx.ConnectError,
+            httpx.ReadError,
+            httpx.RemoteProtocolError,
+            ConnectionError,
+        ),
+    ):
+        return ErrorClassification(AIErrorKind.CONNECTION)
+
+    # SDK 自訂例外（openai.APITimeoutError / APIConnectionError 等）以類別名稱判斷
+    type_name = type(error).__name__
+    if "Timeout" in type_name:
+        return ErrorClassification(AIErrorKind.TIMEOUT)
+    if "Connection" in type_name:
+        return ErrorClassification(AIErrorKind.CONNECTION)
+
+    # 最後手段：比對錯誤訊息
+    error_str = str(error)
+    if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
+        return ErrorClassification(AIErrorKind.RATE_LIMITED, 429, retry_after)
+    match = re.search(r"\b(5\d\d)\b", error_str)
+    if match or "Service Unavailable" in error_str or "UNAVAILABLE" in error_str:
+        code = int(match.group(1)) if match else 503
+        return ErrorClassification(AIErrorKind.SERVER_ERROR, code, retry_after)
+
+    return ErrorClassification(AIErrorKind.UNKNOWN)
+
+
+class RetryMetrics:
+    """依 provider 統計重試次數"""
+
+    def __init__(self):
+        self._stats: dict[str, dict] = defaultdict(
+            lambda: {
+                "calls": 0,
+                "attempts": 0,
+                "retries": 0,
+                "give_ups": 0,
+                "retry_sleep_seconds": 0.0,
+                "errors": defaultdict(int),
+            }
+        )
+
+    def record_call(self, provider: str, attempts: int):
+        stats = self._stats[provider]
+        stats["calls"] += 1
+        stats["attempts"] += attempts
+
+    def record_retry(self, provider: str, kind: str, delay: float):
+        stats = self._stats[provider]
+        stats["retries"] += 1
+        stats["errors"][kind] += 1
+        stats["retry_sleep_seconds"] += delay
+
+    def record_give_up(self, provider: str, kind: str):
+        stats = self._stats[provider]
+        stats["give_ups"] += 1
+        stats["errors"][kind] += 1
+
+    def stats(self) -> dict:
+        return {
+            provider: {
+                **stats,
+                "retry_sleep_seconds": round(stats["retry_sleep_seconds"], 3),
+                "errors": dict(stats["errors"]),
+            }
+            for provider, stats in self._stats.items()
+        }
+
+
+# 全局重試統計
+retry_metrics = RetryMetrics()
+
+
+class RetryPolicy:
+    """AI 呼叫重試策略"""
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        budget_seconds: float = 120.0,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ):
+        """
+        Args:
+            max_attempts: 最多嘗試次數（含第一次）
+            base_delay: 退避的最小等待秒數
+            max_delay: 單次退避的最大等待秒數
+            budget_seconds: 整個任務可用於重試的總時間
+            sleep: 等待函數（測試時可替換）
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_seconds = budget_seconds
+        self._sleep = sleep
+
+    @classmethod
+    def from_settings(cls) -> "RetryPolicy":
+        settings = get_settings()
+        return cls(
+            max_attempts=settings.AI_RETRY_MAX_ATTEMPTS,
+            base_delay=settings.AI_RETRY_BASE_DELAY,
+            max_delay=settings.AI_RETRY_MAX_DELAY,
+            # 重試預算不超過任務剩餘時間
+            budget_seconds=capped_timeout(settings.AI_RETRY_BUDGET_SECONDS),
+        )
+
+    def next_delay(self, previous: float) -> float:
+        """Decorrelated jitter：在 [base, previous * 3] 之間隨機取值"""
+        upper = max(self.base_delay, previous * 3)
+        return min(self.max_delay, random.uniform(self.base_delay, upper))
+
+    async def run(self, func: Callable[[], Awaitable[Any]], provider: str = "") -> Any:
+        """執行 func，遇到可重試的錯誤時依策略重試"""
+        start = time.monotonic()
+        delay = self.base_delay
+        attempt = 0
+
+        while True:
+            attempt += 1
+            try:
+                result = await func()
+                retry_metrics.record_call(provider, attempt)
+                return result
+            except Exception as e:
+                info = classify_error(e)
+                if not info.retryable:
+                    retry_metrics.record_call(provider, attempt)
+                    raise
+
+                delay = self.next_delay(delay)
+                if info.retry_after is not None:
+                    delay = max(delay, info.retry_after)
+
+                elapsed = time.monotonic() - start
+                if (
+                    attempt >= self.max_attempts
+                    or elapsed + delay > self.budget_seconds
+                ):
+                    retry_metrics.record_call(provider, attempt)
+                    retry_metrics.record_give_up(provider, info.kind)
+                    logger.error(
+                        f"{provider} API {info.kind} ({info.status_code or '-'})，"
+                        f"已嘗試 {attempt} 次，放棄重試: {e}"
+                    )
+                    message = FRIENDLY_MESSAGES[info.kind].format(
+                        provider=provider.capitalize() or "AI"
+                    )
+                    raise AIServiceError(
+                        message, info.kind, info.status_code, attempt
+                    ) from e
+
+                retry_metrics.record_retry(provider, info.kind, delay)
+                logger.warning(
+                    f"{provider} API {info.kind} ({info.status_code or '-'})，"
+                    f"{delay:.2f}s 後重試 (Attempt {attempt}/{self.max_attempts})"
+                )
+                await self._sleep(delay)
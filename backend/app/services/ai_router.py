@@ -0,0 +1,270 @@
+"""
+AI 模型路由模組
+
+依 (provider, model) 維護滾動統計：首個 token 延遲 (TTFT)、總延遲、tokens/sec、錯誤率，
+在多個可用配置之間選出能達成延遲目標 (SLO) 且成本最低的一個。
+串流呼叫以 TTFT 判斷 SLO；一般（非串流）呼叫整段回應同時到達，以總延遲對照另一個目標。
+每次決策都會記錄理由，供管理員於 /api/debug/ai 查看。
+"""
+
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Optional
+
+from app.core.config import get_settings
+from app.utils.stats import percentile
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗估 token 數：中日韓文字每字約 1 token，其他字元約 4 字元 1 token"""
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class CallRecord:
+    """單次 AI 呼叫的觀測資料（由 AIService 在呼叫過程中填入）"""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.output_tokens = 0
+
+    def add_output(self, text: str):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        if text:
+            self.output_tokens += estimate_tokens(text)
+
+
+class ModelStats:
+    """單一 (provider, model) 的滾動統計"""
+
+    def __init__(self, window_seconds: float = 600.0, max_samples: int = 500):
+        self.window_seconds = window_seconds
+        # (時間, 是否成功, TTFT, tokens/sec, 總延遲)
+        self._samples: deque[tuple] = deque(maxlen=max_samples)
+
+    def record(
+        self,
+        ok: bool,
+        ttft: Optional[float] = None,
+        tokens_per_second: Optional[float] = None,
+        latency: Optional[float] = None,
+    ):
+        self._samples.append((time.monotonic(), ok, ttft, tokens_per_second, latency))
+
+    def _window(self) -> list[tuple]:
+        cutoff = time.monotonic() - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return list(self._samples)
+
+    def summary(self) -> dict:
+        samples = self._window()
+        ttfts = [s[2] for s in samples if s[1] and s[2] is not None]
+        rates = [s[3] for s in samples if s[1] and s[3] is not None]
+        latencies = [s[4] for s in samples if s[1] and s[4] is not None]
+        errors = sum(1 for s in samples if not s[1])
+        return {
+            "samples": len(samples),
+            "ttft_samples": len(ttfts),
+            "ttft_p50": round(percentile(ttfts, 0.5), 3) if ttfts else None,
+            "ttft_p95": round(percentile(ttfts, 0.95), 3) if ttfts else None,
+            "latency_samples": len(latencies),
+            "latency_p95": round(percentile(latencies, 0.95), 3) if latencies else None,
+            "tokens_per_second": round(sum(rates) / len(rates), 1) if rates else None,
+            "error_rate": round(errors / len(samples), 3) if samples else 0.0,
+        }
+
+
+@dataclass
+class RouteCandidate:
+    """路由候選配置"""
+
+    config: Any
+    provider: str  # AIService.provider
+    model: str
+    cost: float = 1.0
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}/{self.model}"
+
+
+@dataclass
+class RouteDecision:
+    """路由決策（含每個候選的統計，方便事後解釋）"""
+
+    config: Any
+    chosen: str
+    reason: str
+    candidates: list[dict] = field(default_factory=list)
+
+
+class ModelRouter:
+    """延遲與成本感知的模型路由"""
+
+    def __init__(self, min_samples: int = 5, max_decisions: int = 50):
+        self.min_samples = min_samples
+        self._stats: dict[tuple[str, str], ModelStats] = {}
+        self.decisions: deque[dict] = deque(maxlen=max_decisions)
+
+    def stats_for(self, provider: str, model: str) -> ModelStats:
+        key = (provider, model or "")
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = ModelStats(window_seconds=get_settings().AI_ROUTER_WINDOW_SECONDS)
+            self._stats[key] = stats
+        return stats
+
+    # ----- 記錄 -----
+
+    def record_success(
+        self, provider: str, model: str, call: CallRecord, streamed: bool = False
+    ):
+        """記錄成功的呼叫
+
+        非串流呼叫整段輸出同時到達，首個輸出時間即總耗時，不計入 TTFT（計入總延遲與 tokens/sec）
+        """
+        end = time.monotonic()
+        ttft = None
+        generation_time = end - call.start
+        if streamed and call.first_token_at is not None:
+            ttft = call.first_token_at - call.start
+            if end - call.first_token_at >= 0.001:
+                generation_time = end - call.first_token_at
+
+        tokens_per_second = None
+        if call.output_tokens and generation_time > 0:
+            tokens_per_second = call.output_tokens / generation_time
+        self.stats_for(provider, model).record(
+            True, ttft, tokens_per_second, latency=end - call.start
+        )
+
+    def record_failure(self, provider: str, model: str):
+        self.stats_for(provider, model).record(False)
+
+    # ----- 決策 -----
+
+    def _latency_of(
+        self, summary: dict, slo_seconds: float, latency_slo_seconds: Optional[float]
+    ) -> Optional[tuple[str, float, float]]:
+        """判斷 SLO 用的延遲：(指標名稱, p95, 目標)；TTFT 樣本足夠時優先，其次為總延遲，都不足時為 None"""
+        if summary["ttft_samples"] >= self.min_samples:
+            return "TTFT", summary["ttft_p95"], slo_seconds
+        if (
+            latency_slo_seconds is not None
+            and summary["latency_samples"] >= self.min_samples
+        ):
+            return "總延遲", summary["latency_p95"], latency_slo_seconds
+        return None
+
+    def choose(
+        self,
+        candidates: list[RouteCandidate],
+        slo_seconds: float,
+        max_error_rate: float = 0.5,
+        context: str = "",
+        latency_slo_seconds: Optional[float] = None,
+    ) -> RouteDecision:
+        """選出配置
+
+        規則（依序）：
+        1. 錯誤率超過 max_error_rate 的候選排除（全部超過則不排除）
+        2. 達成 SLO 者中，選成本最低、順序最前者：有串流樣本時為 TTFT p95 ≤ slo_seconds，
+           只有非串流樣本時為總延遲 p95 ≤ latency_slo_seconds（None 時不判斷），樣本不足視為達成
+        3. 沒有任何候選達成 SLO 時，選錯誤率加權後延遲（相對於各自目標）最低者
+        """
+        evaluated = []
+        for index, candidate in enumerate(candidates):
+            summary = self.stats_for(candidate.provider, candidate.model).summary()
+            latency = self._latency_of(summary, slo_seconds, latency_slo_seconds)
+            evaluated.append(
+                {
+                    "index": index,
+                    "candidate": candidate,
+                    "known": latency is not None,
+                    "latency": latency,
+                    "healthy": summary["error_rate"] <= max_error_rate,
+                    "meets_slo": latency is None or latency[1] <= latency[2],
+                    "summary": summary,
+                }
+            )
+
+        pool = [e for e in evaluated if e["healthy"]] or evaluated
+        within_slo = [e for e in pool if e["meets_slo"]]
+        if within_slo:
+            best = min(within_slo, key=lambda e: (e["candidate"].cost, e["index"]))
+            if best["known"]:
+                metric, p95, target = best["latency"]
+                reason = (
+                    f"{metric} p95 {p95}s ≤ SLO {target}s，"
+                    f"成本 {best['candidate'].cost}"
+                )
+            else:
+                reason = f"樣本不足（{best['summary']['samples']} 筆），視為符合 SLO"
+            if best["index"] > 0:
+                skipped = evaluated[0]
+                if not skipped["healthy"]:
+                    reason += f"；{skipped['candidate'].name} 錯誤率 {skipped['summary']['error_rate']} 過高"
+                elif not skipped["meets_slo"]:
+                    metric, p95, _ = skipped["latency"]
+                    reason += (
+                        f"；{skipped['candidate'].name} {metric} p95 {p95}s 超過 SLO"
+                    )
+        else:
+            best = min(
+                pool,
+                key=lambda e: (
+                    e["latency"][1]
+                    / max(e["latency"][2], 0.001)
+                    * (1 + e["summary"]["error_rate"])
+                ),
+            )
+            metric, p95, target = best["latency"]
+            reason = f"所有候選皆超過 SLO，選延遲最低者（{metric} p95 {p95}s，SLO {target}s）"
+
+        decision = RouteDecision(
+            config=best["candidate"].config,
+            chosen=best["candidate"].name,
+            reason=reason,
+            candidates=[
+                {
+                    "name": e["candidate"].name,
+                    "cost": e["candidate"].cost,
+                    "meets_slo": e["meets_slo"],
+                    "healthy": e["healthy"],
+                    **e["summary"],
+                }
+                for e in evaluated
+            ],
+        )
+        self.decisions.append(
+            {
+                "timestamp": datetime.now().isoformat(),
+                "context": context,
+                "chosen": decision.chosen,
+                "reason": decision.reason,
+                "candidates": decision.candidates,
+            }
+        )
+        logger.info(f"AI 路由 {context}：選擇 {decision.chosen}（{decision.reason}）")
+        return decision
+
+    def stats(self) -> dict:
+        return {
+            "models": {
+                f"{provider}/{model}": stats.summary()
+                for (provider, model), stats in self._stats.items()
+            },
+            "decisions": list(self.decisions),
+        }
+
+
+# 全局 AI 模型路由
+model_router = ModelRouter()
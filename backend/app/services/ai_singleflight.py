@@ -0,0 +1,97 @@
+"""
+AI 請求合併 (Single-flight) 模組
+
+同一時間內多個呼叫者送出完全相同的 AI 請求時（重複點擊送出、平行重試），
+只實際呼叫一次 AI 服務，其餘呼叫者等待同一個進行中的結果。
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+from app.services.ai_deadline import current_deadline, use_deadline
+from app.services.ai_usage import TokenUsage, report_job_usage, track_usage
+
+logger = logging.getLogger(__name__)
+
+
+class _InFlightCall:
+    """進行中的共用呼叫"""
+
+    def __init__(self, func: Callable[[], Awaitable[Any]]):
+        self.usage = TokenUsage()
+        self.waiters = 0
+        self.task = asyncio.create_task(self._run(func))
+
+    async def _run(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        # 共用呼叫不套用發起者的任務期限（各呼叫者以自己的期限等待），
+        # 用量另外累計，結束後計入每位呼叫者的任務
+        with use_deadline(None), track_usage() as usage:
+            self.usage = usage
+            return await func()
+
+
+class SingleFlight:
+    """以 key 合併並行中的相同請求
+
+    - 同 key 的呼叫者共用同一個 asyncio.Task
+    - 每位呼叫者以自己的任務期限等待結果；被取消或超過期限時不影響其他等待者（透過 asyncio.shield）
+    - 所有等待者都離開後才取消底層呼叫，避免繼續消耗 AI 額度；
+      取消前先移除紀錄，之後的相同請求會重新發出呼叫，不會拿到別人造成的 CancelledError
+    - 共用呼叫的 token 用量計入每位呼叫者的任務用量（各自的結果都由這次呼叫產生）；
+      AI 呼叫紀錄（ai_call_log）只有一筆，關聯到發起者的歷史紀錄與階段
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _InFlightCall] = {}
+        self.leaders = 0  # 實際發出的呼叫數
+        self.followers = 0  # 搭便車共用結果的呼叫數
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """執行 func，若相同 key 已在進行中則等待既有結果"""
+        call = self._calls.get(key)
+        if call is None or call.task.done():
+            call = _InFlightCall(func)
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _t, c=call: self._forget(key, c))
+            self.leaders += 1
+        else:
+            self.followers += 1
+            logger.info(f"Single-flight: 共用進行中的 AI 請求 ({key[:12]})")
+
+        deadline = current_deadline()
+        call.waiters += 1
+        try:
+            if deadline is None:
+                return await asyncio.shield(call.task)
+            deadline.check()
+            return await deadline.run(asyncio.shield(call.task))
+        finally:
+            call.waiters -= 1
+            if call.task.done():
+                report_job_usage(call.usage)
+            elif call.waiters == 0:
+                # 最後一位等待者離開（被取消或超過期限），停止底層呼叫
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _InFlightCall):
+        """呼叫結束後移除紀錄（僅移除同一個呼叫，避免誤刪新的呼叫）"""
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        """目前進行中的共用呼叫數"""
+        return len(self._calls)
+
+    def stats(self) -> dict:
+        """統計資訊"""
+        return {
+            "in_flight": self.in_flight(),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
+
+
+# 全局 AI 請求合併器
+ai_singleflight = SingleFlight()
@@ -4,42 +4,87 @@ AI 背景任務處理模組
 """
 
 import json
+import logging
 from datetime import datetime
-from pathlib import Path
+from typing import Optional
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.config import BASE_DIR, get_settings
+from app.core.config import get_settings
+from app.core.database import get_job_session_factory
 from app.models.history import History
 from app.models.settings import AIConfig
 from app.models.user import User
 from app.schemas.ziwei import ZiweiBirthDetails, ZiweiProcessRequest, ZiweiQuerySettings
-from app.services.ai import get_ai_service
+from app.services.ai import (
+    AIService,
+    OpenCodeService,
+    credential_fingerprint,
+    get_ai_service,
+    service_identity,
+)
+from app.services.ai_call_log import log_calls
+from app.services.ai_circuit import CircuitBreaker, CircuitOpenError, ai_circuits
+from app.services.ai_deadline import Deadline, DeadlineExceeded, use_deadline
+from app.services.ai_hedging import hedged_generate
+from app.services.ai_jobs import cancellable_job, commit_result_async
+from app.services.ai_retry import classify_error
+from app.services.ai_router import RouteCandidate, model_router
+from app.services.ai_usage import TokenUsage, track_usage
+from app.services.prompt_layout import build_layout
+from app.services.prompt_registry import (
+    CompiledTemplate,
+    PromptTemplate,
+    combine_versions,
+    prompt_registry,
+)
 from app.services.ziwei_service import ziwei_service
 from app.utils.auth import decrypt_api_key
 
+logger = logging.getLogger(__name__)
+
 
 # 用於 Tarot Prompt 讀取
-def get_tarot_system_prompt(spread_type: str) -> str:
-    """根據牌陣類型讀取對應的 system prompt"""
-    prompt_files = {
-        "three_card": "tarot_system_prompt_three_card.md",
-        "single": "tarot_system_prompt_single.md",
-        "celtic_cross": "tarot_system_prompt_celtic_cross.md",
+def get_tarot_system_prompt(spread_type: str) -> PromptTemplate:
+    """根據牌陣類型取得對應的 system prompt 模板"""
+    prompt_names = {
+        "three_card": "tarot_system_prompt_three_card",
+        "single": "tarot_system_prompt_single",
+        "celtic_cross": "tarot_system_prompt_celtic_cross",
     }
 
-    filename = prompt_files.get(spread_type, "tarot_system_prompt_three_card.md")
-    prompt_path = Path(BASE_DIR) / "prompts" / filename
+    return prompt_registry.get(
+        prompt_names.get(spread_type, "tarot_system_prompt_three_card")
+    )
 
-    if prompt_path.exists():
-        return prompt_path.read_text(encoding="utf-8")
-    else:
-        raise FileNotFoundError(f"找不到 Prompt 檔案：{filename}")
+
+def format_tarot_card(card: dict) -> str:
+    """牌面描述，例如 '愚者 (The Fool) (Reversed)'"""
+    orientation = "(Reversed)" if card.get("reversed") else "(Upright)"
+    return f"{card['name_cn']} ({card['name']}) {orientation}"
+
+
+def get_mode_instruction(mode: Optional[str]) -> Optional[PromptTemplate]:
+    """取得解盤模式對應的 prompt 補充說明（standard 無額外說明）"""
+    return prompt_registry.find(f"mode_{mode}") if mode else None
+
+
+def add_prompt_version(history: History, template: Optional[PromptTemplate]):
+    """將附加模板的版本加入 History.prompt_version"""
+    if template is not None:
+        tags = [history.prompt_version, template.version_tag]
+        history.prompt_version = "+".join(tag for tag in tags if tag)
+
+
+DEFAULT_AI_MODEL = OpenCodeService.DEFAULT_MODEL
 
 
-def get_default_ai_config(db, user_id: int):
-    """為未設定自訂 AI 服務的用戶建立預設配置（opencode）"""
+def get_default_ai_config(db, user_id: int, model: Optional[str] = None):
+    """為未設定自訂 AI 服務的用戶建立預設配置（opencode）
+
+    Args:
+        model: 指定模型（模型路由從管理員設定的模型池選擇時使用）
+    """
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         return None
@@ -60,196 +105,493 @@ def get_default_ai_config(db, user_id: int):
     class DefaultAIConfig:
         provider = "opencode"
         local_url = None  # get_ai_service('opencode') 不使用 local_url
-        effective_model = "deepseek-v4-flash"
+        effective_model = model or DEFAULT_AI_MODEL
         api_key_encrypted = None
         _api_key = opencode_api_key
 
     return DefaultAIConfig()
 
 
-def resolve_ai_config(db, user_id: int, use_default: bool = False):
+def get_config_api_key(ai_config) -> Optional[str]:
+    """取得 AI 配置的 API Key（預設配置為明文，使用者配置需解密）"""
+    if hasattr(ai_config, "_api_key"):
+        return ai_config._api_key
+    if ai_config.api_key_encrypted:
+        return decrypt_api_key(ai_config.api_key_encrypted)
+    return None
+
+
+def get_config_circuit(ai_config) -> CircuitBreaker:
+    """取得 AI 配置對應服務端點的斷路器"""
+    provider, endpoint = service_identity(ai_config.provider, ai_config.local_url)
+    return ai_circuits.get(
+        provider, endpoint, credential_fingerprint(get_config_api_key(ai_config))
+    )
+
+
+def build_ai_service(ai_config, mode: Optional[str] = None) -> AIService:
+    """依 AI 配置建立 AI 服務實例（mode 為解盤模式）"""
+    return get_ai_service(
+        ai_config.provider,
+        mode=mode,
+        api_key=get_config_api_key(ai_config),
+        base_url=ai_config.local_url,
+        model=ai_config.effective_model,
+    )
+
+
+def resolve_ai_config(
+    db, user_id: int, use_default: bool = False, deadline: Optional[Deadline] = None
+):
     """決定背景任務使用的 AI 配置
 
     - use_default=True（使用者明確選預設）→ 直接使用預設配置
     - 否則：有 active config 用使用者的，沒有則 fallback 預設
+    - 選定配置的斷路器開啟時，依使用者的容錯策略切換備援或快速失敗
+    - 任務已超過期限時拋出 DeadlineExceeded（例如排隊太久）
     """
+    if deadline is not None:
+        deadline.check()
+
     if use_default:
-        return get_default_ai_config(db, user_id)
+        ai_config = get_default_ai_config(db, user_id)
+    else:
+        ai_config = (
+            db.query(AIConfig)
+            .filter(AIConfig.user_id == user_id, AIConfig.is_active)
+            .first()
+        )
+        if not ai_config:
+            ai_config = get_default_ai_config(db, user_id)
+
+    if ai_config is not None and get_settings().AI_ROUTER_ENABLED:
+        ai_config = route_ai_config(db, user_id, ai_config, deadline)
 
-    ai_config = (
-        db.query(AIConfig)
-        .filter(AIConfig.user_id == user_id, AIConfig.is_active)
-        .first()
+    # 快速路徑：所有斷路器皆正常時不需檢查
+    if ai_config is None or not ai_circuits.any_open():
+        return ai_config
+
+    return apply_failover_policy(db, user_id, ai_config)
+
+
+def route_ai_config(db, user_id: int, ai_config, deadline: Optional[Deadline] = None):
+    """依模型路由在可用配置間選擇
+
+    - 預設配置：從管理員設定的模型池 (AI_ROUTER_DEFAULT_POOL) 選擇
+    - 使用者配置：從該使用者的所有 AI 設定選擇，啟用中的設定優先
+    - 延遲目標不超過任務剩餘時間
+    """
+    settings = get_settings()
+
+    if isinstance(ai_config, AIConfig):
+        configs = db.query(AIConfig).filter(AIConfig.user_id == user_id).all()
+        configs.sort(key=lambda c: c is not ai_config)
+        candidates = [
+            RouteCandidate(
+                config,
+                service_identity(config.provider, config.local_url)[0],
+                config.effective_model,
+            )
+            for config in configs
+        ]
+    else:
+        pool = settings.AI_ROUTER_DEFAULT_POOL or [{"model": DEFAULT_AI_MODEL}]
+        candidates = []
+        for entry in pool:
+            config = get_default_ai_config(db, user_id, model=entry["model"])
+            if config is not None:
+                candidates.append(
+                    RouteCandidate(
+                        config,
+                        "opencode",
+                        config.effective_model,
+                        cost=entry.get("cost", 1.0),
+                    )
+                )
+
+    if len(candidates) <= 1:
+        return ai_config
+
+    slo_seconds = settings.AI_ROUTER_SLO_SECONDS
+    latency_slo_seconds = settings.AI_ROUTER_LATENCY_SLO_SECONDS
+    if deadline is not None:
+        slo_seconds = deadline.cap(slo_seconds)
+        latency_slo_seconds = deadline.cap(latency_slo_seconds)
+    decision = model_router.choose(
+        candidates,
+        slo_seconds,
+        max_error_rate=settings.AI_ROUTER_MAX_ERROR_RATE,
+        context=f"user={user_id}",
+        latency_slo_seconds=latency_slo_seconds,
     )
+    return decision.config
 
-    if not ai_config:
-        return get_default_ai_config(db, user_id)
 
-    return ai_config
+def apply_failover_policy(db, user_id: int, ai_config):
+    """斷路器開啟時依使用者策略處理
 
+    - 'fail_fast'：直接拋出 CircuitOpenError
+    - 'fallback'（預設）：依序嘗試使用者指定的備援設定、預設 opencode
+    """
+    circuit = get_config_circuit(ai_config)
+    if not circuit.is_open():
+        return ai_config
 
-# ========== 六爻任務 ==========
+    user = db.query(User).filter(User.id == user_id).first()
+    policy = getattr(user, "ai_failover_policy", None) or "fallback"
+
+    if policy == "fail_fast":
+        logger.warning(f"AI 斷路器 [{circuit.name}] 開啟，用戶 {user_id} 設定快速失敗")
+        raise CircuitOpenError(circuit)
+
+    candidates = []
+    fallback_id = getattr(user, "ai_fallback_config_id", None)
+    if fallback_id:
+        candidates.append(
+            db.query(AIConfig)
+            .filter(AIConfig.id == fallback_id, AIConfig.user_id == user_id)
+            .first()
+        )
+    if ai_config.provider != "opencode":
+        try:
+            candidates.append(get_default_ai_config(db, user_id))
+        except ValueError as e:
+            logger.warning(f"預設 AI 服務無法作為備援: {e}")
+
+    for candidate in candidates:
+        if candidate is None or candidate is ai_config:
+            continue
+        if get_config_circuit(candidate).is_open():
+            continue
+        target = f"{candidate.provider}/{candidate.effective_model}"
+        circuit.record_failover(target)
+        logger.warning(
+            f"AI 容錯切換：用戶 {user_id} 的 {ai_config.provider}/{ai_config.effective_model} "
+            f"斷路器開啟，改用 {target}"
+        )
+        return candidate
 
+    raise CircuitOpenError(circuit)
 
-async def process_liuyao_task(history_id: int, db_url: str):
-    """背景處理六爻占卜 (AI 解盤)"""
-    engine = create_engine(db_url, connect_args={"check_same_thread": False})
-    SessionLocal = sessionmaker(bind=engine)
-    db = SessionLocal()
 
-    try:
-        history = db.query(History).filter(History.id == history_id).first()
-        if not history:
-            return
+def resolve_hedge_config(db, user_id: int, ai_config):
+    """決定對沖請求的備援配置（未啟用對沖或無可用備援時回傳 None）
 
-        history.status = "processing"
-        db.commit()
+    依序為使用者指定的備援設定、預設 opencode；略過與主要配置相同或斷路器開啟者。
+    """
+    user = db.query(User).filter(User.id == user_id).first()
+    if not getattr(user, "ai_hedging_enabled", False):
+        return None
 
-        ai_config = resolve_ai_config(
-            db, history.user_id, use_default=history.ai_provider == "default"
+    candidates = []
+    fallback_id = getattr(user, "ai_fallback_config_id", None)
+    if fallback_id:
+        candidates.append(
+            db.query(AIConfig)
+            .filter(AIConfig.id == fallback_id, AIConfig.user_id == user_id)
+            .first()
         )
+    if ai_config.provider != "opencode":
+        try:
+            candidates.append(get_default_ai_config(db, user_id))
+        except ValueError:
+            pass
+
+    for candidate in candidates:
+        if candidate is None or candidate is ai_config:
+            continue
+        if get_config_circuit(candidate).is_open():
+            continue
+        return candidate
+    return None
+
+
+async def generate_interpretation(
+    db: AsyncSession,
+    history: History,
+    ai_config,
+    ai_service: AIService,
+    prompt: str,
+    system_prompt: str,
+):
+    """呼叫 AI 生成解盤，使用者啟用對沖時同時準備備援服務
+
+    system prompt（靜態前綴）後附上解盤模式的補充說明（快速模式只給結論與關鍵依據），
+    prompt（動態後綴）放 user message，讓相同類型與模式的請求共用 provider 快取。
+
+    Returns:
+        (解盤內容, 實際產生結果的 AI 配置)
+    """
+    mode_template = get_mode_instruction(history.mode)
+    layout = build_layout(
+        [system_prompt, mode_template.text if mode_template else ""], prompt
+    )
+    add_prompt_version(history, mode_template)
+    hedge_config = await db.run_sync(resolve_hedge_config, history.user_id, ai_config)
 
-        if not ai_config:
-                history.status = "error"
-                history.interpretation = "錯誤：未設定 AI 服務"
-                db.commit()
-                return
+    # 提交後交易結束、連線歸還連線池，等待 AI 回應期間不占用連線
+    history.interpretation_started_at = datetime.utcnow()
+    await db.commit()
 
+    try:
+        with track_usage() as usage, log_calls(history.id, "interpretation"):
+            if hedge_config is None:
+                text = await ai_service.generate(
+                    layout.dynamic_suffix, layout.static_prefix
+                )
+                return text, ai_config
+
+            result = await hedged_generate(
+                ai_service,
+                build_ai_service(hedge_config, mode=history.mode),
+                layout.dynamic_suffix,
+                layout.static_prefix,
+            )
+            if result.winner == "secondary":
+                return result.text, hedge_config
+            return result.text, ai_config
+    finally:
+        history.interpretation_completed_at = datetime.utcnow()
+        record_token_usage(history, usage)
+
+
+def record_token_usage(history: History, usage: TokenUsage):
+    """累計任務的 prompt token 與快取命中 token 數"""
+    history.prompt_tokens = (history.prompt_tokens or 0) + usage.prompt_tokens
+    history.cached_tokens = (history.cached_tokens or 0) + usage.cached_tokens
+
+
+async def generate_summary(
+    db: AsyncSession, history: History, ai_config, prompt: str, system_prompt: str
+) -> bool:
+    """漸進式解盤第一階段：以快速模式產生「結論 + 關鍵信號」摘要並立即寫入
+
+    摘要失敗不影響完整解讀；使用者看完摘要後取消則略過完整解讀。
+
+    Returns:
+        是否繼續產生完整解讀
+    """
+    if history.summary_status != "pending":
+        return True
+
+    history.summary_status = "processing"
+    history.summary_started_at = datetime.utcnow()
+    await db.commit()
+
+    summary_template = prompt_registry.find("summary")
+    layout = build_layout(
+        [system_prompt, summary_template.text if summary_template else ""], prompt
+    )
+    with track_usage() as usage, log_calls(history.id, "summary"):
         try:
-            api_key = None
-            if hasattr(ai_config, "_api_key"):
-                api_key = ai_config._api_key
-            elif ai_config.api_key_encrypted:
-                api_key = decrypt_api_key(ai_config.api_key_encrypted)
-
-            ai_service = get_ai_service(
-                ai_config.provider,
-                api_key=api_key,
-                base_url=ai_config.local_url,
-                model=ai_config.effective_model,
+            summary_service = build_ai_service(ai_config, mode="fast")
+            history.summary = await summary_service.generate(
+                layout.dynamic_suffix, layout.static_prefix
             )
+            history.summary_status = "completed"
         except Exception as e:
-            history.status = "error"
-            history.interpretation = f"錯誤：AI 服務初始化失敗 - {str(e)}"
-            db.commit()
+            logger.warning(f"History {history.id} 快速摘要失敗，繼續完整解讀: {e}")
+            history.summary_status = "error"
+    history.summary_completed_at = datetime.utcnow()
+    record_token_usage(history, usage)
+    await db.commit()
+
+    await db.refresh(history)
+    if history.status == "cancelled":
+        logger.info(f"History {history.id} 已於摘要後取消，略過完整解讀")
+        return False
+    return True
+
+
+async def run_ai_phases(
+    db: AsyncSession,
+    history: History,
+    ai_config,
+    ai_service: AIService,
+    prompt: str,
+    system_prompt: str,
+    deadline: Deadline,
+):
+    """依序執行快速摘要與完整解讀，全程受任務期限限制
+
+    Returns:
+        (解盤內容, 實際產生結果的 AI 配置)；摘要後已取消時回傳 None
+
+    Raises:
+        DeadlineExceeded: 超過任務期限（進行中的 AI 呼叫已被取消）
+    """
+
+    async def phases():
+        if not await generate_summary(db, history, ai_config, prompt, system_prompt):
+            return None
+        return await generate_interpretation(
+            db, history, ai_config, ai_service, prompt, system_prompt
+        )
+
+    with use_deadline(deadline):
+        return await deadline.run(phases())
+
+
+def _should_retry(error: Exception) -> bool:
+    """AI 服務暫時性錯誤（限流、服務端錯誤、逾時、連線）交由任務佇列延後重試
+
+    超過任務期限則不重試；佇列的嘗試次數用盡時由 bury_job 將 History 設為 error。
+    """
+    return not isinstance(error, DeadlineExceeded) and classify_error(error).retryable
+
+
+async def _fail_history(
+    db: AsyncSession, history: History, error: Exception, message: Optional[str] = None
+):
+    """寫入任務失敗結果：超過期限標記 timeout，其餘標記 error（message 為顯示的錯誤訊息）"""
+    if isinstance(error, DeadlineExceeded):
+        history.status = "timeout"
+        history.interpretation = f"錯誤：{error}"
+    else:
+        history.status = "error"
+        history.interpretation = message or f"錯誤：{error}"
+    await commit_result_async(db, history)
+
+
+async def _start_task(db: AsyncSession, history: History):
+    """各類任務共同的開始步驟：標記處理中、選擇 AI 配置並建立 AI 服務
+
+    Returns:
+        (任務期限, AI 配置, AI 服務)；已取消或無法開始（已寫入錯誤）時為 None
+    """
+    history.status = "processing"
+    if not await commit_result_async(db, history):
+        return None
+
+    deadline = Deadline.for_history(history)
+    try:
+        ai_config = await db.run_sync(
+            resolve_ai_config,
+            history.user_id,
+            use_default=history.ai_provider == "default",
+            deadline=deadline,
+        )
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        await _fail_history(db, history, e)
+        return None
+
+    if not ai_config:
+        history.status = "error"
+        history.interpretation = "錯誤：未設定 AI 服務"
+        await commit_result_async(db, history)
+        return None
+
+    try:
+        ai_service = build_ai_service(ai_config, mode=history.mode)
+    except Exception as e:
+        await _fail_history(db, history, e, f"錯誤：AI 服務初始化失敗 - {e}")
+        return None
+    return deadline, ai_config, ai_service
+
+
+# ========== 六爻任務 ==========
+
+
+@cancellable_job
+async def process_liuyao_task(history_id: int, db_url: str):
+    """背景處理六爻占卜 (AI 解盤)"""
+    db = get_job_session_factory(db_url)()
+    history = None
+
+    try:
+        history = await db.get(History, history_id)
+        if not history:
             return
 
+        started = await _start_task(db, history)
+        if started is None:
+            return
+        deadline, ai_config, ai_service = started
+
         # 讀取 prompt
-        prompt_path = Path(BASE_DIR) / "prompts" / "liuyao_system.md"
-        system_prompt = ""
-        if prompt_path.exists():
-            system_prompt = prompt_path.read_text(encoding="utf-8")
+        system_template = prompt_registry.find("liuyao_system")
+        system_prompt = system_template.text if system_template else ""
 
         chart_data = json.loads(history.chart_data)
         chart_formatted = chart_data.get("formatted", "")
 
-        user_prompt = f"""
-【求測者資訊】
-性別：{history.gender or "未指定"}
-對象：{history.target or "自己"}
-
-【用戶問題】
-{history.question}
-
-【六爻排盤詳情】
-{chart_formatted}
-"""
+        user_template = prompt_registry.get("user/liuyao")
+        user_prompt = user_template.render(
+            {
+                "性別": history.gender or "未指定",
+                "對象": history.target or "自己",
+                "問題": history.question,
+                "排盤": chart_formatted,
+            }
+        )
+        history.prompt_version = combine_versions(system_template, user_template)
 
         try:
-            result = await ai_service.generate(user_prompt, system_prompt)
-            history.interpretation = result
-            history.ai_provider = ai_config.provider
-            history.ai_model = ai_config.effective_model
-            history.status = "completed"
+            outcome = await run_ai_phases(
+                db, history, ai_config, ai_service, user_prompt, system_prompt, deadline
+            )
         except Exception as e:
-            history.status = "error"
-            history.interpretation = f"錯誤：AI 解盤失敗 - {str(e)}"
-
-        db.commit()
+            if _should_retry(e):
+                raise
+            await _fail_history(db, history, e, f"錯誤：AI 解盤失敗 - {e}")
+            return
+        if outcome is None:
+            return
+        result, used_config = outcome
+        history.interpretation = result
+        history.ai_provider = used_config.provider
+        history.ai_model = used_config.effective_model
+        history.status = "completed"
+        await commit_result_async(db, history)
 
     except Exception as e:
+        if _should_retry(e):
+            raise
         print(f"Process liuyao divination error: {e}")
         if history:
             try:
-                history.status = "error"
-                history.interpretation = f"系統錯誤：{str(e)}"
-                db.commit()
+                await _fail_history(db, history, e, f"系統錯誤：{e}")
             except Exception:
                 pass
     finally:
-        db.close()
+        await db.close()
 
 
 # ========== 塔羅任務 ==========
 
 
+@cancellable_job
 async def process_tarot_task(history_id: int, db_url: str):
     """背景處理塔羅占卜 (AI 解盤)"""
-    engine = create_engine(db_url, connect_args={"check_same_thread": False})
-    SessionLocal = sessionmaker(bind=engine)
-    db = SessionLocal()
+    db = get_job_session_factory(db_url)()
+    history = None
 
     try:
-        history = db.query(History).filter(History.id == history_id).first()
+        history = await db.get(History, history_id)
         if not history:
             return
 
-        history.status = "processing"
-        db.commit()
-
-        ai_config = resolve_ai_config(
-            db, history.user_id, use_default=history.ai_provider == "default"
-        )
-
-        if not ai_config:
-                history.status = "error"
-                history.interpretation = "錯誤：未設定 AI 服務"
-                db.commit()
-                return
-
-        try:
-            api_key = None
-            if hasattr(ai_config, "_api_key"):  # Guest config
-                api_key = ai_config._api_key
-            elif ai_config.api_key_encrypted:  # Regular user config
-                api_key = decrypt_api_key(ai_config.api_key_encrypted)
-
-            ai_service = get_ai_service(
-                ai_config.provider,
-                api_key=api_key,
-                base_url=ai_config.local_url,
-                model=ai_config.effective_model,
-            )
-        except Exception as e:
-            history.status = "error"
-            history.interpretation = f"錯誤：AI 服務初始化失敗 - {str(e)}"
-            db.commit()
+        started = await _start_task(db, history)
+        if started is None:
             return
+        deadline, ai_config, ai_service = started
 
         chart_data = json.loads(history.chart_data)
         spread_type = chart_data.get("spread", "three_card")
 
         try:
-            system_prompt = get_tarot_system_prompt(spread_type)
+            system_template = get_tarot_system_prompt(spread_type)
+            system_prompt = system_template.text
         except FileNotFoundError as e:
-            history.status = "error"
-            history.interpretation = f"錯誤：{str(e)}"
-            db.commit()
+            await _fail_history(db, history, e)
             return
 
         try:
             cards = chart_data.get("cards", [])
-            user_prompt = ""
+            values = {"question": history.question}
 
             if spread_type == "single":
-                card = cards[0]
-                user_prompt = f"""
-User Question: {history.question}
-
-Card Drawn: {card["name_cn"]} ({card["name"]}) {"(Reversed)" if card.get("reversed") else "(Upright)"}
-
-Please interpret this single card reading.
-"""
+                values["card"] = format_tarot_card(cards[0])
             elif spread_type == "three_card":
                 card_1 = next((c for c in cards if c["position"] == "past"), cards[0])
                 card_2 = next(
@@ -257,16 +599,9 @@ Please interpret this single card reading.
                 )
                 card_3 = next((c for c in cards if c["position"] == "future"), cards[2])
 
-                user_prompt = f"""
-User Question: {history.question}
-
-Cards Drawn:
-1. Past: {card_1["name_cn"]} ({card_1["name"]}) {"(Reversed)" if card_1.get("reversed") else "(Upright)"}
-2. Present: {card_2["name_cn"]} ({card_2["name"]}) {"(Reversed)" if card_2.get("reversed") else "(Upright)"}
-3. Future: {card_3["name_cn"]} ({card_3["name"]}) {"(Reversed)" if card_3.get("reversed") else "(Upright)"}
-
-Please interpret this three-card spread.
-"""
+                values["past"] = format_tarot_card(card_1)
+                values["present"] = format_tarot_card(card_2)
+                values["future"] = format_tarot_card(card_3)
             elif spread_type == "celtic_cross":
                 position_names = [
                     "The Heart",
@@ -281,108 +616,77 @@ Please interpret this three-card spread.
                     "Outcome",
                 ]
 
-                cards_text = "\n".join(
+                values["cards"] = "\n".join(
                     [
-                        f"{i + 1}. {position_names[i]}: {c['name_cn']} ({c['name']}) {'(Reversed)' if c.get('reversed') else '(Upright)'}"
+                        f"{i + 1}. {position_names[i]}: {format_tarot_card(c)}"
                         for i, c in enumerate(cards[:10])
                     ]
                 )
-
-                user_prompt = f"""
-User Question: {history.question}
-
-Celtic Cross Spread:
-{cards_text}
-
-Please interpret this Celtic Cross spread.
-"""
             else:
                 raise ValueError(f"不支援的牌陣類型：{spread_type}")
 
+            user_template = prompt_registry.get(f"user/tarot_{spread_type}")
+            user_prompt = user_template.render(values)
+            history.prompt_version = combine_versions(system_template, user_template)
+
         except Exception as e:
-            history.status = "error"
-            history.interpretation = f"錯誤：User Prompt 構建失敗 - {str(e)}"
-            db.commit()
+            await _fail_history(db, history, e, f"錯誤：User Prompt 構建失敗 - {e}")
             return
 
         try:
-            response = await ai_service.generate(user_prompt, system_prompt)
-            history.interpretation = response
-            history.ai_provider = ai_config.provider
-            history.ai_model = ai_config.effective_model
-            history.status = "completed"
-            db.commit()
+            outcome = await run_ai_phases(
+                db, history, ai_config, ai_service, user_prompt, system_prompt, deadline
+            )
         except Exception as e:
-            history.status = "error"
-            history.interpretation = f"AI 生成失敗：{str(e)}"
-            db.commit()
+            if _should_retry(e):
+                raise
+            await _fail_history(db, history, e, f"AI 生成失敗：{e}")
+            return
+        if outcome is None:
+            return
+        response, used_config = outcome
+        history.interpretation = response
+        history.ai_provider = used_config.provider
+        history.ai_model = used_config.effective_model
+        history.status = "completed"
+        await commit_result_async(db, history)
 
     except Exception as e:
+        if _should_retry(e):
+            raise
         print(f"Background task error: {e}")
         if history:
             try:
-                history.status = "error"
-                history.interpretation = f"系統錯誤：{str(e)}"
-                db.commit()
+                await _fail_history(db, history, e, f"系統錯誤：{e}")
             except Exception:
                 pass
     finally:
-        db.close()
+        await db.close()
 
 
 # ========== 紫微斗數任務 ==========
 
 
+@cancellable_job
 async def process_ziwei_task(history_id: int, db_url: str):
     """背景處理紫微斗數占卜(AI 解讀)"""
-    engine = create_engine(db_url, connect_args={"check_same_thread": False})
-    SessionLocal = sessionmaker(bind=engine)
-    db = SessionLocal()
+    db = get_job_session_factory(db_url)()
     history = None
 
     try:
-        history = db.query(History).filter(History.id == history_id).first()
+        history = await db.get(History, history_id)
         if not history:
             return
 
-        history.status = "processing"
-        db.commit()
-
-        ai_config = resolve_ai_config(
-            db, history.user_id, use_default=history.ai_provider == "default"
-        )
-
-        if not ai_config:
-                history.status = "error"
-                history.interpretation = "錯誤：未設定 AI 服務"
-                db.commit()
-                return
-
-        try:
-            api_key = None
-            if hasattr(ai_config, "_api_key"):  # Guest config
-                api_key = ai_config._api_key
-            elif ai_config.api_key_encrypted:  # Regular user config
-                api_key = decrypt_api_key(ai_config.api_key_encrypted)
-
-            ai_service = get_ai_service(
-                ai_config.provider,
-                api_key=api_key,
-                base_url=ai_config.local_url,
-                model=ai_config.effective_model,
-            )
-        except Exception as e:
-            history.status = "error"
-            history.interpretation = f"錯誤：AI 服務初始化失敗 - {str(e)}"
-            db.commit()
+        started = await _start_task(db, history)
+        if started is None:
             return
+        deadline, ai_config, ai_service = started
 
-        prompt_path = Path(BASE_DIR) / "prompts" / "ziwei_system.md"
-        system_prompt_template = ""
-        if prompt_path.exists():
-            system_prompt_template = prompt_path.read_text(encoding="utf-8")
-        else:
-            system_prompt_template = "你是一位紫微斗數專家。請根據提供的信息回答問題。\n\n{{使用者資訊}}\n\n{{完整命盤}}\n\n{{補充說明}}"
+        system_template = prompt_registry.find("ziwei_system")
+        system_prompt_template = system_template or CompiledTemplate(
+            "你是一位紫微斗數專家。請根據提供的信息回答問題。\n\n{{使用者資訊}}\n\n{{完整命盤}}\n\n{{補充說明}}"
+        )
 
         chart_data_json = json.loads(history.chart_data)
 
@@ -420,39 +724,54 @@ async def process_ziwei_task(history_id: int, db_url: str):
 
         prompt_data = ziwei_service.process_chart(process_request)
 
-        final_system_prompt = (
-            system_prompt_template.replace(
-                "{{使用者資訊}}", prompt_data["user_info_json"]
-            )
-            .replace("{{完整命盤}}", prompt_data["chart_info_json"])
-            .replace("{{補充說明}}", prompt_data["supplementary_info_json"])
-            .replace("{{使用者提問問題}}", prompt_data["question"])
+        # 命盤資料不嵌入 system prompt：模板中的欄位改為【欄位】標記，
+        # 實際內容放在 user message，system prompt 才能被 provider 快取
+        final_system_prompt, chart_sections = system_prompt_template.split(
+            {
+                "使用者資訊": prompt_data["user_info_json"],
+                "完整命盤": prompt_data["chart_info_json"],
+                "補充說明": prompt_data["supplementary_info_json"],
+                "使用者提問問題": prompt_data["question"],
+            },
         )
 
-        user_prompt = f"請解答我的問題：{history.question}"
+        user_template = prompt_registry.get("user/ziwei")
+        user_prompt = user_template.render(
+            {"命盤資料": chart_sections, "問題": history.question}
+        )
+        history.prompt_version = combine_versions(system_template, user_template)
 
         try:
-            interpretation = await ai_service.generate(
-                prompt=user_prompt, system_prompt=final_system_prompt
+            outcome = await run_ai_phases(
+                db,
+                history,
+                ai_config,
+                ai_service,
+                user_prompt,
+                final_system_prompt,
+                deadline,
             )
-
-            history.interpretation = interpretation
-            history.status = "completed"
-            history.ai_provider = ai_config.provider
-            history.ai_model = ai_config.effective_model
         except Exception as e:
-            history.status = "error"
-            history.interpretation = f"AI 解讀失敗：{str(e)}"
-
-        db.commit()
+            if _should_retry(e):
+                raise
+            await _fail_history(db, history, e, f"AI 解讀失敗：{e}")
+            return
+        if outcome is None:
+            return
+        interpretation, used_config = outcome
+        history.interpretation = interpretation
+        history.status = "completed"
+        history.ai_provider = used_config.provider
+        history.ai_model = used_config.effective_model
+        await commit_result_async(db, history)
 
     except Exception as e:
+        if _should_retry(e):
+            raise
         if history:
             try:
-                history.status = "error"
-                history.interpretation = f"系統錯誤：{str(e)}"
-                db.commit()
+                await _fail_history(db, history, e, f"系統錯誤：{e}")
             except Exception:
                 pass
     finally:
-        db.close()
+        await db.close()
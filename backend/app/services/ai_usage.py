@@ -0,0 +1,123 @@
+"""
+AI 用量統計模組
+
+各 provider 在收到回應後以 `report_usage` 回報 token 用量（含 prompt cache 命中數），
+背景任務以 `track_usage` 包住一段呼叫，即可取得這個任務累計的用量；
+AIService 則以 `call_usage` 包住單次呼叫，取得該次呼叫的用量寫入呼叫紀錄。
+用量透過 contextvar 傳遞，對沖建立的子 task 也會回報到同一個任務；
+請求合併的共用呼叫另外累計，結束後計入每位等待者的任務。
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional
+
+
+@dataclass
+class TokenUsage:
+    """Token 用量"""
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0  # prompt 中命中 provider 快取的部分
+    reasoning_tokens: int = 0
+
+    def add(self, other: "TokenUsage"):
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cached_tokens += other.cached_tokens
+        self.reasoning_tokens += other.reasoning_tokens
+
+
+_job_usage: ContextVar[Optional[TokenUsage]] = ContextVar("ai_job_usage", default=None)
+_call_usage: ContextVar[Optional[TokenUsage]] = ContextVar(
+    "ai_call_usage", default=None
+)
+
+
+@contextmanager
+def track_usage() -> Iterator[TokenUsage]:
+    """累計區塊內所有 AI 呼叫的用量"""
+    usage = TokenUsage()
+    token = _job_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _job_usage.reset(token)
+
+
+@contextmanager
+def call_usage() -> Iterator[TokenUsage]:
+    """取得區塊內單次 AI 呼叫的用量"""
+    usage = TokenUsage()
+    token = _call_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        try:
+            _call_usage.reset(token)
+        except ValueError:
+            # 串流生成器可能在另一個 context 中被關閉，此時無需還原
+            pass
+
+
+def report_usage(usage: Optional[TokenUsage]):
+    """provider 回報單次呼叫的用量"""
+    if usage is None:
+        return
+    for tracked in (_job_usage.get(), _call_usage.get()):
+        if tracked is not None:
+            tracked.add(usage)
+
+
+def report_job_usage(usage: TokenUsage):
+    """將已完成呼叫的用量計入目前的任務（請求合併的等待者使用）"""
+    tracked = _job_usage.get()
+    if tracked is not None:
+        tracked.add(usage)
+
+
+def _field(obj: Any, name: str) -> Any:
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def _int(value: Any) -> int:
+    return value if isinstance(value, int) else 0
+
+
+def usage_from_openai(usage: Any) -> Optional[TokenUsage]:
+    """解析 OpenAI 相容格式的 usage（SDK 物件或 JSON dict）
+
+    快取命中數：OpenAI 為 prompt_tokens_details.cached_tokens，
+    DeepSeek 系列為 prompt_cache_hit_tokens。
+    """
+    if usage is None:
+        return None
+    cached = _int(_field(_field(usage, "prompt_tokens_details"), "cached_tokens"))
+    if not cached:
+        cached = _int(_field(usage, "prompt_cache_hit_tokens"))
+    return TokenUsage(
+        prompt_tokens=_int(_field(usage, "prompt_tokens")),
+        completion_tokens=_int(_field(usage, "completion_tokens")),
+        cached_tokens=cached,
+        reasoning_tokens=_int(
+            _field(_field(usage, "completion_tokens_details"), "reasoning_tokens")
+        ),
+    )
+
+
+def usage_from_gemini(usage_metadata: Any) -> Optional[TokenUsage]:
+    """解析 Gemini 的 usage_metadata"""
+    if usage_metadata is None:
+        return None
+    return TokenUsage(
+        prompt_tokens=_int(_field(usage_metadata, "prompt_token_count")),
+        completion_tokens=_int(_field(usage_metadata, "candidates_token_count")),
+        cached_tokens=_int(_field(usage_metadata, "cached_content_token_count")),
+        reasoning_tokens=_int(_field(usage_metadata, "thoughts_token_count")),
+    )
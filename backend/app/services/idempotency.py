@@ -0,0 +1,218 @@
+"""
+冪等鍵模組
+
+行動裝置在網路不穩時會重送 POST。建立占卜的請求帶 `Idempotency-Key` 標頭時，
+以 (使用者, 鍵) 為唯一鍵記錄第一次請求：
+- 第一次：先寫入 processing 狀態的紀錄（唯一鍵保證同時送達的重複請求只有一個能寫入），
+  建立 History 時在同一個交易中存入回應
+- 重送相同內容：直接回傳第一次的回應與 history id，不重新排盤、不再加入任務佇列
+- 第一次仍在處理中：409 + Retry-After
+- 同一個鍵用於不同內容的請求：422
+- 第一次請求失敗：刪除紀錄，重送時重新處理
+紀錄在 IDEMPOTENCY_TTL_SECONDS 後失效。
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Optional
+
+from fastapi import Depends, Header, HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.core.database import get_async_db
+from app.models.idempotency_key import IdempotencyKey
+from app.models.user import User
+from app.utils.auth import get_current_user_or_guest
+
+logger = logging.getLogger(__name__)
+
+
+def request_hash(endpoint: str, body: bytes) -> str:
+    """請求內容的雜湊（JSON 先正規化，欄位順序或空白不同仍視為相同請求）"""
+    try:
+        canonical = json.dumps(
+            json.loads(body or b"null"), sort_keys=True, ensure_ascii=False
+        ).encode()
+    except ValueError:
+        canonical = body
+    return hashlib.sha256(endpoint.encode() + b"\n" + canonical).hexdigest()
+
+
+class IdempotentRequest:
+    """單一請求的冪等狀態
+
+    replay 不為 None 時代表重送，端點應直接回傳 replay。
+    """
+
+    def __init__(
+        self,
+        record: Optional[IdempotencyKey] = None,
+        replay: Optional[Any] = None,
+    ):
+        self.record = record
+        self.replay = replay
+
+    def save(self, db: AsyncSession, response: Any, history_id: int):
+        """存入第一次請求的回應（不提交，與 History 一起 commit）"""
+        if self.record is None:
+            return
+        self.record.status = "completed"
+        self.record.history_id = history_id
+        self.record.response_body = json.dumps(
+            jsonable_encoder(response), ensure_ascii=False
+        )
+
+    async def release(self, db: AsyncSession):
+        """請求未完成時刪除紀錄，讓重送可以重新處理"""
+        if self.record is None:
+            return
+        await db.rollback()
+        await db.execute(
+            delete(IdempotencyKey)
+            .where(
+                IdempotencyKey.id == self.record.id,
+                IdempotencyKey.status == "processing",
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+def claim_key(
+    db: Session, user_id: int, key: str, endpoint: str, digest: str
+) -> IdempotentRequest:
+    """寫入冪等鍵；已存在時依狀態回傳第一次的回應或拒絕"""
+    settings = get_settings()
+    for _ in range(3):
+        now = datetime.utcnow()
+        record = IdempotencyKey(
+            user_id=user_id,
+            key=key,
+            endpoint=endpoint,
+            request_hash=digest,
+            status="processing",
+            created_at=now,
+            expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS),
+        )
+        db.add(record)
+        try:
+            db.commit()
+            return IdempotentRequest(record)
+        except IntegrityError:
+            db.rollback()
+
+        existing = (
+            db.query(IdempotencyKey)
+            .filter(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            .first()
+        )
+        if existing is None:
+            continue
+        abandoned = existing.status == "processing" and existing.created_at < now - (
+            timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+        )
+        if existing.expires_at <= now or abandoned:
+            # 條件式刪除：同時接手的請求只有一個能重新寫入
+            db.query(IdempotencyKey).filter(
+                IdempotencyKey.id == existing.id,
+                IdempotencyKey.created_at == existing.created_at,
+            ).delete(synchronize_session=False)
+            db.commit()
+            continue
+
+        if existing.request_hash != digest:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key 已用於內容不同的請求",
+            )
+        if existing.status != "completed":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="相同的請求正在處理中，請稍候",
+                headers={"Retry-After": "1"},
+            )
+        logger.info(f"冪等鍵重送：user={user_id} history={existing.history_id}")
+        return IdempotentRequest(replay=json.loads(existing.response_body))
+
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="相同的請求正在處理中，請稍候",
+        headers={"Retry-After": "1"},
+    )
+
+
+def purge_expired(db: Session, limit: int = 500) -> int:
+    """刪除逾期的冪等鍵，回傳刪除筆數"""
+    expired_ids = [
+        row.id
+        for row in db.query(IdempotencyKey.id)
+        .filter(IdempotencyKey.expires_at <= datetime.utcnow())
+        .limit(limit)
+    ]
+    if not expired_ids:
+        return 0
+    db.query(IdempotencyKey).filter(IdempotencyKey.id.in_(expired_ids)).delete(
+        synchronize_session=False
+    )
+    db.commit()
+    return len(expired_ids)
+
+
+def idempotency(endpoint: str):
+    """
+    建立占卜端點的冪等依賴注入工廠
+
+    使用方式（需放在 check_admission 之前，重送時略過准入控制）：
+    @router.post("")
+    async def create_divination(
+        ...,
+        idem: IdempotentRequest = Depends(idempotency("liuyao")),
+        _: None = Depends(check_admission),
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        if idem.replay is not None:
+            return idem.replay
+        ...
+        idem.save(db, response, history.id)
+        await db.commit()
+    """
+
+    async def dependency(
+        request: Request,
+        response: Response,
+        idempotency_key: Optional[str] = Header(
+            None, alias="Idempotency-Key", max_length=255
+        ),
+        current_user: User = Depends(get_current_user_or_guest),
+        db: AsyncSession = Depends(get_async_db),
+    ) -> AsyncIterator[IdempotentRequest]:
+        if not idempotency_key:
+            yield IdempotentRequest()
+            return
+
+        digest = request_hash(endpoint, await request.body())
+        state = await db.run_sync(
+            claim_key, current_user.id, idempotency_key, endpoint, digest
+        )
+        if state.replay is not None:
+            request.state.idempotent_replay = True
+            response.headers["Idempotent-Replayed"] = "true"
+            yield state
+            return
+
+        try:
+            yield state
+        except Exception:
+            await state.release(db)
+            raise
+        if state.record.status != "completed":
+            await state.release(db)
+
+    return dependency
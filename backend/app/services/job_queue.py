@@ -0,0 +1,754 @@
+"""
+AI 解盤任務佇列模組
+
+建立占卜或重試解盤時，在 jobs 表寫入一筆任務（與 History 在同一個交易中提交，不會遺失）。
+worker 以條件式 UPDATE 原子地領取任務並取得租約：
+- 執行期間定期續約；worker 當機或重新部署後租約到期，任務即可被其他 worker 重新領取
+- 每次領取都計入 attempts，超過 max_attempts 的任務移入 dead（死信），History 設為 error
+- 任務拋出例外時延後 JOB_RETRY_DELAY_SECONDS × attempts 秒重試。每次嘗試內的 AI 呼叫已由
+  RetryPolicy 重試 AI_RETRY_MAX_ATTEMPTS 次，兩者相乘為單一解盤的 provider 呼叫上限；
+  重新執行不延長期限 (History.deadline_at)，總時間仍受 AI_JOB_TIMEOUT_SECONDS 限制
+- 停機時等待執行中的任務最多 JOB_SHUTDOWN_DRAIN_SECONDS 秒，未完成的立即交還佇列（不等租約到期）
+
+排程採加權公平排隊 (weighted fair queuing)：每筆任務加入時依使用者的 User.role 權重
+(JOB_PRIORITY_WEIGHTS，admin > user > guest) 計算虛擬完成時間 fair_tag = max(系統虛擬時間,
+同一使用者前一筆任務的 fair_tag) + 1 / 權重，worker 依 fair_tag 由小到大領取。
+連續送出多筆的使用者只會排在自己的任務後面，不會擋住其他人；
+同一使用者同時執行的任務數不超過 JOB_MAX_RUNNING_PER_USER。
+
+History 的狀態與結果仍由 ai_tasks 的背景任務寫入，佇列只負責確保任務被執行。
+"""
+
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+from app.core.config import get_settings
+from app.core.database import SessionLocal
+from app.models.history import History
+from app.models.job import Job, JobWorker
+from app.models.user import User
+from app.services.ai_jobs import _cancelling, job_registry
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "done", "dead")
+ACTIVE_STATUSES = ("queued", "running")
+
+# 同時搶同一筆任務失敗時，換下一筆的次數上限
+CLAIM_RETRIES = 5
+
+JobHandler = Callable[[int, str], Awaitable[Any]]
+
+
+def job_weight(priority: Optional[str]) -> float:
+    """優先等級的排程權重（未知等級視為一般使用者）"""
+    weights = get_settings().JOB_PRIORITY_WEIGHTS
+    return weights.get(priority or "user", weights.get("user", 1.0))
+
+
+def virtual_time(db: Session) -> float:
+    """系統虛擬時間：已開始執行的任務中最大的 fair_tag"""
+    tag = (
+        db.query(Job.fair_tag)
+        .filter(Job.status != "queued", Job.fair_tag.isnot(None))
+        .order_by(Job.fair_tag.desc())
+        .limit(1)
+        .scalar()
+    )
+    return tag or 0.0
+
+
+def fair_tag_for(db: Session, user_id: Optional[int], priority: Optional[str]) -> float:
+    """新任務的虛擬完成時間"""
+    start = virtual_time(db)
+    if user_id is not None:
+        last = (
+            db.query(func.max(Job.fair_tag))
+            .filter(Job.user_id == user_id, Job.status.in_(ACTIVE_STATUSES))
+            .scalar()
+        )
+        start = max(start, last or 0.0)
+    return start + 1.0 / job_weight(priority)
+
+
+def enqueue_job(db: Session, history: History) -> Job:
+    """為 History 加入解盤任務（不提交，與呼叫端的變更一起 commit）
+
+    已有尚未完成的任務時沿用，避免同一筆紀錄重複執行。
+    """
+    if history.id is None:
+        db.flush()
+    existing = (
+        db.query(Job)
+        .filter(Job.history_id == history.id, Job.status.in_(ACTIVE_STATUSES))
+        .first()
+    )
+    if existing is not None:
+        return existing
+
+    priority = db.query(User.role).filter(User.id == history.user_id).scalar()
+    now = datetime.utcnow()
+    job = Job(
+        history_id=history.id,
+        kind=history.divination_type,
+        user_id=history.user_id,
+        priority=priority,
+        fair_tag=fair_tag_for(db, history.user_id, priority),
+        status="queued",
+        attempts=0,
+        max_attempts=get_settings().JOB_MAX_ATTEMPTS,
+        available_at=now,
+    )
+    job.queue_position = _queued_ahead(db, job.fair_tag) + 1
+    job.estimated_start_at = StartEstimator(db).estimate(job.queue_position)
+    db.add(job)
+    return job
+
+
+def running_job(db: Session, history_id: int) -> Optional[Job]:
+    """History 仍由 worker 執行中（租約有效）的任務"""
+    return (
+        db.query(Job)
+        .filter(
+            Job.history_id == history_id,
+            Job.status == "running",
+            Job.lease_expires_at >= datetime.utcnow(),
+        )
+        .first()
+    )
+
+
+def _claimable(now: datetime):
+    """可領取：排隊中且已到可執行時間，或執行中但租約已過期（worker 失聯）；
+    且建立者同時執行中的任務數未達上限"""
+    running = aliased(Job)
+    busy_users = (
+        select(running.user_id)
+        .where(
+            running.status == "running",
+            running.lease_expires_at >= now,
+            running.user_id.isnot(None),
+        )
+        .group_by(running.user_id)
+        .having(func.count(running.id) >= get_settings().JOB_MAX_RUNNING_PER_USER)
+    )
+    return and_(
+        or_(
+            and_(Job.status == "queued", Job.available_at <= now),
+            and_(Job.status == "running", Job.lease_expires_at < now),
+        ),
+        or_(Job.user_id.is_(None), Job.user_id.notin_(busy_users)),
+    )
+
+
+def _schedule_order():
+    """領取順序：fair_tag 小者優先（舊資料沒有 fair_tag 時最先）"""
+    return (func.coalesce(Job.fair_tag, 0.0), Job.id)
+
+
+def claim_job(
+    db: Session, worker_id: str, lease_seconds: Optional[float] = None
+) -> Optional[Job]:
+    """原子地領取一筆任務並取得租約，沒有可執行的任務時回傳 None
+
+    先選出候選任務，再以帶相同條件的 UPDATE 搶下；多個 worker 同時搶同一筆時
+    只有一個 UPDATE 會命中（SQLite 寫入為序列化），其餘換下一筆。
+    """
+    lease = lease_seconds or get_settings().JOB_LEASE_SECONDS
+    for _ in range(CLAIM_RETRIES):
+        now = datetime.utcnow()
+        candidate = (
+            db.query(Job.id)
+            .filter(_claimable(now))
+            .order_by(*_schedule_order())
+            .first()
+        )
+        if candidate is None:
+            return None
+
+        result = db.execute(
+            update(Job)
+            .where(Job.id == candidate.id, _claimable(now))
+            .values(
+                status="running",
+                lease_owner=worker_id,
+                lease_expires_at=now + timedelta(seconds=lease),
+                attempts=Job.attempts + 1,
+                started_at=now,
+                queue_position=None,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        if result.rowcount == 0:
+            continue
+
+        job = db.get(Job, candidate.id)
+        if job.attempts > job.max_attempts:
+            # 租約多次逾期（每次執行都讓 worker 當機）的任務不再重試
+            bury_job(db, job, "任務多次中斷，已超過最大嘗試次數")
+            continue
+        return job
+    return None
+
+
+def extend_lease(
+    db: Session, job_id: int, worker_id: str, lease_seconds: Optional[float] = None
+) -> bool:
+    """續約，回傳是否仍持有租約（False 代表已被其他 worker 重新領取）"""
+    lease = lease_seconds or get_settings().JOB_LEASE_SECONDS
+    result = db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "running", Job.lease_owner == worker_id)
+        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def complete_job(db: Session, job_id: int, worker_id: str) -> bool:
+    """標記任務完成（僅限仍持有租約的 worker）"""
+    result = db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "running", Job.lease_owner == worker_id)
+        .values(
+            status="done",
+            lease_owner=None,
+            lease_expires_at=None,
+            finished_at=datetime.utcnow(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def fail_job(db: Session, job_id: int, worker_id: str, error: str) -> Optional[str]:
+    """任務執行失敗：尚有嘗試次數時延後重試（History 退回 pending），否則移入 dead
+
+    Returns:
+        任務的新狀態（'queued' | 'dead'），租約已失效時為 None
+    """
+    job = (
+        db.query(Job)
+        .filter(Job.id == job_id, Job.status == "running", Job.lease_owner == worker_id)
+        .first()
+    )
+    if job is None:
+        return None
+    if job.attempts >= job.max_attempts:
+        bury_job(db, job, error)
+        return "dead"
+
+    delay = get_settings().JOB_RETRY_DELAY_SECONDS * job.attempts
+    job.status = "queued"
+    job.available_at = datetime.utcnow() + timedelta(seconds=delay)
+    job.lease_owner = None
+    job.lease_expires_at = None
+    job.last_error = error
+    _requeue_history(db, job.history_id)
+    db.commit()
+    return "queued"
+
+
+def release_job(db: Session, job_id: int, worker_id: str) -> bool:
+    """停機時交還未完成的任務：回到佇列並保留排程順序，不計入嘗試次數
+
+    History 退回 pending；已寫入的階段結果（快速摘要）保留，重新執行時略過，
+    中斷於摘要階段的重設為 pending 重新產生。
+
+    Returns:
+        是否交還（False 代表租約已失效）
+    """
+    now = datetime.utcnow()
+    job = (
+        db.query(Job)
+        .filter(Job.id == job_id, Job.status == "running", Job.lease_owner == worker_id)
+        .first()
+    )
+    if job is None:
+        return False
+    job.status = "queued"
+    job.attempts = max(job.attempts - 1, 0)
+    job.available_at = now
+    job.lease_owner = None
+    job.lease_expires_at = None
+    job.started_at = None
+    _requeue_history(db, job.history_id)
+    db.commit()
+    return True
+
+
+def _requeue_history(db: Session, history_id: int):
+    """任務回到佇列時，執行中的 History 與摘要階段退回 pending（由呼叫端提交）"""
+    db.execute(
+        update(History)
+        .where(History.id == history_id, History.status == "processing")
+        .values(status="pending")
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        update(History)
+        .where(History.id == history_id, History.summary_status == "processing")
+        .values(summary_status="pending", summary_started_at=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def bury_job(db: Session, job: Job, error: str):
+    """移入 dead（死信），尚未結束的 History 設為 error"""
+    job.status = "dead"
+    job.lease_owner = None
+    job.lease_expires_at = None
+    job.last_error = error
+    job.finished_at = datetime.utcnow()
+    db.execute(
+        update(History)
+        .where(
+            History.id == job.history_id,
+            History.status.in_(["pending", "processing"]),
+        )
+        .values(status="error", interpretation=f"錯誤：AI 解盤任務執行失敗（{error}）")
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    logger.warning(f"任務 {job.id}（History {job.history_id}）已移入 dead：{error}")
+
+
+def history_cancelled(db: Session, history_id: int) -> bool:
+    """紀錄是否已被取消（獨立 worker 行程無法收到 API 行程的 job_registry.cancel）"""
+    status = db.query(History.status).filter(History.id == history_id).scalar()
+    return status == "cancelled"
+
+
+def report_heartbeat(db: Session, fields: dict):
+    """寫入 worker 心跳（不存在時新增）"""
+    db.merge(JobWorker(last_seen_at=datetime.utcnow(), **fields))
+    db.commit()
+
+
+def remove_worker(db: Session, worker_id: str):
+    db.query(JobWorker).filter(JobWorker.id == worker_id).delete()
+    db.commit()
+
+
+def worker_heartbeats(db: Session) -> list[dict]:
+    """各 worker 行程的心跳；超過 3 個心跳間隔未回報即視為失聯"""
+    stale_after = get_settings().JOB_HEARTBEAT_INTERVAL * 3
+    now = datetime.utcnow()
+    result = []
+    for worker in db.query(JobWorker).order_by(JobWorker.started_at).all():
+        age = (now - worker.last_seen_at).total_seconds()
+        result.append(
+            {
+                "id": worker.id,
+                "mode": worker.mode,
+                "concurrency": worker.concurrency,
+                "running": worker.running,
+                "completed": worker.completed,
+                "failed": worker.failed,
+                "started_at": worker.started_at.isoformat(),
+                "last_seen_seconds": round(age, 1),
+                "alive": age <= stale_after,
+            }
+        )
+    return result
+
+
+# ========== 排隊位置與預估開始時間 ==========
+
+
+def _queued_ahead(db: Session, fair_tag: float) -> int:
+    """排在指定 fair_tag 之前的任務數"""
+    return (
+        db.query(func.count(Job.id))
+        .filter(Job.status == "queued", func.coalesce(Job.fair_tag, 0.0) <= fair_tag)
+        .scalar()
+    )
+
+
+def worker_capacity(db: Session) -> int:
+    """存活 worker 的總並行數（沒有心跳紀錄時使用設定值）"""
+    settings = get_settings()
+    alive_since = datetime.utcnow() - timedelta(
+        seconds=settings.JOB_HEARTBEAT_INTERVAL * 3
+    )
+    capacity = (
+        db.query(func.sum(JobWorker.concurrency))
+        .filter(JobWorker.last_seen_at >= alive_since)
+        .scalar()
+    )
+    return capacity or settings.JOB_WORKER_CONCURRENCY
+
+
+def average_job_seconds(db: Session, samples: int = 50) -> float:
+    """最近完成任務的平均執行秒數"""
+    rows = (
+        db.query(Job.started_at, Job.finished_at)
+        .filter(Job.status == "done", Job.started_at.isnot(None))
+        .order_by(Job.finished_at.desc())
+        .limit(samples)
+        .all()
+    )
+    durations = [(finished - started).total_seconds() for started, finished in rows]
+    if not durations:
+        return get_settings().JOB_ESTIMATED_DURATION_SECONDS
+    return sum(durations) / len(durations)
+
+
+class StartEstimator:
+    """依執行中任務數、worker 總並行數與平均執行時間估計排隊任務的開始時間"""
+
+    def __init__(self, db: Session):
+        self.now = datetime.utcnow()
+        self.running = (
+            db.query(func.count(Job.id)).filter(Job.status == "running").scalar()
+        )
+        self.capacity = worker_capacity(db)
+        self.average = average_job_seconds(db)
+
+    def estimate(self, position: int) -> datetime:
+        # 前面還有 running + position - 1 個任務，空出一個 worker 才輪到
+        waiting = max(0, self.running + position - self.capacity)
+        return self.now + timedelta(seconds=waiting / self.capacity * self.average)
+
+
+def refresh_queue_estimates(db: Session) -> int:
+    """依目前排程順序更新所有排隊中任務的位置與預估開始時間，回傳任務數"""
+    queued = (
+        db.query(Job).filter(Job.status == "queued").order_by(*_schedule_order()).all()
+    )
+    if not queued:
+        return 0
+    estimator = StartEstimator(db)
+    for position, job in enumerate(queued, start=1):
+        job.queue_position = position
+        job.estimated_start_at = max(job.available_at, estimator.estimate(position))
+    db.commit()
+    return len(queued)
+
+
+def queue_info(db: Session, history_id: int) -> Optional[dict]:
+    """History 排隊中的任務位置與預估開始時間（未在排隊時為 None）"""
+    job = (
+        db.query(Job)
+        .filter(Job.history_id == history_id, Job.status == "queued")
+        .order_by(Job.id.desc())
+        .first()
+    )
+    if job is None:
+        return None
+    return {
+        "position": job.queue_position,
+        "estimated_start_at": job.estimated_start_at,
+    }
+
+
+def default_handlers() -> dict[str, JobHandler]:
+    """各占卜類型的背景任務（延遲載入，避免與 ai_tasks 循環匯入）"""
+    from app.services.ai_tasks import (
+        process_liuyao_task,
+        process_tarot_task,
+        process_ziwei_task,
+    )
+
+    return {
+        "liuyao": process_liuyao_task,
+        "tarot": process_tarot_task,
+        "ziwei": process_ziwei_task,
+    }
+
+
+class JobWorkerPool:
+    """worker pool：每個 worker 是一個 asyncio task，輪詢領取並執行任務
+
+    可在 API 行程內執行（embedded），或由 `python -m app.worker` 獨立執行（standalone）。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        handlers: Optional[dict[str, JobHandler]] = None,
+    ):
+        self.session_factory = session_factory
+        self.handlers = handlers
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self.mode = "embedded"
+        self.concurrency = 0
+        self._workers: list[asyncio.Task] = []
+        self._reporter: Optional[asyncio.Task] = None
+        self._lost: set[int] = set()
+        self._released: set[int] = set()
+        self._in_flight: dict[int, tuple[str, asyncio.Future]] = {}
+        self._stopping = False
+        self.running: dict[int, int] = {}  # job_id → history_id
+        self.completed = 0
+        self.failed = 0
+        self.lost = 0
+
+    def start(self, concurrency: Optional[int] = None, mode: str = "embedded"):
+        """啟動 worker 與心跳回報（需在 event loop 中呼叫）"""
+        if self._workers:
+            return
+        self._stopping = False
+        self.mode = mode
+        self.concurrency = concurrency or get_settings().JOB_WORKER_CONCURRENCY
+        self._workers = [
+            asyncio.create_task(self._work(f"{self.worker_prefix}:{index}"))
+            for index in range(self.concurrency)
+        ]
+        self._reporter = asyncio.create_task(self._report())
+        logger.info(f"任務 worker 已啟動（{mode}，{self.concurrency} 個）")
+
+    async def stop(self, drain_seconds: Optional[float] = None):
+        """停止 worker
+
+        不再領取新任務，等待執行中的任務完成（最多 drain_seconds 秒，預設
+        JOB_SHUTDOWN_DRAIN_SECONDS）；仍未完成的任務中止後交還佇列，由下一個 worker 接續。
+        排空只是盡力而為：進行中的 AI 呼叫會被中止，接手的 worker 重新呼叫。
+        """
+        if drain_seconds is None:
+            drain_seconds = get_settings().JOB_SHUTDOWN_DRAIN_SECONDS
+        self._stopping = True
+        workers = self._workers
+        if workers:
+            # worker 完成手上的任務（含寫入完成狀態）後即結束，閒置的 worker 在下次輪詢前結束
+            if self._in_flight:
+                logger.info(
+                    f"等待 {len(self._in_flight)} 筆執行中的任務完成（最多 {drain_seconds} 秒）"
+                )
+            timeout = max(drain_seconds, get_settings().JOB_POLL_INTERVAL)
+            await asyncio.wait(workers, timeout=timeout)
+
+        unfinished = {
+            job_id: worker_id
+            for job_id, (worker_id, task) in self._in_flight.items()
+            if not task.done()
+        }
+        self._released.update(unfinished)
+        for job_id in unfinished:
+            self._in_flight[job_id][1].cancel()
+        if workers:
+            await asyncio.wait(workers, timeout=1.0)
+        tasks = [*workers, *([self._reporter] if self._reporter else [])]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._reporter = None
+
+        for job_id, worker_id in unfinished.items():
+            try:
+                await self._db(release_job, job_id, worker_id)
+                logger.info(f"任務 {job_id} 未在停機前完成，已交還佇列")
+            except Exception as e:
+                logger.warning(f"交還任務 {job_id} 失敗，租約到期後重新執行：{e}")
+        self._released.clear()
+        try:
+            await self._db(remove_worker, self.worker_prefix)
+        except Exception as e:
+            logger.warning(f"移除 worker 心跳失敗：{e}")
+
+    async def heartbeat(self):
+        """回報一次心跳"""
+        await self._db(
+            report_heartbeat,
+            {
+                "id": self.worker_prefix,
+                "hostname": socket.gethostname(),
+                "pid": os.getpid(),
+                "mode": self.mode,
+                "concurrency": self.concurrency,
+                "running": len(self.running),
+                "completed": self.completed,
+                "failed": self.failed,
+            },
+        )
+
+    async def _report(self):
+        """定期回報心跳，並更新排隊中任務的位置與預估開始時間"""
+        interval = get_settings().JOB_HEARTBEAT_INTERVAL
+        while True:
+            try:
+                await self.heartbeat()
+                await self._db(refresh_queue_estimates)
+            except Exception as e:
+                logger.warning(f"Worker 心跳回報失敗：{e}")
+            await asyncio.sleep(interval)
+
+    async def _db(self, func: Callable[..., Any], *args) -> Any:
+        """在 thread pool 中以獨立 session 執行佇列操作，不阻塞 event loop"""
+
+        def call():
+            db = self.session_factory()
+            try:
+                return func(db, *args)
+            finally:
+                db.close()
+
+        return await asyncio.to_thread(call)
+
+    async def _work(self, worker_id: str):
+        interval = get_settings().JOB_POLL_INTERVAL
+        while not self._stopping:
+            try:
+                ran = await self.run_once(worker_id)
+            except Exception as e:
+                logger.warning(f"Worker {worker_id} 執行失敗：{e}")
+                ran = False
+            if not ran:
+                await asyncio.sleep(interval)
+
+    async def run_once(self, worker_id: str) -> bool:
+        """領取並執行一筆任務，沒有任務時回傳 False"""
+        job = await self._db(claim_job, worker_id)
+        if job is None:
+            return False
+        await self._execute(job, worker_id)
+        return True
+
+    async def _execute(self, job: Job, worker_id: str):
+        handlers = self.handlers if self.handlers is not None else default_handlers()
+        handler = handlers.get(job.kind)
+        if handler is None:
+            await self._db(self._bury_unknown, job.id)
+            return
+
+        task = asyncio.ensure_future(
+            handler(job.history_id, get_settings().DATABASE_URL)
+        )
+        watcher = asyncio.create_task(
+            self._watch(job.id, job.history_id, worker_id, task)
+        )
+        self.running[job.id] = job.history_id
+        self._in_flight[job.id] = (worker_id, task)
+        try:
+            await task
+        except asyncio.CancelledError:
+            # 租約失效或停機交還而被中止的任務不影響 worker
+            interrupted = job.id in self._lost or job.id in self._released
+            if not interrupted or _cancelling(asyncio.current_task()):
+                raise
+        except Exception as e:
+            if job.id not in self._lost and job.id not in self._released:
+                self.failed += 1
+                logger.warning(f"任務 {job.id} 執行失敗：{e}")
+                await self._db(fail_job, job.id, worker_id, f"{type(e).__name__}: {e}")
+        else:
+            # 租約已被其他 worker 接手或停機交還時，交給下一個 worker 處理
+            if job.id not in self._lost and job.id not in self._released:
+                self.completed += 1
+                await self._db(complete_job, job.id, worker_id)
+        finally:
+            watcher.cancel()
+            self.running.pop(job.id, None)
+            self._in_flight.pop(job.id, None)
+            self._lost.discard(job.id)
+
+    async def _watch(
+        self, job_id: int, history_id: int, worker_id: str, task: asyncio.Future
+    ):
+        """執行期間定期續約並檢查紀錄是否已取消
+
+        租約已失效時停止執行，避免與接手的 worker 重複寫入；
+        紀錄已取消時（取消 API 可能在其他行程）透過 job_registry 停止 AI 呼叫。
+        """
+        settings = get_settings()
+        interval = min(
+            settings.JOB_CANCEL_CHECK_INTERVAL, settings.JOB_LEASE_SECONDS / 3
+        )
+        renew_every = settings.JOB_LEASE_SECONDS / 3
+        loop = asyncio.get_running_loop()
+        renewed_at = loop.time()
+        while not task.done():
+            await asyncio.sleep(interval)
+            try:
+                if await self._db(history_cancelled, history_id):
+                    job_registry.cancel(history_id)
+                if loop.time() - renewed_at < renew_every:
+                    continue
+                held = await self._db(extend_lease, job_id, worker_id)
+                renewed_at = loop.time()
+            except Exception as e:
+                logger.warning(f"任務 {job_id} 續約失敗：{e}")
+                continue
+            if not held:
+                logger.warning(f"任務 {job_id} 的租約已失效，停止執行")
+                self._lost.add(job_id)
+                self.lost += 1
+                task.cancel()
+                return
+
+    @staticmethod
+    def _bury_unknown(db: Session, job_id: int):
+        job = db.get(Job, job_id)
+        bury_job(db, job, f"不支援的占卜類型: {job.kind}")
+
+    def stats(self) -> dict:
+        return {
+            "id": self.worker_prefix,
+            "mode": self.mode,
+            "workers": len(self._workers),
+            "running": dict(self.running),
+            "completed": self.completed,
+            "failed": self.failed,
+            "lost_leases": self.lost,
+        }
+
+
+# 全局任務 worker pool
+job_workers = JobWorkerPool()
+
+
+def queue_stats(db: Session, dead_limit: int = 20) -> dict:
+    """佇列狀態：各狀態任務數、最久排隊秒數、最近的死信任務、各 worker 行程心跳"""
+    counts = dict(db.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+    queued_by_priority = dict(
+        db.query(Job.priority, func.count(Job.id))
+        .filter(Job.status == "queued")
+        .group_by(Job.priority)
+        .all()
+    )
+    oldest = (
+        db.query(func.min(Job.available_at)).filter(Job.status == "queued").scalar()
+    )
+    dead = (
+        db.query(Job)
+        .filter(Job.status == "dead")
+        .order_by(Job.finished_at.desc())
+        .limit(dead_limit)
+        .all()
+    )
+    return {
+        "counts": {status: counts.get(status, 0) for status in JOB_STATUSES},
+        "queued_by_priority": {
+            priority or "unknown": count
+            for priority, count in queued_by_priority.items()
+        },
+        "oldest_queued_seconds": (
+            round(max(0.0, (datetime.utcnow() - oldest).total_seconds()), 1)
+            if oldest
+            else None
+        ),
+        "dead": [
+            {
+                "id": job.id,
+                "history_id": job.history_id,
+                "kind": job.kind,
+                "attempts": job.attempts,
+                "last_error": job.last_error,
+                "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+            }
+            for job in dead
+        ],
+        "workers": worker_heartbeats(db),
+        "local": job_workers.stats(),
+    }
@@ -0,0 +1,196 @@
+"""
+卡住任務清理模組
+
+行程在生成途中重新啟動時，History 會一直停在 pending / processing：前端持續輪詢，
+重試 API 也拒絕 processing 的紀錄。清理器在啟動時與每隔 SWEEPER_INTERVAL_SECONDS 秒執行一次：
+
+以單一查詢（走 history 的 (status, updated_at) 索引）取出一批超過 SWEEPER_STALE_SECONDS
+未更新、且沒有排隊中任務或存活 worker 的紀錄，每批最多 SWEEPER_BATCH_SIZE 筆：
+- 已超過任務期限：設為 timeout，殘留的任務移入 dead
+- 尚未超過期限：重新加入任務佇列
+同時刪除逾期的冪等鍵。
+
+API 與每個 worker 行程都會執行清理器。每筆紀錄先以條件式 UPDATE 認領（狀態與 updated_at
+仍為查詢時的值才推進），多個行程同時清理時只有一個會處理，其餘的略過。
+"""
+
+import asyncio
+import logging
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import and_, exists, or_, update
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.core.database import SessionLocal
+from app.models.history import History
+from app.models.job import Job
+from app.services.idempotency import purge_expired
+from app.services.job_queue import ACTIVE_STATUSES, enqueue_job
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_MESSAGE = "錯誤：AI 解盤超過時間限制（服務中斷後未完成），請重新解盤"
+
+
+@dataclass
+class SweepResult:
+    scanned: int = 0
+    requeued: int = 0
+    timed_out: int = 0
+    purged_keys: int = 0
+
+
+def find_stale(db: Session, now: datetime, limit: int) -> list[History]:
+    """一批卡住的紀錄：pending / processing、太久沒有更新，且沒有排隊中或租約有效的任務"""
+    settings = get_settings()
+    alive_job = exists().where(
+        Job.history_id == History.id,
+        or_(
+            Job.status == "queued",
+            and_(Job.status == "running", Job.lease_expires_at >= now),
+        ),
+    )
+    return (
+        db.query(History)
+        .filter(
+            History.status.in_(["pending", "processing"]),
+            History.updated_at
+            < now - timedelta(seconds=settings.SWEEPER_STALE_SECONDS),
+            ~alive_job,
+        )
+        .order_by(History.updated_at)
+        .limit(limit)
+        .all()
+    )
+
+
+def deadline_of(history: History) -> datetime:
+    """任務期限（舊資料沒有 deadline_at 時以最後更新時間起算）"""
+    if history.deadline_at is not None:
+        return history.deadline_at
+    timeout = get_settings().AI_JOB_TIMEOUT_SECONDS
+    return history.updated_at + timedelta(seconds=timeout)
+
+
+def claim_stale(db: Session, history: History, now: datetime, **values) -> bool:
+    """認領卡住的紀錄：自查詢後未被其他行程或 worker 更新過才寫入 values 並推進 updated_at"""
+    claimed = db.execute(
+        update(History)
+        .where(
+            History.id == history.id,
+            History.status == history.status,
+            History.updated_at == history.updated_at,
+        )
+        .values(updated_at=now, **values)
+        .execution_options(synchronize_session=False)
+    )
+    return claimed.rowcount == 1
+
+
+def sweep(db: Session, limit: Optional[int] = None) -> SweepResult:
+    """清理一批卡住的紀錄"""
+    now = datetime.utcnow()
+    limit = limit or get_settings().SWEEPER_BATCH_SIZE
+    result = SweepResult()
+
+    for history in find_stale(db, now, limit):
+        result.scanned += 1
+        if deadline_of(history) > now:
+            # 期限內但沒有任務（任務遺失）：重新加入佇列；租約逾期的任務留給 worker 重新領取
+            has_job = (
+                db.query(Job.id)
+                .filter(Job.history_id == history.id, Job.status.in_(ACTIVE_STATUSES))
+                .first()
+            )
+            if has_job is None and claim_stale(db, history, now):
+                enqueue_job(db, history)
+                result.requeued += 1
+            continue
+
+        if claim_stale(
+            db, history, now, status="timeout", interpretation=TIMEOUT_MESSAGE
+        ):
+            result.timed_out += 1
+            db.execute(
+                update(Job)
+                .where(Job.history_id == history.id, Job.status.in_(ACTIVE_STATUSES))
+                .values(
+                    status="dead",
+                    lease_owner=None,
+                    lease_expires_at=None,
+                    last_error="任務已逾時",
+                    finished_at=now,
+                )
+                .execution_options(synchronize_session=False)
+            )
+    db.commit()
+
+    result.purged_keys = purge_expired(db, limit)
+    if result.requeued or result.timed_out:
+        logger.info(
+            f"清理卡住的任務：重新排入 {result.requeued} 筆，逾時 {result.timed_out} 筆"
+        )
+    return result
+
+
+class StaleJobSweeper:
+    """定期執行 sweep（在 thread pool 中，不阻塞 event loop）"""
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self.session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_result: Optional[SweepResult] = None
+        self.totals = SweepResult()
+
+    def run_once(self) -> SweepResult:
+        db = self.session_factory()
+        try:
+            result = sweep(db)
+        finally:
+            db.close()
+        self.runs += 1
+        self.last_run_at = datetime.utcnow()
+        self.last_result = result
+        for field, value in asdict(result).items():
+            setattr(self.totals, field, getattr(self.totals, field) + value)
+        return result
+
+    def start(self):
+        """啟動時立即清理一次，之後定期執行（需在 event loop 中呼叫）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"清理卡住的任務失敗：{e}")
+            await asyncio.sleep(get_settings().SWEEPER_INTERVAL_SECONDS)
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last": asdict(self.last_result) if self.last_result else None,
+            "totals": asdict(self.totals),
+        }
+
+
+# 全局卡住任務清理器
+stale_job_sweeper = StaleJobSweeper()
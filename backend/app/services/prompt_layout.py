@@ -0,0 +1,34 @@
+"""
+Prompt 組裝模組
+
+AI 服務的 prompt 快取（Gemini context caching、OpenAI / DeepSeek prompt caching）
+只對「完全相同的開頭」生效。因此所有解盤 prompt 都組成：
+- 靜態前綴：system prompt 與規範，不含任何使用者資料，位元組穩定
+- 動態後綴：命盤、使用者資訊、問題等每次不同的內容，放在 user message
+"""
+
+import hashlib
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class PromptLayout:
+    """組裝完成的 prompt"""
+
+    static_prefix: str  # system prompt
+    dynamic_suffix: str  # user message
+
+    @property
+    def prefix_hash(self) -> str:
+        """靜態前綴的雜湊（相同代表可共用 provider 快取）"""
+        return prefix_hash(self.static_prefix)
+
+
+def prefix_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def build_layout(static_parts: list[str], dynamic_suffix: str) -> PromptLayout:
+    """將靜態段落依固定順序接成前綴"""
+    static_prefix = "\n\n".join(part.strip("\n") for part in static_parts if part)
+    return PromptLayout(static_prefix=static_prefix, dynamic_suffix=dynamic_suffix)
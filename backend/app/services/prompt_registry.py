@@ -0,0 +1,168 @@
+"""
+Prompt 註冊表模組
+
+啟動時一次載入 backend/prompts/ 下所有 Markdown 模板並預先編譯：
+1. 模板切成「文字 / {{欄位}}」片段，渲染時單次掃描代入（代入值中的 {{...}} 不會再被取代）
+2. 每個模板以內容雜湊作為版本，寫入 History 供快取 key 與 A/B 分析
+3. 取用時依檔案 mtime 檢查是否需要重新載入（熱更新，不需重啟服務）
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import BASE_DIR
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = re.compile(r"\{\{([^{}]+)\}\}")
+
+
+class CompiledTemplate:
+    """預先切好片段的模板"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        # (是否為欄位, 文字或欄位名稱)
+        self._segments: list[tuple[bool, str]] = []
+        self.fields: list[str] = []
+
+        position = 0
+        for match in _PLACEHOLDER.finditer(text):
+            if match.start() > position:
+                self._segments.append((False, text[position : match.start()]))
+            name = match.group(1).strip()
+            self._segments.append((True, name))
+            if name not in self.fields:
+                self.fields.append(name)
+            position = match.end()
+        if position < len(text):
+            self._segments.append((False, text[position:]))
+
+    def render(self, values: dict[str, str]) -> str:
+        """單次代入所有欄位（未提供的欄位保留原樣）"""
+        return "".join(
+            (values[part] if part in values else f"{{{{{part}}}}}")
+            if is_field
+            else part
+            for is_field, part in self._segments
+        )
+
+    def split(self, values: dict[str, str]) -> tuple[str, str]:
+        """拆成靜態模板與動態段落
+
+        欄位改為固定的【欄位】標記，實際內容依首次出現的順序放進動態段落，
+        讓 system prompt 不含任何使用者資料（見 prompt_layout）。
+        """
+        static = "".join(
+            f"【{part}】" if is_field else part for is_field, part in self._segments
+        )
+        sections = [f"【{name}】\n{values.get(name, '')}" for name in self.fields]
+        return static, "\n\n".join(sections)
+
+
+class PromptTemplate(CompiledTemplate):
+    """註冊表中的 prompt 檔案"""
+
+    def __init__(self, name: str, path: Path, text: str, mtime: float):
+        super().__init__(text)
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+
+    @property
+    def version_tag(self) -> str:
+        return f"{self.name}@{self.version}"
+
+
+def combine_versions(*templates: Optional[PromptTemplate]) -> str:
+    """組合本次使用的所有模板版本（寫入 History.prompt_version）"""
+    return "+".join(t.version_tag for t in templates if t is not None)
+
+
+class PromptRegistry:
+    """Prompt 模板註冊表"""
+
+    def __init__(self, directory: Path, check_interval: float = 1.0):
+        """
+        Args:
+            directory: 模板目錄（子目錄中的模板名稱為 '子目錄/檔名'）
+            check_interval: 同一模板兩次檢查 mtime 的最短間隔（秒）
+        """
+        self.directory = directory
+        self.check_interval = check_interval
+        self._templates: dict[str, PromptTemplate] = {}
+        self._checked_at: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _path_of(self, name: str) -> Path:
+        return self.directory / f"{name}.md"
+
+    def _load(self, name: str) -> Optional[PromptTemplate]:
+        path = self._path_of(name)
+        try:
+            mtime = path.stat().st_mtime
+            text = path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        template = PromptTemplate(name, path, text, mtime)
+        self._templates[name] = template
+        return template
+
+    def load_all(self) -> int:
+        """載入目錄下所有模板，回傳數量"""
+        with self._lock:
+            for path in sorted(self.directory.rglob("*.md")):
+                name = path.relative_to(self.directory).with_suffix("").as_posix()
+                self._load(name)
+                self._checked_at[name] = time.monotonic()
+            count = len(self._templates)
+        logger.info(f"已載入 {count} 個 prompt 模板")
+        return count
+
+    def find(self, name: str) -> Optional[PromptTemplate]:
+        """取得模板（檔案有更新時重新載入），不存在時回傳 None"""
+        now = time.monotonic()
+        template = self._templates.get(name)
+        if (
+            template is not None
+            and now - self._checked_at.get(name, 0) < self.check_interval
+        ):
+            return template
+
+        with self._lock:
+            self._checked_at[name] = now
+            try:
+                mtime = self._path_of(name).stat().st_mtime
+            except FileNotFoundError:
+                # 檔案被移除時沿用已載入的版本
+                return template
+            if template is None or mtime != template.mtime:
+                previous = template
+                template = self._load(name)
+                if previous is not None and template is not None:
+                    self.reloads += 1
+                    logger.info(
+                        f"Prompt 模板已更新：{previous.version_tag} → {template.version_tag}"
+                    )
+            return template
+
+    def get(self, name: str) -> PromptTemplate:
+        """取得模板，不存在時拋出 FileNotFoundError"""
+        template = self.find(name)
+        if template is None:
+            raise FileNotFoundError(f"找不到 Prompt 檔案：{name}.md")
+        return template
+
+    def versions(self) -> dict[str, str]:
+        return {name: t.version for name, t in sorted(self._templates.items())}
+
+
+# 全局 prompt 註冊表
+prompt_registry = PromptRegistry(Path(BASE_DIR) / "prompts")
@@ -13,7 +13,7 @@ from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 from app.core.config import get_settings
-from app.core.database import get_db
+from app.core.database import get_read_db
 from app.models.user import User
 
 settings = get_settings()
@@ -68,11 +68,11 @@ def decrypt_api_key(encrypted_key: str) -> str:
     return f.decrypt(encrypted_key.encode()).decode()
 
 
-async def get_current_user(
+def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ) -> User:
-    """取得當前用戶 (依賴注入)"""
+    """取得當前用戶 (依賴注入；同步查詢，由 FastAPI 在 thread pool 執行，不阻塞 event loop)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="無效的認證憑證",
@@ -108,9 +108,9 @@ async def get_admin_user(current_user: User = Depends(get_current_user)) -> User
     return current_user
 
 
-async def get_current_user_or_guest(
+def get_current_user_or_guest(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ) -> User:
     """取得當前用戶（包含訪客）"""
-    return await get_current_user(credentials, db)
+    return get_current_user(credentials, db)
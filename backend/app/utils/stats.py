@@ -0,0 +1,12 @@
+"""
+統計工具模組
+"""
+
+from typing import Iterable
+
+
+def percentile(values: Iterable[float], fraction: float) -> float:
+    """最近秩分位數（fraction 介於 0 與 1，例如 0.95 為 p95）；values 不可為空"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
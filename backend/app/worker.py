@@ -0,0 +1,74 @@
+"""
+獨立 AI 任務 worker
+
+只執行任務佇列中的 AI 解盤任務，不處理 HTTP 請求。搭配 JOB_EMBEDDED_WORKERS=false
+讓 API 行程只負責加入佇列，AI 任務量暴增時不會拖慢 API 回應；兩者可各自擴充行程數。
+
+使用方式（在 backend/ 目錄下）：
+    python -m app.worker --concurrency 8
+"""
+
+import argparse
+import asyncio
+import logging
+import signal
+from typing import Optional
+
+from app.core.config import get_settings
+from app.core.database import close_engines, run_migrations
+from app.services.ai_call_log import call_log_writer
+from app.services.job_queue import job_workers
+from app.services.job_sweeper import stale_job_sweeper
+from app.services.prompt_registry import prompt_registry
+
+logger = logging.getLogger(__name__)
+
+
+async def run_worker(concurrency: Optional[int] = None):
+    """啟動 worker pool 與卡住任務清理
+
+    收到 SIGINT / SIGTERM 後停止領取，等待執行中的任務完成（最多 JOB_SHUTDOWN_DRAIN_SECONDS 秒），
+    未完成的任務交還佇列
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows 不支援 add_signal_handler，改由 KeyboardInterrupt 結束
+            pass
+
+    job_workers.start(concurrency, mode="standalone")
+    stale_job_sweeper.start()
+    try:
+        await stop.wait()
+    finally:
+        logger.info("正在停止任務 worker...")
+        await job_workers.stop()
+        await stale_job_sweeper.stop()
+        await call_log_writer.flush_async()
+        await close_engines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI 解盤任務 worker")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=get_settings().JOB_WORKER_CONCURRENCY,
+        help="同時執行的任務數（預設 JOB_WORKER_CONCURRENCY）",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    run_migrations()
+    prompt_registry.load_all()
+    asyncio.run(run_worker(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+資料庫存取對 event loop 的阻塞測試
+
+在暫存 SQLite 資料庫上同時執行多個「建立占卜」工作（寫入 History、加入任務佇列、
+提交、再讀回狀態），比較兩種寫法：
+- sync：在 async 函式中直接使用同步 Session（改版前的路由與背景任務）
+- async：使用 AsyncSession（aiosqlite），查詢等待期間 event loop 可處理其他請求
+
+另一個 task 每隔固定時間醒來，量測實際延遲與預期的差距（event loop 停頓時間）。
+
+使用方式：
+    python scripts/bench_event_loop.py --workers 50 --iterations 20
+"""
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.core.database import (  # noqa: E402
+    Base,
+    create_async_db_engine,
+    create_db_engine,
+)
+from app.models import History, User  # noqa: E402
+from app.services.job_queue import enqueue_job  # noqa: E402
+from app.utils.stats import percentile  # noqa: E402
+
+PROBE_INTERVAL = 0.005  # 量測間隔（秒）
+
+
+def divination(db, user_id: int, index: int) -> int:
+    """一次建立占卜的資料庫操作，回傳 history id"""
+    history = History(
+        user_id=user_id,
+        divination_type="liuyao",
+        question=f"問題 {index}",
+        chart_data="{}",
+        status="pending",
+    )
+    db.add(history)
+    enqueue_job(db, history)
+    db.commit()
+    db.refresh(history)
+    return history.id
+
+
+async def monitor(stalls: list[float], stop: asyncio.Event):
+    """每 PROBE_INTERVAL 秒醒來一次，記錄超出預期的延遲"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(PROBE_INTERVAL)
+        stalls.append(max(0.0, loop.time() - started - PROBE_INTERVAL))
+
+
+async def run_sync(url: str, workers: int, iterations: int) -> None:
+    engine = create_db_engine(url)
+    factory = sessionmaker(bind=engine, autoflush=False)
+
+    async def worker(index: int):
+        for iteration in range(iterations):
+            db = factory()
+            try:
+                divination(db, 1, index * iterations + iteration)
+            finally:
+                db.close()
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(worker(index) for index in range(workers)))
+    engine.dispose()
+
+
+async def run_async(url: str, workers: int, iterations: int) -> None:
+    engine = create_async_db_engine(url)
+
+    async def worker(index: int):
+        for iteration in range(iterations):
+            async with AsyncSession(engine, autoflush=False) as db:
+                await db.run_sync(divination, 1, index * iterations + iteration)
+
+    await asyncio.gather(*(worker(index) for index in range(workers)))
+    await engine.dispose()
+
+
+async def measure(name: str, runner, url: str, workers: int, iterations: int):
+    stalls: list[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(monitor(stalls, stop))
+    started = time.perf_counter()
+    await runner(url, workers, iterations)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+
+    stalls = stalls or [0.0]
+    print(
+        f"{name:<6} 耗時 {elapsed:6.2f}s  "
+        f"{workers * iterations / elapsed:7.1f} 筆/s  "
+        f"停頓 p50 {percentile(stalls, 0.5) * 1000:7.1f}ms  "
+        f"p99 {percentile(stalls, 0.99) * 1000:7.1f}ms  "
+        f"最大 {max(stalls) * 1000:7.1f}ms  "
+        f"總計 {sum(stalls):6.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="資料庫存取對 event loop 的阻塞測試")
+    parser.add_argument("--workers", type=int, default=50, help="同時執行的工作數")
+    parser.add_argument("--iterations", type=int, default=20, help="每個工作的次數")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{Path(directory) / 'bench.db'}"
+        engine = create_engine(url)
+        Base.metadata.create_all(bind=engine)
+        with sessionmaker(bind=engine)() as db:
+            db.add(User(id=1, username="bench", password_hash="x"))
+            db.commit()
+        engine.dispose()
+
+        print(f"{args.workers} 個工作 × {args.iterations} 次")
+        asyncio.run(measure("sync", run_sync, url, args.workers, args.iterations))
+        asyncio.run(measure("async", run_async, url, args.workers, args.iterations))
+
+
+if __name__ == "__main__":
+    main()
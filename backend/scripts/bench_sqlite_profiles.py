@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+SQLite 設定檔效能比較
+
+在暫存資料庫上以接近實際的混合負載比較各 SQLITE_PROFILE：
+- 輪詢執行緒：前端輪詢單筆紀錄狀態、歷史紀錄列表（WAL 設定檔使用唯讀引擎）
+- 寫入執行緒：建立占卜（寫入 History 並加入任務佇列）、領取任務、續約、寫入結果
+
+輸出各設定檔的每秒操作數、讀寫延遲分位數與 `database is locked` 錯誤數。
+
+使用方式：
+    python scripts/bench_sqlite_profiles.py --seconds 10 --readers 8 --writers 4
+    python scripts/bench_sqlite_profiles.py --profiles legacy balanced
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.core.database import (  # noqa: E402
+    SQLITE_PROFILES,
+    Base,
+    checkpoint_wal,
+    create_db_engine,
+    create_read_engine,
+)
+from app.models import History, User  # noqa: E402
+from app.services.job_queue import (  # noqa: E402
+    claim_job,
+    complete_job,
+    enqueue_job,
+    extend_lease,
+)
+
+SEED_HISTORIES = 2000
+
+
+class Recorder:
+    """各類操作的延遲與錯誤數（執行緒安全）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.locked = 0
+        self.errors = 0
+
+    def run(self, kind: str, operation):
+        started = time.perf_counter()
+        try:
+            operation()
+        except OperationalError as e:
+            with self.lock:
+                if "locked" in str(e):
+                    self.locked += 1
+                else:
+                    self.errors += 1
+            return
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies[kind].append(elapsed)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def seed(factory):
+    db = factory()
+    db.add(User(id=1, username="bench", password_hash="x"))
+    db.flush()
+    for index in range(SEED_HISTORIES):
+        db.add(
+            History(
+                user_id=1,
+                divination_type="liuyao",
+                question=f"問題 {index}",
+                chart_data="{}",
+                interpretation="解盤" * 200,
+                status="completed",
+            )
+        )
+    db.commit()
+    db.close()
+
+
+def reader(factory, recorder: Recorder, stop: threading.Event):
+    rng = random.Random()
+
+    def poll_item():
+        db = factory()
+        try:
+            db.get(History, rng.randint(1, SEED_HISTORIES))
+        finally:
+            db.close()
+
+    def list_page():
+        db = factory()
+        try:
+            (
+                db.query(History)
+                .filter(History.user_id == 1)
+                .order_by(History.created_at.desc())
+                .offset(rng.randint(0, 50) * 20)
+                .limit(20)
+                .all()
+            )
+        finally:
+            db.close()
+
+    while not stop.is_set():
+        recorder.run("poll", poll_item)
+        recorder.run("list", list_page)
+
+
+def writer(factory, recorder: Recorder, stop: threading.Event, worker_id: str):
+    def create():
+        db = factory()
+        try:
+            history = History(
+                user_id=1,
+                divination_type="liuyao",
+                question="問題",
+                chart_data="{}",
+                status="pending",
+            )
+            db.add(history)
+            enqueue_job(db, history)
+            db.commit()
+        finally:
+            db.close()
+
+    def process():
+        db = factory()
+        try:
+            job = claim_job(db, worker_id)
+            if job is None:
+                return
+            extend_lease(db, job.id, worker_id)
+            db.query(History).filter(History.id == job.history_id).update(
+                {"status": "completed", "interpretation": "解盤" * 200}
+            )
+            db.commit()
+            complete_job(db, job.id, worker_id)
+        finally:
+            db.close()
+
+    while not stop.is_set():
+        recorder.run("create", create)
+        recorder.run("process", process)
+
+
+def bench(profile: str, seconds: float, readers: int, writers: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{Path(directory) / 'bench.db'}"
+        engine = create_db_engine(url, profile)
+        Base.metadata.create_all(bind=engine)
+        factory = sessionmaker(bind=engine, autoflush=False)
+        seed(factory)
+        read_engine = create_read_engine(url, profile) or engine
+        read_factory = sessionmaker(bind=read_engine, autoflush=False)
+
+        recorder = Recorder()
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=reader, args=(read_factory, recorder, stop))
+            for _ in range(readers)
+        ] + [
+            threading.Thread(
+                target=writer, args=(factory, recorder, stop, f"bench:{index}")
+            )
+            for index in range(writers)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        if read_engine is not engine:
+            read_engine.dispose()
+        checkpoint_wal(engine)
+        engine.dispose()
+        return {"latencies": recorder.latencies, "locked": recorder.locked}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite 設定檔效能比較")
+    parser.add_argument(
+        "--seconds", type=float, default=10.0, help="每個設定檔的測試秒數"
+    )
+    parser.add_argument("--readers", type=int, default=8, help="輪詢執行緒數")
+    parser.add_argument("--writers", type=int, default=4, help="寫入執行緒數")
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=list(SQLITE_PROFILES),
+        choices=list(SQLITE_PROFILES),
+    )
+    args = parser.parse_args()
+
+    print(
+        f"每個設定檔 {args.seconds:g} 秒，{args.readers} 個輪詢、{args.writers} 個寫入執行緒"
+    )
+    print(
+        f"{'設定檔':<10}{'讀取/s':>9}{'寫入/s':>9}"
+        f"{'讀 p50':>9}{'讀 p99':>9}{'寫 p50':>9}{'寫 p99':>9}{'locked':>8}"
+    )
+    for profile in args.profiles:
+        result = bench(profile, args.seconds, args.readers, args.writers)
+        latencies = result["latencies"]
+        reads = latencies["poll"] + latencies["list"]
+        writes = latencies["create"] + latencies["process"]
+        print(
+            f"{profile:<10}"
+            f"{len(reads) / args.seconds:9.0f}{len(writes) / args.seconds:9.0f}"
+            f"{percentile(reads, 0.5) * 1000:8.1f}ms{percentile(reads, 0.99) * 1000:7.1f}ms"
+            f"{percentile(writes, 0.5) * 1000:7.1f}ms{percentile(writes, 0.99) * 1000:7.1f}ms"
+            f"{result['locked']:8d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+本地假 AI 服務（負載與延遲測試用）
+
+模擬以下協定，不需要真的呼叫付費 AI：
+- OpenAI chat completions：POST /v1/chat/completions（含 SSE 串流與 usage）
+- OpenAI 模型列表：GET /v1/models
+- Gemini：POST /{版本}/models/{模型}:generateContent、:streamGenerateContent（?alt=sse）
+- Ollama 模型列表：GET /api/tags
+
+可設定首個 token 延遲、每秒 token 數、錯誤率與 429 比例；
+相同的模型與訊息永遠產生相同的輸出，錯誤注入也以固定亂數種子決定。
+請求標頭 `X-Fake-Status: 429|500` 可強制單一請求失敗。
+
+使用方式：
+    python scripts/fake_ai_server.py --port 8900 --ttft 1.5 --tps 40 --rate-limit-rate 0.1
+
+並在後端設定 AI_BASE_URL_OVERRIDES 指向此服務，例如：
+    AI_BASE_URL_OVERRIDES='{"opencode": "http://127.0.0.1:8900/v1", "custom": "http://127.0.0.1:8900"}'
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 產生假解盤內容用的詞彙
+VOCABULARY = (
+    "卦象 顯示 目前 運勢 平穩 ， 宜 守 不宜 躁進 。 感情 方面 需要 多 溝通 "
+    "事業 有 貴人 相助 財運 小有 收穫 建議 保持 耐心 時機 尚未 成熟"
+).split() + ["\n\n"]
+MODELS = [
+    "fake-fast",
+    "fake-deep",
+    "deepseek-v4-flash",
+    "gpt-5.1",
+    "gemini-3-flash-preview",
+]
+
+
+@dataclass
+class FakeAIConfig:
+    """假服務行為設定"""
+
+    ttft: float = 0.5  # 首個 token 延遲（秒）
+    tokens_per_second: float = 50.0  # 0 代表不延遲
+    output_tokens: int = 200  # 每次回應的 token 數
+    error_rate: float = 0.0  # 回傳 500 的比例
+    rate_limit_rate: float = 0.0  # 回傳 429 的比例
+    retry_after: int = 1  # 429 回應的 Retry-After 秒數
+    seed: int = 0
+
+
+def estimate_tokens(text: str) -> int:
+    """粗估 token 數：中日韓文字每字約 1 token，其他字元約 4 字元 1 token"""
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def canned_tokens(model: str, prompt: str, count: int) -> list[str]:
+    """依模型與 prompt 產生固定的輸出 token"""
+    digest = hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).digest()
+    rng = random.Random(digest)
+    return [rng.choice(VOCABULARY) for _ in range(count)]
+
+
+class FakeAIServer:
+    """假 AI 服務狀態（設定、錯誤注入亂數與統計）"""
+
+    def __init__(self, config: FakeAIConfig):
+        self.config = config
+        self._rng = random.Random(config.seed)
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def injected_status(self, request: Request) -> Optional[int]:
+        """決定這次請求是否要失敗（回傳 HTTP 狀態碼）"""
+        forced = request.headers.get("x-fake-status")
+        if forced:
+            return int(forced)
+        roll = self._rng.random()
+        if roll < self.config.rate_limit_rate:
+            return 429
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            return 500
+        return None
+
+    def _record_failure(self, status: int):
+        if status == 429:
+            self.rate_limited += 1
+        else:
+            self.errors += 1
+
+    async def tokens(self, model: str, prompt: str) -> AsyncIterator[str]:
+        """依設定的延遲逐一吐出 token"""
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.config.ttft)
+            interval = (
+                1 / self.config.tokens_per_second
+                if self.config.tokens_per_second > 0
+                else 0
+            )
+            for index, token in enumerate(
+                canned_tokens(model, prompt, self.config.output_tokens)
+            ):
+                if index and interval:
+                    await asyncio.sleep(interval)
+                yield token
+        finally:
+            self.in_flight -= 1
+
+    async def text(self, model: str, prompt: str) -> str:
+        return "".join([token async for token in self.tokens(model, prompt)])
+
+    def stats(self) -> dict:
+        return {
+            "config": asdict(self.config),
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+        }
+
+
+def _sse(data: dict | str) -> str:
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    return f"data: {payload}\n\n"
+
+
+def create_app(config: Optional[FakeAIConfig] = None) -> FastAPI:
+    server = FakeAIServer(config or FakeAIConfig())
+    app = FastAPI(title="Fake AI Server")
+    app.state.server = server
+
+    # ========== OpenAI 相容 ==========
+
+    def openai_error(status: int) -> JSONResponse:
+        server._record_failure(status)
+        kind = "rate_limit_error" if status == 429 else "server_error"
+        headers = (
+            {"Retry-After": str(server.config.retry_after)} if status == 429 else {}
+        )
+        return JSONResponse(
+            {"error": {"message": f"fake {kind}", "type": kind, "code": status}},
+            status_code=status,
+            headers=headers,
+        )
+
+    def openai_usage(prompt: str) -> dict:
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = server.config.output_tokens
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        server.requests += 1
+        body = await request.json()
+        status = server.injected_status(request)
+        if status:
+            return openai_error(status)
+
+        model = body.get("model", "fake")
+        prompt = json.dumps(body.get("messages", []), ensure_ascii=False)
+        completion_id = f"chatcmpl-{hashlib.sha1(prompt.encode()).hexdigest()[:12]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            content = await server.text(model, prompt)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": openai_usage(prompt),
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        async def events() -> AsyncIterator[str]:
+            def chunk(delta: dict, finish_reason=None) -> dict:
+                return {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                    ],
+                }
+
+            async for token in server.tokens(model, prompt):
+                yield _sse(chunk({"content": token}))
+            yield _sse(chunk({}, "stop"))
+            if include_usage:
+                yield _sse(
+                    {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [],
+                        "usage": openai_usage(prompt),
+                    }
+                )
+            yield _sse("[DONE]")
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/v1/models")
+    @app.get("/models")
+    async def list_models():
+        return {
+            "object": "list",
+            "data": [
+                {"id": name, "object": "model", "owned_by": "fake"} for name in MODELS
+            ],
+        }
+
+    # ========== Ollama ==========
+
+    @app.get("/api/tags")
+    async def ollama_tags():
+        return {"models": [{"name": name, "model": name} for name in MODELS]}
+
+    # ========== Gemini ==========
+
+    def gemini_error(status: int) -> JSONResponse:
+        server._record_failure(status)
+        state = "RESOURCE_EXHAUSTED" if status == 429 else "INTERNAL"
+        return JSONResponse(
+            {"error": {"code": status, "message": f"fake {state}", "status": state}},
+            status_code=status,
+        )
+
+    def gemini_response(model: str, text: str, prompt: str, final: bool) -> dict:
+        response = {
+            "candidates": [
+                {
+                    "content": {"role": "model", "parts": [{"text": text}]},
+                    "index": 0,
+                    **({"finishReason": "STOP"} if final else {}),
+                }
+            ],
+            "modelVersion": model,
+        }
+        if final:
+            prompt_tokens = estimate_tokens(prompt)
+            response["usageMetadata"] = {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": server.config.output_tokens,
+                "totalTokenCount": prompt_tokens + server.config.output_tokens,
+            }
+        return response
+
+    @app.post("/{version}/models/{target}")
+    async def gemini_generate(version: str, target: str, request: Request):
+        server.requests += 1
+        model, _, action = target.partition(":")
+        body = await request.json()
+        status = server.injected_status(request)
+        if status:
+            return gemini_error(status)
+
+        prompt = json.dumps(
+            [body.get("systemInstruction"), body.get("contents")], ensure_ascii=False
+        )
+        if action == "generateContent":
+            return gemini_response(
+                model, await server.text(model, prompt), prompt, True
+            )
+        if action != "streamGenerateContent":
+            return gemini_error(404)
+
+        async def streamed() -> AsyncIterator[str]:
+            # 逐 token 送出，最後一個 chunk 帶 finishReason 與用量
+            last = None
+            async for token in server.tokens(model, prompt):
+                if last is not None:
+                    yield _sse(gemini_response(model, last, prompt, False))
+                last = token
+            yield _sse(gemini_response(model, last or "", prompt, True))
+
+        return StreamingResponse(streamed(), media_type="text/event-stream")
+
+    @app.post("/{version}/cachedContents")
+    async def gemini_create_cache(version: str, request: Request):
+        body = await request.json()
+        digest = hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()[
+            :12
+        ]
+        return {"name": f"cachedContents/fake-{digest}", "model": body.get("model")}
+
+    # ========== 控制 ==========
+
+    @app.get("/_fake/stats")
+    async def fake_stats():
+        return server.stats()
+
+    @app.put("/_fake/config")
+    async def update_config(request: Request):
+        """執行中調整延遲 / 錯誤率（只更新提供的欄位）"""
+        changes = await request.json()
+        for key, value in changes.items():
+            if hasattr(server.config, key):
+                setattr(server.config, key, type(getattr(server.config, key))(value))
+        return server.stats()
+
+    return app
+
+
+app = create_app()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地假 AI 服務（負載與延遲測試用）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--ttft", type=float, default=0.5, help="首個 token 延遲（秒）")
+    parser.add_argument(
+        "--tps", type=float, default=50.0, help="每秒 token 數（0 為不延遲）"
+    )
+    parser.add_argument("--output-tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="回傳 500 的比例")
+    parser.add_argument(
+        "--rate-limit-rate", type=float, default=0.0, help="回傳 429 的比例"
+    )
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = FakeAIConfig(
+        ttft=args.ttft,
+        tokens_per_second=args.tps,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
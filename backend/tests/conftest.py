@@ -0,0 +1,62 @@
+"""
+共用測試 fixture：含一位使用者與一筆六爻 History (id=1) 的 SQLite 資料庫
+"""
+
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
+from app.models import History, User
+
+
+@pytest.fixture
+def make_history_db(tmp_path):
+    """建立資料庫並寫入使用者與 History id=1，回傳 URL；關鍵字參數覆寫 History 欄位"""
+
+    def make(**fields) -> str:
+        url = f"sqlite:///{tmp_path / 'jobs.db'}"
+        engine = create_engine(url)
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        user = User(username="u", password_hash="x")
+        db.add(user)
+        db.flush()
+        values = {
+            "id": 1,
+            "user_id": user.id,
+            "divination_type": "liuyao",
+            "question": "問題",
+            "chart_data": json.dumps({"formatted": "排盤"}),
+            "status": "pending",
+        }
+        db.add(History(**{**values, **fields}))
+        db.commit()
+        db.close()
+        engine.dispose()
+        return url
+
+    return make
+
+
+@pytest.fixture
+def db_url(make_history_db) -> str:
+    return make_history_db()
+
+
+@pytest.fixture
+def load_history():
+    """讀回 History id=1 的目前狀態"""
+
+    def load(db_url: str) -> History:
+        engine = create_engine(db_url)
+        db = sessionmaker(bind=engine)()
+        try:
+            return db.query(History).filter(History.id == 1).one()
+        finally:
+            db.close()
+            engine.dispose()
+
+    return load
@@ -0,0 +1,130 @@
+"""
+准入控制測試：負載升高時訪客最先被拒絕，被拒絕的請求不排盤、不寫入資料庫
+"""
+
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api import liuyao
+from app.core.database import (
+    Base,
+    get_async_db,
+    get_db,
+    get_job_session_factory,
+    get_read_db,
+)
+from app.models import History, Job, User
+from app.services import admission
+from app.services.admission import AdmissionController, LoadSnapshot, evaluate
+from app.utils.auth import get_current_user_or_guest
+
+
+def load(queued=0, estimated_wait=0.0, limiter_pressure=0.0) -> LoadSnapshot:
+    return LoadSnapshot(
+        queued=queued,
+        running=4,
+        capacity=4,
+        average_job_seconds=30.0,
+        estimated_wait=estimated_wait,
+        limiter_pressure=limiter_pressure,
+        taken_at=0.0,
+    )
+
+
+@pytest.mark.parametrize(
+    "snapshot, reason",
+    [
+        (load(queued=60), "queue_depth"),
+        (load(estimated_wait=120.0), "wait"),
+        (load(limiter_pressure=2.0), "limiter"),
+    ],
+)
+def test_guests_are_shed_before_users(snapshot, reason):
+    guest = evaluate(snapshot, share=0.25)
+    assert not guest.admitted
+    assert guest.reason == reason
+    assert guest.retry_after >= 1
+    assert evaluate(snapshot, share=0.6).admitted
+    assert evaluate(load(), share=0.25).admitted
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'admission.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    db = factory()
+    guest = User(username="guest", password_hash="x", role="guest")
+    db.add(guest)
+    db.flush()
+    # 塞滿佇列：60 筆排隊中的任務超過訪客可用的 200 × 0.25
+    for index in range(60):
+        history = History(
+            user_id=guest.id,
+            divination_type="liuyao",
+            question=f"問題 {index}",
+            chart_data="{}",
+            status="pending",
+        )
+        db.add(history)
+        db.flush()
+        db.add(
+            Job(
+                history_id=history.id,
+                kind="liuyao",
+                status="queued",
+                available_at=datetime.utcnow(),
+            )
+        )
+    db.commit()
+    current_user = SimpleNamespace(id=guest.id, role="guest")
+    db.close()
+
+    def override_db():
+        session = factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    async_factory = get_job_session_factory(str(engine.url))
+
+    async def override_async_db():
+        async with async_factory() as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(liuyao.router)
+    app.dependency_overrides[get_db] = override_db
+    app.dependency_overrides[get_read_db] = override_db
+    app.dependency_overrides[get_async_db] = override_async_db
+    app.dependency_overrides[get_current_user_or_guest] = lambda: current_user
+    monkeypatch.setattr(admission, "admission_controller", AdmissionController())
+    monkeypatch.setattr(
+        liuyao,
+        "perform_divination",
+        lambda **kwargs: pytest.fail("被拒絕的請求不應排盤"),
+    )
+    return TestClient(app), factory
+
+
+def test_overloaded_guest_gets_503_before_chart_computation(client):
+    http, factory = client
+
+    response = http.post("/api/liuyao", json={"question": "今天運勢如何？"})
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert factory().query(History).count() == 60
+    assert admission.admission_controller.stats()["rejected"] == {
+        "guest:queue_depth": 1
+    }
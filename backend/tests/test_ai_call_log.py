@@ -0,0 +1,158 @@
+"""
+AI 呼叫紀錄測試：每次呼叫產生用量紀錄、批次寫入 ai_call_log、統計查詢
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.database import Base
+from app.models import AICallLog, History, User  # noqa: F401 註冊資料表
+from app.services import ai_call_log
+from app.services.ai import AIService
+from app.services.ai_call_log import (
+    AICallUsage,
+    CallLogWriter,
+    call_log_stats,
+    log_calls,
+)
+from app.services.ai_usage import TokenUsage, report_usage
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def writer(session_factory, monkeypatch):
+    writer = CallLogWriter(session_factory)
+    monkeypatch.setattr("app.services.ai.call_log_writer", writer)
+    return writer
+
+
+class UsageService(AIService):
+    provider = "fake"
+    model = "fake-model"
+
+    def __init__(self, error=None):
+        self.error = error
+
+    async def _generate(self, prompt, system_prompt):
+        if self.error:
+            raise self.error
+        report_usage(
+            TokenUsage(
+                prompt_tokens=120,
+                completion_tokens=30,
+                cached_tokens=100,
+                reasoning_tokens=10,
+            )
+        )
+        return "ok"
+
+
+@pytest.mark.asyncio
+async def test_each_call_is_logged_with_usage_and_history(writer, session_factory):
+    service = UsageService()
+    service.mode = "fast"
+    with log_calls(7, "summary"):
+        await service._limited_generate("prompt", "system")
+    with pytest.raises(ValueError):
+        await UsageService(error=ValueError("bad"))._limited_generate("p", "s")
+
+    assert writer.flush() == 2
+    db = session_factory()
+    ok, failed = db.query(AICallLog).order_by(AICallLog.id).all()
+
+    assert (ok.history_id, ok.stage, ok.mode, ok.status) == (
+        7,
+        "summary",
+        "fast",
+        "success",
+    )
+    assert (ok.prompt_tokens, ok.completion_tokens) == (120, 30)
+    assert (ok.cached_tokens, ok.reasoning_tokens) == (100, 10)
+    assert ok.duration >= 0 and ok.ttft is not None
+    assert failed.status == "error" and failed.history_id is None
+    assert writer.stats()["written"] == 2
+
+
+@pytest.mark.asyncio
+async def test_stream_call_is_logged_as_streamed(writer, session_factory):
+    service = UsageService()
+    chunks = [chunk async for chunk in service.generate_stream("prompt", "system")]
+
+    assert chunks == ["ok"]
+    writer.flush()
+    row = session_factory().query(AICallLog).one()
+    assert row.streamed and row.status == "success"
+
+
+def test_writer_drops_when_buffer_full(writer, monkeypatch):
+    monkeypatch.setattr(
+        ai_call_log.get_settings(), "AI_CALL_LOG_MAX_PENDING", 1, raising=False
+    )
+    for _ in range(3):
+        writer.record(
+            AICallUsage(provider="fake", model="m", status="success", duration=1)
+        )
+
+    assert writer.stats()["pending"] == 1
+    assert writer.stats()["dropped"] == 2
+
+
+def test_stats_by_model_and_divination_type(writer, session_factory):
+    db = session_factory()
+    user = User(username="u", password_hash="x")
+    db.add(user)
+    db.flush()
+    histories = [
+        History(user_id=user.id, divination_type=kind, question="q", chart_data="{}")
+        for kind in ("liuyao", "liuyao", "tarot")
+    ]
+    db.add_all(histories)
+    db.commit()
+
+    for index, history in enumerate(histories):
+        writer.record(
+            AICallUsage(
+                provider="opencode",
+                model="m",
+                status="success",
+                streamed=True,
+                ttft=float(index + 1),
+                duration=float(index + 10),
+                prompt_tokens=100,
+                completion_tokens=50,
+                history_id=history.id,
+            )
+        )
+    writer.record(
+        AICallUsage(
+            provider="opencode",
+            model="m",
+            status="error",
+            duration=1,
+            created_at=datetime.utcnow() - timedelta(hours=1),
+        )
+    )
+    writer.flush()
+
+    stats = call_log_stats(db, hours=24)
+    model = stats["models"]["opencode/m"]
+    assert (model["calls"], model["errors"]) == (4, 1)
+    assert model["ttft"] == {"p50": 2.0, "p95": 3.0}
+    assert model["duration"]["p95"] == 12.0
+    assert stats["divination_types"]["liuyao"]["jobs"] == 2
+    assert stats["divination_types"]["liuyao"]["prompt_tokens"] == 200
+    assert stats["divination_types"]["tarot"]["avg_tokens_per_job"] == 150
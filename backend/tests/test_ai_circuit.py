@@ -0,0 +1,202 @@
+"""
+AI 斷路器測試：狀態轉換，以及 resolve_ai_config 的容錯切換
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.user import User
+from app.services.ai import AIService, credential_fingerprint
+from app.services.ai_circuit import (
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitRegistry,
+    CircuitState,
+)
+from app.services.ai_retry import AIErrorKind, AIServiceError
+from app.services.ai_tasks import resolve_ai_config
+
+
+def trip(breaker: CircuitBreaker):
+    for _ in range(breaker.min_calls):
+        breaker.record_failure("server_error")
+
+
+def test_breaker_opens_on_failure_rate_and_recovers_after_probe():
+    """失敗率過高跳脫，冷卻後探測成功即恢復"""
+    breaker = CircuitBreaker("test", min_calls=4, open_seconds=0)
+    breaker.record_success()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.trips == 1
+
+    # open_seconds=0：立即進入 half_open，只放行一個探測
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.recoveries == 1
+
+
+def test_breaker_rejects_while_open_and_reopens_on_failed_probe():
+    """open 期間拒絕呼叫；探測失敗重新跳脫"""
+    breaker = CircuitBreaker("test", min_calls=2, open_seconds=60)
+    trip(breaker)
+    assert not breaker.allow_request()
+    assert breaker.rejected == 1
+
+    breaker.open_seconds = 0
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.trips == 2
+
+
+class ProbeService(AIService):
+    provider = "probe"
+    model = "probe-model"
+
+    def __init__(self, breaker, behaviour):
+        self.api_key = None
+        self.breaker = breaker
+        self.behaviour = behaviour
+
+    @property
+    def circuit(self):
+        return self.breaker
+
+    async def _generate(self, prompt, system_prompt):
+        return await self.behaviour()
+
+
+@pytest.fixture
+def half_open(monkeypatch):
+    monkeypatch.setattr(
+        "app.services.ai.call_log_writer", SimpleNamespace(record=lambda usage: None)
+    )
+    breaker = CircuitBreaker("probe", min_calls=2, open_seconds=0)
+    trip(breaker)
+    assert breaker.current_state() == CircuitState.HALF_OPEN
+    return breaker
+
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_releases_slot(half_open):
+    """探測被取消（使用者取消、對沖落敗、期限到）不算結果，下一個請求可重新探測"""
+    started = asyncio.Event()
+
+    async def hang():
+        started.set()
+        await asyncio.sleep(60)
+
+    probe = asyncio.create_task(
+        ProbeService(half_open, hang)._limited_generate("p", "s")
+    )
+    await started.wait()
+    assert not half_open.allow_request()
+
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    assert half_open.state == CircuitState.HALF_OPEN
+    assert half_open.allow_request()
+
+
+@pytest.mark.asyncio
+async def test_non_retryable_probe_error_releases_slot(half_open):
+    """探測遇到金鑰無效等用戶端錯誤無法判斷服務狀態：歸還名額，不恢復也不重新跳脫"""
+
+    async def unauthorized():
+        raise AIServiceError("401", AIErrorKind.CLIENT_ERROR, status_code=401)
+
+    with pytest.raises(AIServiceError):
+        await ProbeService(half_open, unauthorized)._limited_generate("p", "s")
+
+    assert half_open.state == CircuitState.HALF_OPEN
+    assert half_open.trips == 1
+    assert half_open.allow_request()
+
+
+class FakeDB:
+    """query(User) → user，query(AIConfig) → active_config / fallback_config"""
+
+    def __init__(self, user, active_config, fallback_config=None):
+        self._user = user
+        self._configs = [active_config, fallback_config]
+        self._model = None
+
+    def query(self, model):
+        self._model = model
+        return self
+
+    def filter(self, *_args, **_kwargs):
+        return self
+
+    def first(self):
+        if self._model is User:
+            return self._user
+        return self._configs.pop(0) if self._configs else None
+
+
+DEAD_CONFIG = SimpleNamespace(
+    provider="local",
+    local_url="http://dead.local",
+    effective_model="m",
+    api_key_encrypted=None,
+)
+
+
+class FakeDefaultConfig:
+    provider = "opencode"
+    local_url = None
+    effective_model = "deepseek-v4-flash"
+    _api_key = "test-key"
+
+
+@pytest.fixture
+def circuits(monkeypatch):
+    registry = CircuitRegistry()
+    monkeypatch.setattr("app.services.ai_tasks.ai_circuits", registry)
+    monkeypatch.setattr(
+        "app.services.ai_tasks.get_default_ai_config",
+        lambda db, uid: FakeDefaultConfig(),
+    )
+    trip(registry.get("custom", "http://dead.local", credential_fingerprint(None)))
+    return registry
+
+
+def test_resolve_falls_back_to_default_when_circuit_open(circuits):
+    """斷路器開啟且策略為 fallback 時改用預設服務"""
+    user = SimpleNamespace(ai_failover_policy="fallback", ai_fallback_config_id=None)
+    result = resolve_ai_config(FakeDB(user, DEAD_CONFIG), 1)
+
+    assert result.provider == "opencode"
+
+
+def test_resolve_prefers_configured_fallback(circuits):
+    """優先使用使用者指定的備援設定"""
+    backup = SimpleNamespace(
+        provider="local",
+        local_url="http://backup.local",
+        effective_model="b",
+        api_key_encrypted=None,
+    )
+    user = SimpleNamespace(ai_failover_policy="fallback", ai_fallback_config_id=7)
+    result = resolve_ai_config(FakeDB(user, DEAD_CONFIG, backup), 1)
+
+    assert result is backup
+
+
+def test_resolve_fails_fast_when_policy_requires(circuits):
+    """策略為 fail_fast 時直接失敗"""
+    user = SimpleNamespace(ai_failover_policy="fail_fast", ai_fallback_config_id=None)
+    with pytest.raises(CircuitOpenError):
+        resolve_ai_config(FakeDB(user, DEAD_CONFIG), 1)
@@ -0,0 +1,130 @@
+"""
+AI 對沖請求測試
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.ai import AIService
+from app.services.ai_hedging import TTFTTracker, hedged_generate
+
+
+class StreamService(AIService):
+    """可控制首個 token 時機的假串流服務"""
+
+    model = "fake-model"
+
+    def __init__(
+        self,
+        provider: str,
+        first_token_delay: float,
+        fail: bool = False,
+        fail_after_first: bool = False,
+    ):
+        self.provider = provider
+        self.first_token_delay = first_token_delay
+        self.fail = fail
+        self.fail_after_first = fail_after_first
+        self.started = False
+        self.cancelled = False
+
+    async def _generate_stream(self, prompt: str, system_prompt: str):
+        self.started = True
+        try:
+            await asyncio.sleep(self.first_token_delay)
+            if self.fail:
+                raise ValueError(f"{self.provider} failed")
+            yield f"{self.provider}:"
+            if self.fail_after_first:
+                await asyncio.sleep(0)
+                raise ValueError(f"{self.provider} failed mid-stream")
+            yield prompt
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_does_not_hedge():
+    """主要服務在延遲內回應時不呼叫備援"""
+    primary = StreamService("primary", 0)
+    secondary = StreamService("secondary", 0)
+
+    result = await hedged_generate(primary, secondary, "q", "sys", delay=0.5)
+
+    assert result.text == "primary:q"
+    assert result.winner == "primary"
+    assert not result.hedged
+    assert not secondary.started
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_loser_cancelled():
+    """主要服務過慢時備援勝出，主要請求被取消"""
+    primary = StreamService("primary", 5)
+    secondary = StreamService("secondary", 0)
+
+    result = await hedged_generate(primary, secondary, "q", "sys", delay=0.01)
+
+    assert result.text == "secondary:q"
+    assert result.winner == "secondary"
+    assert result.hedged
+    assert primary.cancelled
+
+
+@pytest.mark.asyncio
+async def test_primary_failure_starts_secondary_immediately():
+    """主要服務在首個 token 前失敗時立即改用備援"""
+    primary = StreamService("primary", 0, fail=True)
+    secondary = StreamService("secondary", 0)
+
+    result = await hedged_generate(primary, secondary, "q", "sys", delay=10)
+
+    assert result.winner == "secondary"
+
+
+@pytest.mark.asyncio
+async def test_winner_failing_mid_stream_falls_back_to_other_contender():
+    """先吐出首個 token 的一方中途失敗時，仍在執行的另一方完成並勝出"""
+    primary = StreamService("primary", 0.1)
+    secondary = StreamService("secondary", 0, fail_after_first=True)
+
+    result = await hedged_generate(primary, secondary, "q", "sys", delay=0.01)
+
+    assert result.text == "primary:q"
+    assert result.winner == "primary"
+    assert result.hedged
+    assert not primary.cancelled
+
+
+@pytest.mark.asyncio
+async def test_unhedged_winner_failing_mid_stream_starts_secondary():
+    """尚未對沖的主要服務中途失敗時立即改用備援"""
+    primary = StreamService("primary", 0, fail_after_first=True)
+    secondary = StreamService("secondary", 0)
+
+    result = await hedged_generate(primary, secondary, "q", "sys", delay=10)
+
+    assert result.text == "secondary:q"
+    assert result.winner == "secondary"
+
+
+@pytest.mark.asyncio
+async def test_all_contenders_failing_raises():
+    primary = StreamService("primary", 0, fail=True)
+    secondary = StreamService("secondary", 0, fail=True)
+
+    with pytest.raises(ValueError):
+        await hedged_generate(primary, secondary, "q", "sys", delay=10)
+
+
+def test_hedge_delay_uses_clamped_p95():
+    tracker = TTFTTracker(min_samples=3)
+    assert tracker.p95("k") is None
+
+    for ttft in (0.1, 0.2, 0.3, 0.4):
+        tracker.record("k", ttft)
+    assert tracker.p95("k") == 0.4
+    # 低於下限時使用 AI_HEDGE_MIN_DELAY
+    assert tracker.hedge_delay("k") == 2.0
@@ -0,0 +1,73 @@
+"""
+AI 服務並行限制器測試：同時進行數上限、AIMD 調整、token bucket 速率
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.ai_limiter import AdaptiveLimiter, is_overload_error
+
+
+@pytest.mark.asyncio
+async def test_limiter_caps_concurrency():
+    """超過同時進行數的請求必須排隊"""
+    limiter = AdaptiveLimiter("test", max_concurrency=2, rate_per_second=0, burst=10)
+    await limiter.acquire()
+    await limiter.acquire()
+
+    third = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0.01)
+    assert not third.done()
+    assert limiter.waiting == 1
+
+    await limiter.release(latency=1.0)
+    waited = await asyncio.wait_for(third, timeout=1)
+    assert waited > 0
+    assert limiter.in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_overload_halves_limit_and_success_recovers():
+    """429/503 乘法遞減，成功時加法遞增"""
+    limiter = AdaptiveLimiter("test", max_concurrency=8, rate_per_second=0)
+
+    await limiter.acquire()
+    await limiter.release(overloaded=True)
+    assert limiter.limit == 4
+
+    await limiter.acquire()
+    await limiter.release(latency=1.0)
+    assert limiter.limit == pytest.approx(4.25)
+
+
+@pytest.mark.asyncio
+async def test_latency_spike_decreases_limit():
+    """延遲遠高於平均值時視為過載訊號"""
+    limiter = AdaptiveLimiter("test", max_concurrency=4, rate_per_second=0)
+    for _ in range(5):
+        await limiter.acquire()
+        await limiter.release(latency=1.0)
+
+    await limiter.acquire()
+    await limiter.release(latency=10.0)
+    assert limiter.limit == 2
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_spaces_requests():
+    """token 用完後需等待補充"""
+    limiter = AdaptiveLimiter("test", max_concurrency=4, rate_per_second=20, burst=1)
+    assert await limiter.acquire() == pytest.approx(0, abs=0.01)
+    assert await limiter.acquire() >= 0.03
+
+
+def test_is_overload_error_detects_status_codes():
+    """以狀態碼或錯誤訊息判斷過載"""
+
+    class StatusError(Exception):
+        status_code = 429
+
+    assert is_overload_error(StatusError())
+    assert is_overload_error(Exception("503 Service Unavailable"))
+    assert not is_overload_error(ValueError("bad request"))
@@ -0,0 +1,99 @@
+"""
+AI 重試策略測試：錯誤分類、Retry-After、重試預算
+"""
+
+import httpx
+import pytest
+
+from app.services.ai_retry import (
+    AIErrorKind,
+    AIServiceError,
+    RetryPolicy,
+    classify_error,
+    parse_retry_after,
+)
+
+
+def make_status_error(status_code: int, headers: dict | None = None):
+    request = httpx.Request("POST", "http://ai.local/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+class SleepRecorder:
+    def __init__(self):
+        self.delays = []
+
+    async def __call__(self, delay: float):
+        self.delays.append(delay)
+
+
+def test_classify_http_status_errors():
+    """依 HTTP 狀態碼分類"""
+    assert classify_error(make_status_error(429)).kind == AIErrorKind.RATE_LIMITED
+    assert classify_error(make_status_error(502)).kind == AIErrorKind.SERVER_ERROR
+    assert classify_error(make_status_error(401)).kind == AIErrorKind.CLIENT_ERROR
+    assert not classify_error(make_status_error(400)).retryable
+
+
+def test_classify_transport_errors():
+    """逾時與連線錯誤皆可重試"""
+    assert classify_error(httpx.ReadTimeout("slow")).kind == AIErrorKind.TIMEOUT
+    assert classify_error(ConnectionResetError()).kind == AIErrorKind.CONNECTION
+    assert classify_error(Exception("503 UNAVAILABLE")).kind == AIErrorKind.SERVER_ERROR
+
+
+def test_retry_after_header_and_gemini_retry_delay():
+    """讀取 Retry-After 標頭與 Gemini retryDelay"""
+    assert classify_error(make_status_error(429, {"Retry-After": "7"})).retry_after == 7
+    gemini_error = Exception("429 RESOURCE_EXHAUSTED {'retryDelay': '12s'}")
+    assert classify_error(gemini_error).retry_after == 12
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+
+
+@pytest.mark.asyncio
+async def test_policy_retries_transient_errors_then_succeeds():
+    """暫時性錯誤重試後成功，並遵守 Retry-After"""
+    sleep = SleepRecorder()
+    policy = RetryPolicy(max_attempts=4, base_delay=0.1, max_delay=1, sleep=sleep)
+    errors = [make_status_error(503), make_status_error(429, {"Retry-After": "5"})]
+
+    async def flaky():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert await policy.run(flaky, provider="custom") == "ok"
+    assert len(sleep.delays) == 2
+    assert sleep.delays[1] >= 5
+
+
+@pytest.mark.asyncio
+async def test_policy_does_not_retry_client_errors():
+    """4xx 參數錯誤不重試，原樣拋出"""
+    sleep = SleepRecorder()
+    policy = RetryPolicy(sleep=sleep)
+
+    async def bad_request():
+        raise make_status_error(400)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await policy.run(bad_request, provider="custom")
+    assert sleep.delays == []
+
+
+@pytest.mark.asyncio
+async def test_policy_gives_up_when_retry_after_exceeds_budget():
+    """伺服器要求的等待超過預算時立即放棄，回傳友善錯誤"""
+    sleep = SleepRecorder()
+    policy = RetryPolicy(budget_seconds=10, sleep=sleep)
+
+    async def exhausted():
+        raise make_status_error(429, {"Retry-After": "3600"})
+
+    with pytest.raises(AIServiceError) as exc_info:
+        await policy.run(exhausted, provider="gemini")
+
+    assert exc_info.value.kind == AIErrorKind.RATE_LIMITED
+    assert "Gemini" in str(exc_info.value)
+    assert sleep.delays == []
@@ -0,0 +1,106 @@
+"""
+AI 模型路由測試
+"""
+
+from types import SimpleNamespace
+
+from app.services.ai_router import CallRecord, ModelRouter, RouteCandidate
+
+
+def feed(router: ModelRouter, provider: str, model: str, ttft: float, count: int = 5):
+    for _ in range(count):
+        call = CallRecord()
+        call.start -= ttft
+        call.first_token_at = call.start + ttft
+        call.output_tokens = 100
+        router.record_success(provider, model, call, streamed=True)
+
+
+def candidates():
+    return [
+        RouteCandidate(SimpleNamespace(name="fast"), "opencode", "fast", cost=1.0),
+        RouteCandidate(SimpleNamespace(name="cheap"), "opencode", "cheap", cost=0.5),
+    ]
+
+
+def test_unknown_models_prefer_cheapest():
+    """尚無統計時視為符合 SLO，選成本最低者"""
+    router = ModelRouter()
+    decision = router.choose(candidates(), slo_seconds=10)
+
+    assert decision.config.name == "cheap"
+    assert "樣本不足" in decision.reason
+    assert router.decisions[-1]["chosen"] == "opencode/cheap"
+
+
+def test_routes_around_model_exceeding_slo():
+    """成本較低的模型超過 SLO 時改用符合 SLO 的模型，並說明理由"""
+    router = ModelRouter()
+    feed(router, "opencode", "cheap", ttft=30)
+    feed(router, "opencode", "fast", ttft=2)
+
+    decision = router.choose(candidates(), slo_seconds=10)
+
+    assert decision.config.name == "fast"
+    cheap = next(c for c in decision.candidates if c["name"] == "opencode/cheap")
+    assert not cheap["meets_slo"]
+
+
+def feed_non_streamed(router: ModelRouter, model: str, latency: float, count: int = 5):
+    for _ in range(count):
+        call = CallRecord()
+        call.start -= latency
+        call.add_output("解盤" * 100)
+        router.record_success("opencode", model, call)
+
+
+def test_non_streamed_calls_do_not_count_as_ttft():
+    """非串流呼叫的首個輸出時間就是總耗時，計入總延遲與 tokens/sec，不計入 TTFT"""
+    router = ModelRouter()
+    feed_non_streamed(router, "cheap", latency=120)
+
+    summary = router.stats_for("opencode", "cheap").summary()
+    assert summary["samples"] == 5
+    assert summary["ttft_p95"] is None
+    assert summary["latency_p95"] >= 120
+    assert summary["tokens_per_second"] > 0
+
+    # 沒有總延遲目標時不以非串流樣本判斷 SLO
+    decision = router.choose(candidates(), slo_seconds=10)
+    assert decision.config.name == "cheap"
+
+
+def test_routes_around_slow_non_streamed_model():
+    """一般（非串流）呼叫以總延遲判斷 SLO：成本較低但太慢的模型被繞過"""
+    router = ModelRouter()
+    feed_non_streamed(router, "cheap", latency=200)
+    feed_non_streamed(router, "fast", latency=30)
+
+    decision = router.choose(candidates(), slo_seconds=10, latency_slo_seconds=120)
+
+    assert decision.config.name == "fast"
+    assert "總延遲 p95" in decision.reason
+    cheap = next(c for c in decision.candidates if c["name"] == "opencode/cheap")
+    assert not cheap["meets_slo"]
+
+
+def test_all_over_slo_picks_lowest_latency():
+    router = ModelRouter()
+    feed(router, "opencode", "cheap", ttft=40)
+    feed(router, "opencode", "fast", ttft=20)
+
+    decision = router.choose(candidates(), slo_seconds=10)
+
+    assert decision.config.name == "fast"
+    assert "皆超過 SLO" in decision.reason
+
+
+def test_unhealthy_model_is_skipped():
+    """錯誤率過高的模型不被選擇"""
+    router = ModelRouter()
+    for _ in range(5):
+        router.record_failure("opencode", "cheap")
+
+    decision = router.choose(candidates(), slo_seconds=10, max_error_rate=0.5)
+
+    assert decision.config.name == "fast"
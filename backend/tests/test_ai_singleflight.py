@@ -0,0 +1,200 @@
+"""
+AI 請求合併 (Single-flight) 測試
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.ai import AIService
+from app.services.ai_deadline import Deadline, DeadlineExceeded, use_deadline
+from app.services.ai_limiter import LimiterRegistry
+from app.services.ai_singleflight import SingleFlight
+from app.services.ai_usage import TokenUsage, report_usage, track_usage
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiters(monkeypatch):
+    """每個測試使用新的限流器，避免共用的 token bucket 被前面的測試耗盡"""
+    monkeypatch.setattr("app.services.ai.ai_limiters", LimiterRegistry())
+
+
+class SlowService(AIService):
+    """可控制完成時機的假 AI 服務"""
+
+    provider = "fake"
+    model = "fake-model"
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.cancelled = False
+
+    async def _generate(self, prompt: str, system_prompt: str) -> str:
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return f"result:{prompt}"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_share_one_call():
+    """相同請求並行時只呼叫一次 AI 服務"""
+    service = SlowService()
+    first = asyncio.create_task(service.generate("q", "sys"))
+    second = asyncio.create_task(service.generate("q", "sys"))
+    await asyncio.sleep(0)
+
+    service.release.set()
+    assert await first == "result:q"
+    assert await second == "result:q"
+    assert service.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_different_prompts_are_not_merged():
+    """不同 prompt 不可合併"""
+    service = SlowService()
+    service.release.set()
+
+    results = await asyncio.gather(
+        service.generate("a", "sys"), service.generate("b", "sys")
+    )
+
+    assert results == ["result:a", "result:b"]
+    assert service.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_shared_call():
+    """其中一位等待者取消時，其他等待者仍取得結果"""
+    service = SlowService()
+    first = asyncio.create_task(service.generate("q", "sys"))
+    second = asyncio.create_task(service.generate("q", "sys"))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    await asyncio.sleep(0)
+    service.release.set()
+
+    assert await second == "result:q"
+    assert first.cancelled()
+    assert service.cancelled is False
+
+
+@pytest.mark.asyncio
+async def test_last_waiter_cancel_stops_underlying_call():
+    """所有等待者都取消後，底層呼叫也會被取消"""
+    flight = SingleFlight()
+    service = SlowService()
+    waiter = asyncio.create_task(flight.do("k", lambda: service._generate("q", "s")))
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    await asyncio.sleep(0)
+
+    assert service.cancelled is True
+    assert flight.in_flight() == 0
+
+
+def expiring_in(seconds: float) -> Deadline:
+    return Deadline(datetime.utcnow() + timedelta(seconds=seconds))
+
+
+@pytest.mark.asyncio
+async def test_follower_waits_only_until_its_own_deadline():
+    """較早到期的呼叫者以自己的期限放棄等待，共用呼叫繼續為其他呼叫者執行"""
+    service = SlowService()
+    leader = asyncio.create_task(service.generate("q", "sys"))
+    await asyncio.sleep(0)
+
+    with use_deadline(expiring_in(0.05)):
+        with pytest.raises(DeadlineExceeded):
+            await service.generate("q", "sys")
+
+    service.release.set()
+    assert await leader == "result:q"
+    assert service.calls == 1
+    assert service.cancelled is False
+
+
+@pytest.mark.asyncio
+async def test_shared_call_is_not_bound_by_leader_deadline():
+    """發起者超過期限離開時，共用呼叫不因發起者的期限中止"""
+    service = SlowService()
+
+    async def leader():
+        with use_deadline(expiring_in(0.05)):
+            return await service.generate("q", "sys")
+
+    first = asyncio.create_task(leader())
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(service.generate("q", "sys"))
+    with pytest.raises(DeadlineExceeded):
+        await first
+
+    service.release.set()
+    assert await follower == "result:q"
+    assert service.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_each_waiter_is_charged_the_shared_usage():
+    """共用呼叫的用量計入每位呼叫者的任務"""
+
+    class UsageService(SlowService):
+        async def _generate(self, prompt, system_prompt):
+            result = await super()._generate(prompt, system_prompt)
+            report_usage(TokenUsage(prompt_tokens=100, completion_tokens=20))
+            return result
+
+    service = UsageService()
+
+    async def caller():
+        with track_usage() as usage:
+            await service.generate("q", "sys")
+        return usage
+
+    first = asyncio.create_task(caller())
+    second = asyncio.create_task(caller())
+    await asyncio.sleep(0)
+    service.release.set()
+
+    for usage in await asyncio.gather(first, second):
+        assert (usage.prompt_tokens, usage.completion_tokens) == (100, 20)
+    assert service.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_new_caller_does_not_join_cancelled_call():
+    """最後一位等待者離開後，新的相同請求重新發出呼叫，不會拿到別人造成的 CancelledError"""
+    flight = SingleFlight()
+    calls = []
+
+    async def slow_to_cancel():
+        calls.append(1)
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            # 取消後仍需時間清理（例如關閉 HTTP 連線）
+            await asyncio.sleep(0.05)
+            raise
+
+    waiter = asyncio.create_task(flight.do("k", slow_to_cancel))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert flight.in_flight() == 0
+
+    retry = asyncio.create_task(flight.do("k", slow_to_cancel))
+    await asyncio.sleep(0.1)
+    assert not retry.done()
+    assert len(calls) == 2
+    retry.cancel()
@@ -0,0 +1,123 @@
+"""
+假 AI 服務測試：各協定可被既有 AIService 解析、輸出固定、錯誤注入
+"""
+
+import functools
+
+import httpx
+import pytest
+from google import genai
+from openai import AsyncOpenAI
+
+from app.services.ai import CustomAIService, GeminiService, OpenAIService, settings
+from app.services.ai_retry import classify_error
+from app.services.ai_usage import track_usage
+from scripts.fake_ai_server import FakeAIConfig, create_app
+
+
+def fast_config(**kwargs) -> FakeAIConfig:
+    return FakeAIConfig(ttft=0, tokens_per_second=0, output_tokens=20, **kwargs)
+
+
+@pytest.fixture
+def fake_app():
+    return create_app(fast_config())
+
+
+@pytest.fixture
+def patch_httpx(monkeypatch):
+    def apply(app):
+        transport = httpx.ASGITransport(app=app)
+        monkeypatch.setattr(
+            "app.services.ai.httpx.AsyncClient",
+            functools.partial(httpx.AsyncClient, transport=transport),
+        )
+        return transport
+
+    return apply
+
+
+@pytest.mark.asyncio
+async def test_custom_service_stream_matches_generate(fake_app, patch_httpx):
+    """相同 prompt 的串流與一般呼叫得到相同、固定的輸出，且回報用量"""
+    patch_httpx(fake_app)
+    service = CustomAIService("http://fake", "fake-fast")
+
+    with track_usage() as usage:
+        text = await service._limited_generate("問題", "system")
+        chunks = [c async for c in service.generate_stream("問題", "system")]
+
+    assert text and "".join(chunks) == text
+    assert text == await service._limited_generate("問題", "system")
+    assert text != await service._limited_generate("另一個問題", "system")
+    # 串流未要求 stream_options.include_usage，只有一般呼叫回報用量
+    assert usage.completion_tokens == 20 and usage.prompt_tokens > 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_injection_returns_retry_after(patch_httpx):
+    app = create_app(fast_config(rate_limit_rate=1.0, retry_after=3))
+    patch_httpx(app)
+    service = CustomAIService("http://fake-429", "fake-fast")
+
+    with pytest.raises(httpx.HTTPStatusError) as exc_info:
+        await service._limited_generate("問題", "system")
+
+    assert exc_info.value.response.headers["Retry-After"] == "3"
+    assert classify_error(exc_info.value).kind == "rate_limited"
+    assert app.state.server.stats()["rate_limited"] == 1
+
+
+@pytest.mark.asyncio
+async def test_openai_service_uses_base_url_override(fake_app, monkeypatch):
+    monkeypatch.setitem(settings.AI_BASE_URL_OVERRIDES, "openai", "http://fake/v1")
+    service = OpenAIService("test-key", model="gpt-5.1")
+    assert service.endpoint == "http://fake/v1"
+
+    service.client = AsyncOpenAI(
+        api_key="test-key",
+        base_url=service.base_url,
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_app)),
+    )
+    with track_usage() as usage:
+        chunks = [c async for c in service.generate_stream("問題", "system")]
+
+    assert "".join(chunks)
+    assert usage.completion_tokens == 20
+
+
+@pytest.mark.asyncio
+async def test_gemini_protocol(fake_app, monkeypatch):
+    monkeypatch.setitem(settings.AI_BASE_URL_OVERRIDES, "gemini", "http://fake")
+    service = GeminiService("test-key")
+    assert service.endpoint == "http://fake"
+
+    service.client = genai.Client(
+        api_key="test-key",
+        http_options={
+            "api_version": "v1alpha",
+            "base_url": service.base_url,
+            "httpx_async_client": httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=fake_app)
+            ),
+        },
+    )
+    with track_usage() as usage:
+        text = await service._limited_generate("問題", "system")
+        chunks = [c async for c in service.generate_stream("問題", "system")]
+
+    assert text and "".join(chunks) == text
+    assert usage.completion_tokens == 40
+
+
+@pytest.mark.asyncio
+async def test_ollama_tags_for_connection_test(fake_app):
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=fake_app), base_url="http://fake"
+    ) as client:
+        tags = (await client.get("/api/tags")).json()
+        models = (await client.get("/v1/models")).json()
+
+    assert "fake-fast" in [m["name"] for m in tags["models"]]
+    assert "fake-fast" in [m["id"] for m in models["data"]]
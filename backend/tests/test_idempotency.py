@@ -0,0 +1,127 @@
+"""
+冪等鍵測試：重送回傳第一次的結果、不重新排盤也不重複加入任務，並處理同時送達的重複請求
+"""
+
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api import liuyao
+from app.core.database import (
+    Base,
+    get_async_db,
+    get_db,
+    get_job_session_factory,
+    get_read_db,
+)
+from app.models import History, IdempotencyKey, Job, User
+from app.services.idempotency import claim_key
+from app.utils.auth import get_current_user_or_guest
+
+
+@pytest.fixture
+def factory(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'idempotency.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    db = factory()
+    db.add(User(id=1, username="u", password_hash="x", role="user"))
+    db.commit()
+    db.close()
+    return factory
+
+
+@pytest.fixture
+def client(factory, monkeypatch):
+    def override_db():
+        session = factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    async_factory = get_job_session_factory(str(factory.kw["bind"].url))
+
+    async def override_async_db():
+        async with async_factory() as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(liuyao.router)
+    app.dependency_overrides[get_db] = override_db
+    app.dependency_overrides[get_read_db] = override_db
+    app.dependency_overrides[get_async_db] = override_async_db
+    app.dependency_overrides[get_current_user_or_guest] = lambda: SimpleNamespace(
+        id=1, role="user"
+    )
+    calls = []
+
+    def divination(question):
+        calls.append(question)
+        return {"yaogua": [1, 2, 3, 1, 2, 3]}
+
+    monkeypatch.setattr(liuyao, "perform_divination", divination)
+    return SimpleNamespace(http=TestClient(app), calls=calls)
+
+
+def test_retried_post_returns_original_response(client, factory):
+    headers = {"Idempotency-Key": "retry-1"}
+    body = {"question": "今天運勢如何？"}
+
+    first = client.http.post("/api/liuyao", json=body, headers=headers)
+    second = client.http.post("/api/liuyao", json=body, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert client.calls == ["今天運勢如何？"]
+    db = factory()
+    assert db.query(History).count() == 1
+    assert db.query(Job).count() == 1
+    assert db.get(IdempotencyKey, 1).history_id == first.json()["id"]
+
+    # 沒有帶鍵的請求照常建立
+    client.http.post("/api/liuyao", json=body)
+    assert db.query(History).count() == 2
+
+
+def test_key_reused_for_different_request_is_rejected(client):
+    headers = {"Idempotency-Key": "retry-2"}
+    client.http.post("/api/liuyao", json={"question": "問題一"}, headers=headers)
+
+    response = client.http.post(
+        "/api/liuyao", json={"question": "問題二"}, headers=headers
+    )
+
+    assert response.status_code == 422
+    assert client.calls == ["問題一"]
+
+
+def test_failed_request_releases_key(client, factory, monkeypatch):
+    monkeypatch.setattr(liuyao, "perform_divination", lambda question: 1 / 0)
+    headers = {"Idempotency-Key": "retry-3"}
+    body = {"question": "問題"}
+
+    assert (
+        client.http.post("/api/liuyao", json=body, headers=headers).status_code == 500
+    )
+    assert factory().query(IdempotencyKey).count() == 0
+
+
+def test_concurrent_duplicate_gets_conflict(factory):
+    """第一個請求仍在處理中時，同時送達的重複請求不會再建立一次"""
+    first = claim_key(factory(), 1, "same", "liuyao", "digest")
+    assert first.record is not None and first.replay is None
+
+    with pytest.raises(HTTPException) as exc_info:
+        claim_key(factory(), 1, "same", "liuyao", "digest")
+
+    assert exc_info.value.status_code == 409
+    assert exc_info.value.headers["Retry-After"] == "1"
@@ -0,0 +1,97 @@
+"""
+AI 任務取消測試：取消會停止進行中的 AI 呼叫，晚到的結果不會覆蓋 cancelled
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import History
+from app.services import ai_tasks
+from app.services.ai import AIService
+from app.services.ai_jobs import JobRegistry, commit_result, job_registry
+
+
+class BlockingService(AIService):
+    provider = "blocking"
+    model = "m"
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.cancelled = False
+
+    async def _generate(self, prompt, system_prompt):
+        self.started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return "晚到的結果"
+
+
+@pytest.mark.asyncio
+async def test_registry_cancel_stops_job_without_raising():
+    registry = JobRegistry()
+    started = asyncio.Event()
+
+    async def job():
+        started.set()
+        await asyncio.sleep(60)
+
+    runner = asyncio.create_task(registry.run(5, job()))
+    await started.wait()
+
+    assert registry.cancel(5)
+    assert await runner is None
+    assert registry.get(5) is None
+    assert not registry.cancel(5)
+
+
+@pytest.mark.asyncio
+async def test_cancel_propagates_into_provider_call(db_url, load_history, monkeypatch):
+    service = BlockingService()
+    config = SimpleNamespace(provider="blocking", effective_model="m")
+    monkeypatch.setattr(ai_tasks, "resolve_ai_config", lambda *a, **k: config)
+    monkeypatch.setattr(ai_tasks, "build_ai_service", lambda *a, **k: service)
+    monkeypatch.setattr(ai_tasks, "resolve_hedge_config", lambda *a: None)
+
+    runner = asyncio.create_task(ai_tasks.process_liuyao_task(1, db_url))
+    await asyncio.wait_for(service.started.wait(), 5)
+    assert load_history(db_url).status == "processing"
+
+    # 與取消 API 相同：先寫入 cancelled 再取消任務
+    db = sessionmaker(bind=create_engine(db_url))()
+    db.query(History).filter(History.id == 1).update({"status": "cancelled"})
+    db.commit()
+    db.close()
+    assert job_registry.cancel(1)
+    await asyncio.wait_for(runner, 5)
+
+    assert service.cancelled
+    history = load_history(db_url)
+    assert history.status == "cancelled"
+    assert history.interpretation is None
+
+
+def test_late_result_does_not_clobber_cancelled(db_url, load_history):
+    engine = create_engine(db_url)
+    worker_db = sessionmaker(bind=engine)()
+    history = worker_db.query(History).filter(History.id == 1).one()
+
+    api_db = sessionmaker(bind=engine)()
+    api_db.query(History).filter(History.id == 1).update({"status": "cancelled"})
+    api_db.commit()
+    api_db.close()
+
+    history.interpretation = "晚到的結果"
+    history.status = "completed"
+    assert not commit_result(worker_db, history)
+    worker_db.close()
+
+    stored = load_history(db_url)
+    assert stored.status == "cancelled"
+    assert stored.interpretation is None
@@ -0,0 +1,80 @@
+"""
+AI 任務期限測試：各步驟只使用剩餘時間，到期即停止並設為 timeout
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import ai_tasks
+from app.services.ai import AIService, request_timeout
+from app.services.ai_deadline import Deadline, DeadlineExceeded, use_deadline
+from app.services.ai_retry import RetryPolicy
+
+
+class SlowService(AIService):
+    provider = "slow"
+    model = "m"
+
+    def __init__(self):
+        self.cancelled = False
+
+    async def _generate(self, prompt, system_prompt):
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return "太慢的結果"
+
+
+def test_steps_spend_from_remaining_budget():
+    deadline = Deadline(datetime.utcnow() + timedelta(seconds=10))
+
+    assert 9 < deadline.remaining() <= 10
+    assert deadline.cap(300) <= 10
+    with use_deadline(deadline):
+        assert request_timeout() <= 10
+        assert RetryPolicy.from_settings().budget_seconds <= 10
+    assert request_timeout() == 300
+
+    with pytest.raises(DeadlineExceeded):
+        Deadline(datetime.utcnow() - timedelta(seconds=1)).check()
+
+
+@pytest.mark.asyncio
+async def test_expired_job_is_stopped_with_timeout_status(
+    make_history_db, load_history, monkeypatch
+):
+    db_url = make_history_db(deadline_at=datetime.utcnow() + timedelta(seconds=0.3))
+    service = SlowService()
+    config = SimpleNamespace(provider="slow", effective_model="m")
+    monkeypatch.setattr(ai_tasks, "resolve_ai_config", lambda *a, **k: config)
+    monkeypatch.setattr(ai_tasks, "build_ai_service", lambda *a, **k: service)
+    monkeypatch.setattr(ai_tasks, "resolve_hedge_config", lambda *a: None)
+
+    await asyncio.wait_for(ai_tasks.process_liuyao_task(1, db_url), 5)
+
+    assert service.cancelled
+    history = load_history(db_url)
+    assert history.status == "timeout"
+    assert "時間限制" in history.interpretation
+
+
+@pytest.mark.asyncio
+async def test_job_past_deadline_before_start_is_not_run(
+    make_history_db, load_history, monkeypatch
+):
+    """排隊超過期限的任務在選擇 AI 配置時即放棄，不呼叫 AI"""
+    db_url = make_history_db(deadline_at=datetime.utcnow() - timedelta(seconds=1))
+    monkeypatch.setattr(
+        ai_tasks,
+        "build_ai_service",
+        lambda *a, **k: pytest.fail("不應建立 AI 服務"),
+    )
+
+    await ai_tasks.process_liuyao_task(1, db_url)
+
+    assert load_history(db_url).status == "timeout"
@@ -0,0 +1,398 @@
+"""
+任務佇列測試：原子領取、租約逾期重新執行、失敗重試與死信、worker 執行
+"""
+
+import asyncio
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api.history import retry_ai_interpretation
+from app.core.config import get_settings
+from app.core.database import Base
+from app.models import History, Job, User
+from app.services import ai_tasks
+from app.services.ai_jobs import cancellable_job
+from app.services.ai_retry import AIErrorKind, AIServiceError
+from app.services.job_queue import (
+    JobWorkerPool,
+    claim_job,
+    complete_job,
+    enqueue_job,
+    fail_job,
+    queue_stats,
+    refresh_queue_estimates,
+)
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'queue.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    db = factory()
+    user = User(username="u", password_hash="x")
+    db.add(user)
+    db.flush()
+    history = History(
+        id=1,
+        user_id=user.id,
+        divination_type="liuyao",
+        question="問題",
+        chart_data=json.dumps({"formatted": "排盤"}),
+        status="pending",
+    )
+    db.add(history)
+    enqueue_job(db, history)
+    db.commit()
+    db.close()
+    return factory
+
+
+def expire_lease(db, job_id: int):
+    db.query(Job).filter(Job.id == job_id).update(
+        {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}
+    )
+    db.commit()
+
+
+def test_claim_is_exclusive_and_enqueue_is_idempotent(session_factory):
+    db = session_factory()
+    history = db.get(History, 1)
+    assert enqueue_job(db, history).id == 1
+    db.commit()
+    assert db.query(Job).count() == 1
+
+    job = claim_job(db, "worker-a")
+    assert job.status == "running" and job.attempts == 1
+    assert job.lease_owner == "worker-a"
+    assert claim_job(session_factory(), "worker-b") is None
+
+
+def test_expired_lease_is_reclaimed_until_dead_letter(session_factory):
+    """worker 失聯（租約逾期）的任務由其他 worker 重新執行，次數用盡後移入 dead"""
+    db = session_factory()
+    job = claim_job(db, "worker-a")
+    for attempt in range(2, job.max_attempts + 1):
+        expire_lease(db, job.id)
+        job = claim_job(db, f"worker-{attempt}")
+        assert job.attempts == attempt
+
+    expire_lease(db, job.id)
+    assert claim_job(db, "worker-last") is None
+
+    db.expire_all()
+    assert db.get(Job, job.id).status == "dead"
+    history = db.get(History, 1)
+    assert history.status == "error"
+    assert "最大嘗試次數" in history.interpretation
+    stats = queue_stats(db)
+    assert stats["counts"]["dead"] == 1
+    assert stats["dead"][0]["history_id"] == 1
+
+
+def test_failed_job_is_retried_after_delay(session_factory):
+    db = session_factory()
+    job = claim_job(db, "worker-a")
+
+    assert fail_job(db, job.id, "worker-a", "RuntimeError: boom") == "queued"
+    # 延後重試前不可被領取
+    assert claim_job(db, "worker-a") is None
+    db.query(Job).update({"available_at": datetime.utcnow()})
+    db.commit()
+    assert claim_job(db, "worker-a").attempts == 2
+    # 不再持有租約的 worker 不能改變任務狀態
+    assert fail_job(db, job.id, "worker-b", "late") is None
+
+
+def test_retry_waits_for_job_still_running_after_cancel(session_factory):
+    """取消後立即重試：舊任務仍在執行時拒絕，結束後重試建立新的任務"""
+    db = session_factory()
+    job = claim_job(db, "worker-a")
+    db.get(History, 1).status = "cancelled"
+    db.commit()
+    user = SimpleNamespace(id=1)
+
+    with pytest.raises(HTTPException) as error:
+        retry_ai_interpretation(1, current_user=user, db=db, _=None)
+    assert error.value.status_code == 409
+    assert db.get(History, 1).status == "cancelled"
+
+    assert complete_job(db, job.id, "worker-a")
+    retry_ai_interpretation(1, current_user=user, db=db, _=None)
+
+    assert db.get(History, 1).status == "pending"
+    fresh = db.query(Job).filter(Job.status == "queued").one()
+    assert fresh.id != job.id
+    assert claim_job(db, "worker-b").id == fresh.id
+
+
+@pytest.mark.asyncio
+async def test_worker_runs_handler_and_completes_job(session_factory):
+    calls = []
+
+    async def handler(history_id, db_url):
+        calls.append(history_id)
+
+    pool = JobWorkerPool(session_factory, handlers={"liuyao": handler})
+
+    assert await pool.run_once("worker-a")
+    assert not await pool.run_once("worker-a")
+
+    assert calls == [1]
+    db = session_factory()
+    job = db.get(Job, 1)
+    assert job.status == "done" and job.finished_at is not None
+    assert pool.stats()["completed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_worker_requeues_job_when_handler_raises(session_factory):
+    async def handler(history_id, db_url):
+        raise RuntimeError("boom")
+
+    pool = JobWorkerPool(session_factory, handlers={"liuyao": handler})
+    assert await pool.run_once("worker-a")
+
+    job = session_factory().get(Job, 1)
+    assert job.status == "queued"
+    assert job.last_error == "RuntimeError: boom"
+    assert job.available_at > datetime.utcnow()
+
+
+class FailingService:
+    def __init__(self, error):
+        self.error = error
+
+    async def generate(self, prompt, system_prompt):
+        raise self.error
+
+
+def run_liuyao_with(session_factory, monkeypatch, error) -> JobWorkerPool:
+    """以真正的六爻任務執行佇列中的任務，AI 服務固定拋出 error"""
+    db_url = str(session_factory.kw["bind"].url)
+    config = SimpleNamespace(provider="fake", effective_model="m")
+    monkeypatch.setattr(ai_tasks, "resolve_ai_config", lambda *a, **k: config)
+    monkeypatch.setattr(
+        ai_tasks, "build_ai_service", lambda *a, **k: FailingService(error)
+    )
+    monkeypatch.setattr(ai_tasks, "resolve_hedge_config", lambda *a: None)
+
+    async def handler(history_id, _db_url):
+        await ai_tasks.process_liuyao_task(history_id, db_url)
+
+    return JobWorkerPool(session_factory, handlers={"liuyao": handler})
+
+
+@pytest.mark.asyncio
+async def test_retryable_ai_error_is_retried_by_queue(session_factory, monkeypatch):
+    """AI 服務暫時性錯誤交由佇列延後重試，次數用盡後移入 dead 並將 History 設為 error"""
+    error = AIServiceError("⚠️ 服務暫時不可用", AIErrorKind.SERVER_ERROR, 503)
+    pool = run_liuyao_with(session_factory, monkeypatch, error)
+
+    assert await pool.run_once("worker-a")
+    db = session_factory()
+    job = db.get(Job, 1)
+    assert job.status == "queued" and "服務暫時不可用" in job.last_error
+    assert db.get(History, 1).status == "pending"
+
+    for _ in range(job.max_attempts - 1):
+        db.query(Job).update({"available_at": datetime.utcnow()})
+        db.commit()
+        assert await pool.run_once("worker-a")
+    db.expire_all()
+    assert db.get(Job, 1).status == "dead"
+    assert db.get(History, 1).status == "error"
+
+
+@pytest.mark.asyncio
+async def test_non_retryable_ai_error_fails_history_once(session_factory, monkeypatch):
+    """金鑰無效等錯誤重試也不會成功：直接寫入 History 錯誤，任務結束"""
+    error = AIServiceError("⚠️ API 金鑰無效", AIErrorKind.CLIENT_ERROR, 401)
+    pool = run_liuyao_with(session_factory, monkeypatch, error)
+
+    assert await pool.run_once("worker-a")
+    db = session_factory()
+    assert db.get(Job, 1).status == "done"
+    history = db.get(History, 1)
+    assert history.status == "error" and "金鑰無效" in history.interpretation
+
+
+@pytest.mark.asyncio
+async def test_standalone_worker_stops_job_cancelled_elsewhere(
+    session_factory, monkeypatch
+):
+    """取消 API 在其他行程時，worker 從資料庫得知取消並停止 AI 呼叫"""
+    monkeypatch.setattr(get_settings(), "JOB_CANCEL_CHECK_INTERVAL", 0.05)
+    started = asyncio.Event()
+    cancelled = []
+
+    @cancellable_job
+    async def handler(history_id, db_url):
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(history_id)
+            raise
+
+    pool = JobWorkerPool(session_factory, handlers={"liuyao": handler})
+    runner = asyncio.create_task(pool.run_once("worker-a"))
+    await asyncio.wait_for(started.wait(), 5)
+
+    db = session_factory()
+    db.query(History).filter(History.id == 1).update({"status": "cancelled"})
+    db.commit()
+    assert await asyncio.wait_for(runner, 5)
+
+    assert cancelled == [1]
+    db.expire_all()
+    assert db.get(Job, 1).status == "done"
+
+
+@pytest.mark.asyncio
+async def test_worker_heartbeat_is_visible_to_admin(session_factory):
+    pool = JobWorkerPool(session_factory, handlers={})
+    pool.mode, pool.concurrency = "standalone", 8
+    await pool.heartbeat()
+
+    workers = queue_stats(session_factory())["workers"]
+    assert len(workers) == 1
+    assert workers[0]["id"] == pool.worker_prefix
+    assert workers[0]["mode"] == "standalone" and workers[0]["concurrency"] == 8
+    assert workers[0]["alive"]
+
+    await pool.stop()
+    assert queue_stats(session_factory())["workers"] == []
+
+
+@pytest.mark.asyncio
+async def test_shutdown_drains_finished_jobs(session_factory):
+    release = asyncio.Event()
+
+    async def handler(history_id, db_url):
+        await release.wait()
+
+    pool = JobWorkerPool(session_factory, handlers={"liuyao": handler})
+    pool.start(1)
+    while not pool.running:
+        await asyncio.sleep(0.01)
+
+    stopping = asyncio.create_task(pool.stop(drain_seconds=5))
+    await asyncio.sleep(0.05)
+    release.set()
+    await asyncio.wait_for(stopping, 5)
+
+    db = session_factory()
+    assert db.get(Job, 1).status == "done"
+    assert pool.completed == 1
+
+
+@pytest.mark.asyncio
+async def test_shutdown_returns_unfinished_jobs_to_queue(session_factory):
+    @cancellable_job
+    async def handler(history_id, db_url):
+        db = session_factory()
+        db.query(History).filter(History.id == history_id).update(
+            {"status": "processing", "summary_status": "processing"}
+        )
+        db.commit()
+        db.close()
+        await asyncio.sleep(60)
+
+    pool = JobWorkerPool(session_factory, handlers={"liuyao": handler})
+    pool.start(1)
+    while not pool.running:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.1)
+
+    await asyncio.wait_for(pool.stop(drain_seconds=0.1), 5)
+
+    db = session_factory()
+    job = db.get(Job, 1)
+    assert (job.status, job.attempts, job.lease_owner) == ("queued", 0, None)
+    history = db.get(History, 1)
+    assert (history.status, history.summary_status) == ("pending", "pending")
+    assert pool.completed == 0
+    # 下一個 worker 立即可以領取
+    assert claim_job(db, "worker-b").id == 1
+
+
+def add_history(db, role: str, count: int = 1) -> list[Job]:
+    user = db.query(User).filter(User.username == role).first()
+    if user is None:
+        user = User(username=role, password_hash="x", role=role)
+        db.add(user)
+        db.flush()
+    jobs = []
+    for _ in range(count):
+        history = History(
+            user_id=user.id,
+            divination_type="tarot",
+            question="問題",
+            chart_data="{}",
+            status="pending",
+        )
+        db.add(history)
+        jobs.append(enqueue_job(db, history))
+        db.commit()
+    return jobs
+
+
+def test_fair_queuing_interleaves_users_by_weight(session_factory, monkeypatch):
+    """連續送出多筆的使用者不會擋住之後加入的使用者，權重高的等級較快輪到"""
+    monkeypatch.setattr(get_settings(), "JOB_MAX_RUNNING_PER_USER", 10)
+    db = session_factory()
+    db.query(Job).delete()
+    db.commit()
+    spammer = add_history(db, "user", 3)
+    guest = add_history(db, "guest")[0]
+    admin = add_history(db, "admin")[0]
+
+    order = []
+    while (job := claim_job(db, "worker-a")) is not None:
+        order.append(job.id)
+
+    # 權重 admin 4 : user 2 : guest 1
+    assert order == [admin.id, spammer[0].id, spammer[1].id, guest.id, spammer[2].id]
+
+
+def test_per_user_running_cap(session_factory, monkeypatch):
+    monkeypatch.setattr(get_settings(), "JOB_MAX_RUNNING_PER_USER", 1)
+    db = session_factory()
+    db.query(Job).delete()
+    db.commit()
+    jobs = add_history(db, "user", 2)
+    guest = add_history(db, "guest")[0]
+
+    assert claim_job(db, "worker-a").id == jobs[0].id
+    # 同一使用者已有一筆執行中，下一筆輪到其他使用者
+    assert claim_job(db, "worker-b").id == guest.id
+    assert claim_job(db, "worker-c") is None
+
+
+def test_queue_position_and_estimated_start(session_factory, monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "JOB_WORKER_CONCURRENCY", 1)
+    monkeypatch.setattr(settings, "JOB_ESTIMATED_DURATION_SECONDS", 30.0)
+    db = session_factory()
+    first = db.get(Job, 1)
+    assert first.queue_position == 1
+    jobs = add_history(db, "guest", 2)
+    assert [job.queue_position for job in jobs] == [2, 3]
+    assert jobs[1].estimated_start_at - jobs[0].estimated_start_at >= timedelta(
+        seconds=29
+    )
+
+    claim_job(db, "worker-a")
+    assert refresh_queue_estimates(db) == 2
+    db.expire_all()
+    assert [db.get(Job, job.id).queue_position for job in jobs] == [1, 2]
@@ -0,0 +1,61 @@
+"""
+背景任務 session 測試：共用 async 引擎與 PRAGMA 設定，等待 AI 回應期間不占用連線
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import get_job_session_factory
+from app.models import History
+from app.services import ai_tasks
+from app.services.ai import AIService
+
+
+@pytest.fixture
+def db_url(make_history_db):
+    return make_history_db(summary_status="pending")
+
+
+class ProbeService(AIService):
+    """回應前記錄當下借出的連線數"""
+
+    provider = "probe"
+    model = "m"
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.checked_out = []
+
+    async def _generate(self, prompt, system_prompt):
+        await asyncio.sleep(0)
+        self.checked_out.append(self.engine.pool.checkedout())
+        return "解盤"
+
+
+@pytest.mark.asyncio
+async def test_job_sessions_share_engine_with_foreign_keys(db_url):
+    factory = get_job_session_factory(db_url)
+    assert get_job_session_factory(db_url) is factory
+
+    async with factory() as db:
+        assert (await db.execute(text("PRAGMA foreign_keys"))).scalar() == 1
+
+
+@pytest.mark.asyncio
+async def test_connection_is_released_while_waiting_for_ai(db_url, monkeypatch):
+    service = ProbeService(get_job_session_factory(db_url).kw["bind"])
+    config = SimpleNamespace(provider="probe", effective_model="m")
+    monkeypatch.setattr(ai_tasks, "resolve_ai_config", lambda *a, **k: config)
+    monkeypatch.setattr(ai_tasks, "build_ai_service", lambda *a, **k: service)
+    monkeypatch.setattr(ai_tasks, "resolve_hedge_config", lambda *a: None)
+
+    await ai_tasks.process_liuyao_task(1, db_url)
+
+    # 摘要與完整解讀兩次 AI 呼叫期間都沒有借出連線
+    assert service.checked_out == [0, 0]
+    db = sessionmaker(bind=create_engine(db_url))()
+    assert db.get(History, 1).status == "completed"
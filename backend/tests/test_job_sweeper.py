@@ -0,0 +1,141 @@
+"""
+卡住任務清理測試：遺失任務重新排入、超過期限設為 timeout、仍在執行或排隊中的不受影響
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
+from app.models import History, IdempotencyKey, Job, User
+from app.services import job_sweeper
+from app.services.job_queue import claim_job, complete_job, enqueue_job
+from app.services.job_sweeper import StaleJobSweeper, find_stale, sweep
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'sweeper.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    session.add(User(id=1, username="u", password_hash="x"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def add_history(db, status="processing", idle_seconds=600, deadline_in=None) -> History:
+    updated_at = datetime.utcnow() - timedelta(seconds=idle_seconds)
+    history = History(
+        user_id=1,
+        divination_type="liuyao",
+        question="問題",
+        chart_data="{}",
+        status=status,
+        deadline_at=(
+            datetime.utcnow() + timedelta(seconds=deadline_in)
+            if deadline_in is not None
+            else None
+        ),
+        created_at=updated_at,
+        updated_at=updated_at,
+    )
+    db.add(history)
+    db.commit()
+    return history
+
+
+def test_lost_job_within_deadline_is_requeued(db):
+    history = add_history(db, deadline_in=300)
+
+    result = sweep(db)
+
+    assert (result.scanned, result.requeued, result.timed_out) == (1, 1, 0)
+    job = db.query(Job).filter(Job.history_id == history.id).one()
+    assert job.status == "queued"
+    # 已有排隊中的任務，下一輪不再處理
+    assert sweep(db).scanned == 0
+
+
+def test_sweeper_with_outdated_snapshot_does_not_requeue(db, monkeypatch):
+    """另一個行程的清理器已處理、任務也已完成：持有舊查詢結果的清理器認領失敗，不再重複排入"""
+    history = add_history(db, deadline_in=300)
+    other = sessionmaker(bind=db.get_bind(), autoflush=False)()
+    snapshot = find_stale(other, datetime.utcnow(), 10)
+
+    assert sweep(db).requeued == 1
+    job = claim_job(db, "worker-a:1")
+    history.status = "completed"
+    complete_job(db, job.id, "worker-a:1")
+
+    monkeypatch.setattr(job_sweeper, "find_stale", lambda *a: snapshot)
+    result = sweep(other)
+    other.close()
+
+    assert (result.scanned, result.requeued, result.timed_out) == (1, 0, 0)
+    assert db.query(Job).count() == 1
+    db.expire_all()
+    assert history.status == "completed"
+
+
+def test_expired_deadline_marks_timeout_and_buries_job(db):
+    history = add_history(db, deadline_in=-10)
+    enqueue_job(db, history)
+    db.commit()
+    job = claim_job(db, "dead-worker:1")
+    job.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+
+    result = sweep(db)
+
+    assert (result.requeued, result.timed_out) == (0, 1)
+    db.expire_all()
+    assert history.status == "timeout"
+    assert history.interpretation.startswith("錯誤")
+    assert job.status == "dead"
+    assert job.lease_owner is None
+
+
+def test_recent_and_live_jobs_are_left_alone(db):
+    add_history(db, idle_seconds=5)
+    running = add_history(db, deadline_in=-10)
+    enqueue_job(db, running)
+    db.commit()
+    claim_job(db, "live-worker:1")
+    done = add_history(db, status="completed")
+
+    assert sweep(db).scanned == 0
+    assert db.query(History).filter(History.status == "timeout").count() == 0
+    assert done.status == "completed"
+
+
+def test_sweeper_batches_and_purges_expired_keys(db):
+    for _ in range(3):
+        add_history(db, deadline_in=-10)
+    now = datetime.utcnow()
+    db.add(
+        IdempotencyKey(
+            user_id=1,
+            key="old",
+            endpoint="liuyao",
+            request_hash="x",
+            status="completed",
+            created_at=now - timedelta(hours=2),
+            expires_at=now - timedelta(hours=1),
+        )
+    )
+    db.commit()
+
+    assert sweep(db, limit=2).timed_out == 2
+    sweeper = StaleJobSweeper(session_factory=sessionmaker(bind=db.get_bind()))
+    sweeper.run_once()
+
+    stats = sweeper.stats()
+    assert stats["runs"] == 1
+    assert stats["last"]["timed_out"] == 1
+    assert db.query(IdempotencyKey).count() == 0
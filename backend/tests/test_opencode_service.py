@@ -6,6 +6,7 @@ from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
+from app.api.liuyao import LiuYaoRequest
 from app.services.ai import OpenCodeService, get_ai_service
 
 
@@ -32,7 +33,7 @@ async def test_opencode_service_generate_sends_expected_params():
     assert result == "解盤結果"
 
     client_cls.assert_called_once_with(
-        base_url="https://opencode.ai/zen/go/v1", api_key="test-key"
+        base_url="https://opencode.ai/zen/go/v1", api_key="test-key", max_retries=0
     )
 
     create_mock.assert_awaited_once()
@@ -50,3 +51,39 @@ def test_get_ai_service_opencode_provider():
     service = get_ai_service("opencode", api_key="test-key")
     assert isinstance(service, OpenCodeService)
     assert service.model == "deepseek-v4-flash"
+
+
+@pytest.mark.asyncio
+async def test_opencode_service_fast_mode_lowers_reasoning_and_output_cap():
+    """fast 模式以低思考等級與較小輸出上限呼叫"""
+    create_mock = AsyncMock(return_value=FakeOpenAIResponse())
+
+    with patch(
+        "app.services.ai.AsyncOpenAI",
+        return_value=MagicMock(chat=MagicMock(completions=MagicMock(create=create_mock))),
+    ):
+        service = get_ai_service("opencode", mode="fast", api_key="test-key")
+        await service.generate("user prompt", "system prompt")
+
+    call_kwargs = create_mock.await_args.kwargs
+    assert call_kwargs["reasoning_effort"] == "low"
+    assert call_kwargs["max_tokens"] == 4096
+
+
+@pytest.mark.asyncio
+async def test_request_without_mode_keeps_original_params():
+    """前端未傳 mode 時維持各服務原本的參數（與 deep 相同），不會被降為 standard"""
+    request = LiuYaoRequest(question="問題")
+    assert request.mode is None
+
+    create_mock = AsyncMock(return_value=FakeOpenAIResponse())
+    with patch(
+        "app.services.ai.AsyncOpenAI",
+        return_value=MagicMock(chat=MagicMock(completions=MagicMock(create=create_mock))),
+    ):
+        service = get_ai_service("opencode", mode=request.mode, api_key="test-key")
+        await service.generate("user prompt", "system prompt")
+
+    call_kwargs = create_mock.await_args.kwargs
+    assert call_kwargs["reasoning_effort"] == "max"
+    assert call_kwargs["max_tokens"] == 46800
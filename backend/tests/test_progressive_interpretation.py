@@ -0,0 +1,112 @@
+"""
+漸進式解盤測試：先寫入快速摘要，使用者取消時略過完整解讀
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import ai_tasks
+
+
+class FakeDB:
+    """模擬 db：refresh 時套用其他連線寫入的狀態"""
+
+    def __init__(self, status_after_summary=None):
+        self.commits = 0
+        self._status_after_summary = status_after_summary
+
+    async def commit(self):
+        self.commits += 1
+
+    async def refresh(self, history):
+        if self._status_after_summary:
+            history.status = self._status_after_summary
+
+
+class FakeService:
+    def __init__(self, result="", error=None):
+        self.result = result
+        self.error = error
+        self.system_prompts = []
+
+    async def generate(self, prompt, system_prompt):
+        self.system_prompts.append(system_prompt)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def make_history(summary_status="pending"):
+    return SimpleNamespace(
+        id=1,
+        user_id=1,
+        status="processing",
+        mode="standard",
+        summary=None,
+        summary_status=summary_status,
+        summary_started_at=None,
+        summary_completed_at=None,
+        prompt_tokens=None,
+        cached_tokens=None,
+        prompt_version=None,
+    )
+
+
+@pytest.fixture
+def fake_service(monkeypatch):
+    service = FakeService(result="結論：吉")
+    modes = []
+
+    def build(_config, mode=None):
+        modes.append(mode)
+        return service
+
+    monkeypatch.setattr(ai_tasks, "build_ai_service", build)
+    service.modes = modes
+    return service
+
+
+@pytest.mark.asyncio
+async def test_summary_is_persisted_with_fast_mode(fake_service):
+    history = make_history()
+    db = FakeDB()
+
+    should_continue = await ai_tasks.generate_summary(db, history, object(), "q", "sys")
+
+    assert should_continue
+    assert history.summary == "結論：吉"
+    assert history.summary_status == "completed"
+    assert history.summary_started_at and history.summary_completed_at
+    assert fake_service.modes == ["fast"]
+    assert fake_service.system_prompts[0].startswith("sys\n\n")
+    assert db.commits >= 2
+
+
+@pytest.mark.asyncio
+async def test_cancel_after_summary_skips_deep_phase(fake_service):
+    history = make_history()
+    db = FakeDB(status_after_summary="cancelled")
+
+    assert not await ai_tasks.generate_summary(db, history, object(), "q", "sys")
+
+
+@pytest.mark.asyncio
+async def test_summary_failure_still_continues(monkeypatch):
+    monkeypatch.setattr(
+        ai_tasks,
+        "build_ai_service",
+        lambda _c, mode=None: FakeService(error=ValueError("x")),
+    )
+    history = make_history()
+
+    assert await ai_tasks.generate_summary(FakeDB(), history, object(), "q", "sys")
+    assert history.summary_status == "error"
+
+
+@pytest.mark.asyncio
+async def test_non_progressive_history_skips_summary(fake_service):
+    history = make_history(summary_status=None)
+
+    assert await ai_tasks.generate_summary(FakeDB(), history, object(), "q", "sys")
+    assert fake_service.modes == []
@@ -0,0 +1,80 @@
+"""
+Prompt 組裝測試：靜態前綴位元組穩定，並以本地替身伺服器驗證快取命中數的記錄
+"""
+
+import functools
+import os
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+
+from app.services.ai import CustomAIService
+from app.services.ai_usage import track_usage
+from app.services.prompt_layout import build_layout
+from app.services.prompt_registry import CompiledTemplate
+
+TEMPLATE = "你是紫微斗數專家。\n\n## 命盤\n{{完整命盤}}\n\n針對{{問題}}回答。\n\n## 問題\n{{問題}}"
+
+
+def test_split_template_keeps_static_prefix_identical():
+    """不同使用者的命盤只出現在動態段落，靜態前綴完全相同（紫微 system prompt 的拆法）"""
+    template = CompiledTemplate(TEMPLATE)
+    static_a, dynamic_a = template.split({"完整命盤": "A 盤", "問題": "事業？"})
+    static_b, dynamic_b = template.split({"完整命盤": "B 盤", "問題": "感情？"})
+
+    assert static_a == static_b
+    assert "{{" not in static_a and "【問題】" in static_a
+    assert dynamic_a == "【完整命盤】\nA 盤\n\n【問題】\n事業？"
+    assert dynamic_a != dynamic_b
+
+
+def test_build_layout_orders_static_parts():
+    layout = build_layout(["system\n", "", "mode\n"], "dynamic")
+
+    assert layout.static_prefix == "system\n\nmode"
+    assert layout.dynamic_suffix == "dynamic"
+    assert layout.prefix_hash == build_layout(["system", "mode"], "other").prefix_hash
+
+
+def create_stand_in_server() -> FastAPI:
+    """模擬 provider 前綴快取：與上一個請求共同開頭的字元數視為快取命中"""
+    app = FastAPI()
+    state = {"previous": ""}
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        text = "".join(m["content"] for m in body["messages"])
+        cached = len(os.path.commonprefix([text, state["previous"]]))
+        state["previous"] = text
+        return {
+            "choices": [{"message": {"content": "ok"}}],
+            "usage": {
+                "prompt_tokens": len(text),
+                "completion_tokens": 1,
+                "prompt_tokens_details": {"cached_tokens": cached},
+            },
+        }
+
+    return app
+
+
+@pytest.mark.asyncio
+async def test_cached_tokens_recorded_against_stand_in_server(monkeypatch):
+    transport = httpx.ASGITransport(app=create_stand_in_server())
+    monkeypatch.setattr(
+        "app.services.ai.httpx.AsyncClient",
+        functools.partial(httpx.AsyncClient, transport=transport),
+    )
+    service = CustomAIService("http://stand-in", "fake-model")
+
+    static, _ = CompiledTemplate(TEMPLATE).split({})
+    with track_usage() as first:
+        await service._limited_generate("A 盤", static)
+    with track_usage() as second:
+        await service._limited_generate("B 盤", static)
+
+    assert first.cached_tokens == 0
+    assert second.prompt_tokens > 0
+    assert second.cached_tokens >= len(static)
@@ -0,0 +1,67 @@
+"""
+Prompt 註冊表測試：單次代入、版本雜湊與 mtime 熱更新
+"""
+
+import os
+
+from app.services.prompt_registry import (
+    CompiledTemplate,
+    PromptRegistry,
+    combine_versions,
+    prompt_registry,
+)
+
+
+def test_render_substitutes_in_single_pass():
+    """代入值中的 {{...}} 不會再被取代，未提供的欄位保留原樣"""
+    template = CompiledTemplate("問題：{{問題}}\n排盤：{{排盤}}\n{{其他}}")
+
+    rendered = template.render({"問題": "{{排盤}}？", "排盤": "乾卦"})
+
+    assert rendered == "問題：{{排盤}}？\n排盤：乾卦\n{{其他}}"
+    assert template.fields == ["問題", "排盤", "其他"]
+
+
+def test_registry_reloads_when_file_changes(tmp_path):
+    (tmp_path / "user").mkdir()
+    path = tmp_path / "user" / "demo.md"
+    path.write_text("第一版 {{x}}", encoding="utf-8")
+
+    registry = PromptRegistry(tmp_path, check_interval=0)
+    assert registry.load_all() == 1
+    first = registry.get("user/demo")
+    assert first.render({"x": "1"}) == "第一版 1"
+
+    path.write_text("第二版 {{x}}", encoding="utf-8")
+    os.utime(path, (first.mtime + 10, first.mtime + 10))
+    second = registry.get("user/demo")
+
+    assert second.render({"x": "2"}) == "第二版 2"
+    assert second.version != first.version
+    assert registry.reloads == 1
+    assert combine_versions(second, None) == f"user/demo@{second.version}"
+
+
+def test_missing_template_raises(tmp_path):
+    registry = PromptRegistry(tmp_path)
+
+    assert registry.find("nope") is None
+    try:
+        registry.get("nope")
+    except FileNotFoundError as e:
+        assert "nope.md" in str(e)
+    else:
+        raise AssertionError("應拋出 FileNotFoundError")
+
+
+def test_shipped_user_templates_cover_all_fields():
+    """內建的 user prompt 模板都能找到，且所有欄位都有對應的代入值"""
+    expected = {
+        "user/liuyao": {"性別", "對象", "問題", "排盤"},
+        "user/tarot_single": {"question", "card"},
+        "user/tarot_three_card": {"question", "past", "present", "future"},
+        "user/tarot_celtic_cross": {"question", "cards"},
+        "user/ziwei": {"命盤資料", "問題"},
+    }
+    for name, fields in expected.items():
+        assert set(prompt_registry.get(name).fields) == fields
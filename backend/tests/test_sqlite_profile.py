@@ -0,0 +1,153 @@
+"""
+SQLite 設定檔測試：PRAGMA 在每個連線套用、legacy 維持改版前的行為、WAL checkpoint、
+唯讀引擎與單一寫入連線
+"""
+
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import get_settings
+from app.core.database import (
+    Base,
+    checkpoint_wal,
+    create_async_db_engine,
+    create_db_engine,
+    create_read_engine,
+    sqlite_profile,
+)
+from app.models import User
+
+
+def pragma(bind, name):
+    with bind.connect() as connection:
+        return connection.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def count_users(bind):
+    with bind.connect() as connection:
+        return connection.execute(text("SELECT COUNT(*) FROM users")).scalar()
+
+
+def test_balanced_profile_applies_pragmas(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'balanced.db'}", "balanced")
+
+    assert pragma(engine, "journal_mode") == "wal"
+    assert pragma(engine, "synchronous") == 1  # NORMAL
+    assert pragma(engine, "busy_timeout") == 5000
+    assert pragma(engine, "temp_store") == 2  # MEMORY
+    assert pragma(engine, "foreign_keys") == 1
+    # 寫入只經由一條連線，排隊上限與 busy_timeout 相同
+    assert (engine.pool.size(), engine.pool._max_overflow) == (1, 0)
+    assert engine.pool.timeout() == 5
+
+
+def test_legacy_profile_keeps_rollback_journal(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'legacy.db'}", "legacy")
+
+    assert pragma(engine, "journal_mode") == "delete"
+    assert pragma(engine, "foreign_keys") == 1
+    assert engine.pool.size() == 5
+    assert create_read_engine(f"sqlite:///{tmp_path / 'legacy.db'}", "legacy") is None
+    assert create_read_engine("sqlite:///:memory:", "balanced") is None
+
+
+def test_overrides_and_unknown_profile(monkeypatch):
+    monkeypatch.setattr(get_settings(), "SQLITE_PRAGMAS", {"cache_size": -65536})
+    assert sqlite_profile("durable")["pragmas"]["cache_size"] == -65536
+    assert sqlite_profile("durable")["pragmas"]["synchronous"] == "FULL"
+
+    with pytest.raises(ValueError):
+        sqlite_profile("turbo")
+
+
+@pytest.mark.asyncio
+async def test_async_engine_uses_same_profile(tmp_path):
+    engine = create_async_db_engine(f"sqlite:///{tmp_path / 'async.db'}", "balanced")
+    async with engine.connect() as connection:
+        mode = (await connection.execute(text("PRAGMA journal_mode"))).scalar()
+        timeout = (await connection.execute(text("PRAGMA busy_timeout"))).scalar()
+    await engine.dispose()
+
+    assert (mode, timeout) == ("wal", 5000)
+
+
+@pytest.mark.asyncio
+async def test_sync_and_async_writers_do_not_report_locked(tmp_path):
+    """同步與 async 引擎各一條寫入連線同時寫入：寫入鎖由 busy_timeout 等待，不回報 locked"""
+    url = f"sqlite:///{tmp_path / 'writers.db'}"
+    engine = create_db_engine(url, "balanced")
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_db_engine(url, "balanced")
+    assert async_engine.pool.size() == 1
+
+    def sync_writes(prefix):
+        for index in range(50):
+            with engine.begin() as connection:
+                connection.execute(
+                    User.__table__.insert().values(
+                        username=f"{prefix}{index}", password_hash="x"
+                    )
+                )
+
+    async def async_writes():
+        for index in range(50):
+            async with async_engine.begin() as connection:
+                await connection.execute(
+                    User.__table__.insert().values(
+                        username=f"async{index}", password_hash="x"
+                    )
+                )
+
+    await asyncio.gather(
+        asyncio.to_thread(sync_writes, "a"),
+        asyncio.to_thread(sync_writes, "b"),
+        async_writes(),
+    )
+    await async_engine.dispose()
+
+    assert count_users(engine) == 150
+    engine.dispose()
+
+
+def test_readers_are_not_blocked_by_writer_and_checkpoint(tmp_path):
+    url = f"sqlite:///{tmp_path / 'wal.db'}"
+    engine = create_db_engine(url, "balanced")
+    Base.metadata.create_all(bind=engine)
+    read_engine = create_read_engine(url, "balanced")
+
+    with engine.connect() as writer:
+        writer.execute(text("BEGIN IMMEDIATE"))
+        writer.execute(User.__table__.insert().values(username="w", password_hash="x"))
+        # 唯一的寫入連線持有寫入鎖時，其他執行緒仍可從唯讀連線立即讀取已提交的資料
+        counts = []
+        reader = threading.Thread(
+            target=lambda: counts.append(count_users(read_engine))
+        )
+        reader.start()
+        reader.join(timeout=2)
+        assert counts == [0]
+        writer.commit()
+    assert count_users(read_engine) == 1
+
+    read_engine.dispose()
+    busy, wal_pages, checkpointed = checkpoint_wal(engine)
+    assert busy == 0 and wal_pages == checkpointed
+
+
+def test_read_engine_rejects_writes(tmp_path):
+    url = f"sqlite:///{tmp_path / 'read.db'}"
+    Base.metadata.create_all(bind=create_db_engine(url, "balanced"))
+    read_engine = create_read_engine(url, "balanced")
+
+    assert read_engine.pool.size() == 10
+    assert pragma(read_engine, "journal_mode") == "wal"
+    assert pragma(read_engine, "query_only") == 1
+    with pytest.raises(OperationalError, match="readonly"):
+        with read_engine.begin() as connection:
+            connection.execute(
+                User.__table__.insert().values(username="r", password_hash="x")
+            )
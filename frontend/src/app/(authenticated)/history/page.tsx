@@ -626,6 +626,7 @@ export default function HistoryPage() {
       processing: 'warning',
       pending: 'default',
       error: 'error',
+      timeout: 'error',
       cancelled: 'default',
     };
     const labels: Record<string, string> = {
@@ -633,6 +634,7 @@ export default function HistoryPage() {
       processing: '處理中',
       pending: '等待中',
       error: '錯誤',
+      timeout: '逾時',
       cancelled: '已取消',
     };
     return (
@@ -971,8 +973,8 @@ export default function HistoryPage() {
                   <div className="border-t border-border p-4 space-y-4 fade-in">
                     {/* 操作按鈕 */}
                     <div className="flex justify-end gap-3 flex-wrap">
-                      {/* 重試按鈕 (僅在 error 狀態顯示) */}
-                      {item.status === 'error' && (
+                      {/* 重試按鈕 (僅在 error / timeout 狀態顯示) */}
+                      {(item.status === 'error' || item.status === 'timeout') && (
                         <Button
                           onClick={() => handleRetry(item.id)}
                           variant="primary"
@@ -144,7 +144,7 @@ export default function LiuYaoPage() {
           if (data.status === 'completed' && data.interpretation) {
             clearAllTimers();
             setInterpretation(data.interpretation);
-          } else if (data.status === 'error') {
+          } else if (data.status === 'error' || data.status === 'timeout') {
             clearAllTimers();
             setInterpretation(data.interpretation || '解盤發生錯誤');
           } else if (data.status === 'cancelled') {
@@ -322,7 +322,7 @@ export default function TarotPage() {
           setStep('result');
           setLoading(false);
           return;
-        } else if (data.status === 'error') {
+        } else if (data.status === 'error' || data.status === 'timeout') {
           alert('AI 解盤失敗');
           setLoading(false);
           setStep('reveal');
@@ -360,7 +360,7 @@ export default function TarotPage() {
 
             setStep('result');
             setLoading(false);
-          } else if (data.status === 'error') {
+          } else if (data.status === 'error' || data.status === 'timeout') {
             alert('AI 解盤失敗');
             setLoading(false);
             setStep('reveal');
@@ -406,7 +406,7 @@ export default function ZiweiPage() {
             clearInterval(waitingTimer);
             setInterpretation(data.interpretation);
             setIsProcessing(false);
-          } else if (data.status === 'error') {
+          } else if (data.status === 'error' || data.status === 'timeout') {
             clearInterval(pollInterval);
             clearInterval(waitingTimer);
             setInterpretation(data.interpretation || '解盤發生錯誤');